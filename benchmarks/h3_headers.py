@@ -0,0 +1,118 @@
+"""
+Micro-benchmark for HTTP/3 request header encoding.
+
+Compares the original per-request header construction with the cached
+`header_block` used by `HttpClient._request`, reporting time per request
+and bytes allocated per request (tracemalloc).
+
+    python -m benchmarks.h3_headers [-n 100000]
+"""
+import argparse
+import gc
+import itertools
+import timeit
+import tracemalloc
+
+from http3_helper.aioquic import USER_AGENT, URL, HttpRequest, header_block, static_headers
+
+REQUESTS = [
+    HttpRequest("GET", URL("https://nacos.local:8848/nacos/v1/cs/configs?dataId=redis&group=DEFAULT_GROUP")),
+    HttpRequest("GET", URL("https://nacos.local:8848/nacos/v1/ns/instance/list?serviceName=test-platform")),
+    HttpRequest(
+        "PUT",
+        URL("https://nacos.local:8848/nacos/v1/ns/instance/beat?serviceName=test-platform"),
+        headers={"accept-encoding": "gzip, deflate"},
+    ),
+    HttpRequest(
+        "POST",
+        URL("https://nacos.local:8848/nacos/v1/cs/configs"),
+        content=b"dataId=redis",
+        headers={"content-type": "application/x-www-form-urlencoded", "content-length": "12"},
+    ),
+]
+
+
+_counter = itertools.count()
+
+
+def traced(request: HttpRequest) -> HttpRequest:
+    """
+    The same request as sent with tracing on: a fresh traceparent and a
+    varying query, which must not defeat the header cache.
+    """
+    n = next(_counter)
+    return HttpRequest(
+        request.method,
+        URL("%s&n=%d" % (request.url.full_path, n) if "?" in request.url.full_path else request.url.full_path),
+        request.content,
+        {**request.headers, "traceparent": "00-%032x-%016x-01" % (n, n)},
+    )
+
+
+def baseline(request: HttpRequest):
+    return [
+        (b":method", request.method.encode()),
+        (b":scheme", request.url.scheme.encode()),
+        (b":authority", request.url.authority.encode()),
+        (b":path", request.url.full_path.encode()),
+        (b"user-agent", USER_AGENT.encode()),
+    ] + [(k.encode(), v.encode()) for (k, v) in request.headers.items()]
+
+
+def cached(request: HttpRequest):
+    url = request.url
+    return header_block(
+        request.method,
+        url.scheme,
+        url.authority,
+        url.full_path,
+        tuple(request.headers.items()) if request.headers else (),
+    )
+
+
+def run(func, number: int, tracing: bool = False) -> None:
+    if tracing:
+        # one distinct request per call, generated up front
+        batches = [[traced(request) for request in REQUESTS] for _ in range(number + 1000)]
+    else:
+        batches = [REQUESTS] * (number + 1000)
+    for request in batches[0]:
+        func(request)
+    timed = iter(batches[:number])
+
+    def loop():
+        for request in next(timed):
+            func(request)
+
+    total = number * len(REQUESTS)
+    elapsed = timeit.timeit(loop, number=number)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [func(request) for batch in batches[number:] for request in batch]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    del keep
+
+    print(
+        "%-18s %8.0f ns/request %8.0f bytes/request"
+        % (func.__name__ + (" +tracing" if tracing else ""), elapsed / total * 1e9, allocated / (1000 * len(REQUESTS)))
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP/3 header encoding micro-benchmark")
+    parser.add_argument("-n", "--number", type=int, default=100000)
+    args = parser.parse_args()
+    run(baseline, args.number)
+    run(cached, args.number)
+    # per-request headers: the cached parts must still be reused
+    run(baseline, args.number, tracing=True)
+    run(cached, args.number, tracing=True)
+    print("static_headers cache:", static_headers.cache_info())
+
+
+if __name__ == "__main__":
+    main()
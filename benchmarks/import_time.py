@@ -0,0 +1,74 @@
+"""
+Import-time budget check for the plain Nacos client.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+reports the cumulative import time of the module and the heaviest
+dependencies, and exits non-zero if the budget is exceeded or if a module
+which should only load on first use (HTTP/3 stack, websockets, httpx) was
+imported. When sanic-ext is installed, importing config_helper.nacos also
+registers NacosPlugin, so sanic and sanic-ext count towards the budget.
+
+    python -m benchmarks.import_time [--module config_helper.nacos] [--budget-ms 150]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+LAZY_MODULES = ("aioquic", "wsproto", "httpx", "yaml", "jsonschema", "zstandard")
+
+
+def import_times(module: str) -> dict:
+    """
+    Return {module: (self_us, cumulative_us)} for a fresh import of `module`.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % module],
+        cwd=root,
+        stderr=subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        universal_newlines=True,
+    )
+    if proc.returncode:
+        errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise SystemExit("import %s failed:\n%s" % (module, "\n".join(errors[-5:])))
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header line
+        times[fields[2].strip()] = (self_us, cumulative_us)
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="config_helper.nacos")
+    parser.add_argument("--budget-ms", type=float, default=150.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_ms = times[args.module][1] / 1000
+    print("%s: %.1f ms cumulative" % (args.module, total_ms))
+    for name, (_, cumulative) in sorted(times.items(), key=lambda item: -item[1][1])[:args.top]:
+        print("  %8.1f ms  %s" % (cumulative / 1000, name))
+
+    eager = sorted({name.split(".")[0] for name in times} & set(LAZY_MODULES))
+    failed = False
+    if eager:
+        print("FAIL: imported eagerly: %s" % ", ".join(eager))
+        failed = True
+    if total_ms > args.budget_ms:
+        print("FAIL: %.1f ms exceeds budget of %.1f ms" % (total_ms, args.budget_ms))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
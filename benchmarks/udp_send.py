@@ -0,0 +1,104 @@
+"""
+Throughput benchmark for the UDP send path of the HTTP/3 client.
+
+Sends bursts of QUIC-sized datagrams to a local sink, once with one
+`sendto` per datagram (aioquic's default transmit) and once through
+`BatchedDatagramTransport` (UDP GSO), and reports datagrams per second,
+MB/s and syscalls per burst.
+
+    python -m benchmarks.udp_send [-n 2000] [--burst 32] [--size 1200]
+"""
+import argparse
+import socket
+import threading
+import time
+
+from http3_helper.udp import BatchedDatagramTransport, gso_supported
+
+
+class SocketTransport:
+    """
+    The part of an asyncio datagram transport used by the batcher, writing
+    straight to the socket.
+    """
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.calls = 0
+
+    def sendto(self, data: bytes, addr: tuple) -> None:
+        self.calls += 1
+        try:
+            self.sock.sendto(data, addr)
+        except BlockingIOError:
+            pass
+
+    def get_write_buffer_size(self) -> int:
+        return 0
+
+
+def drain(sock: socket.socket, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            sock.recv(65535)
+        except (socket.timeout, OSError):
+            continue
+
+
+def run(batched: bool, bursts: int, burst: int, size: int, addr: tuple) -> tuple:
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    sock.bind(("::", 0))
+    transport = SocketTransport(sock)
+    sender = BatchedDatagramTransport(transport, sock) if batched else transport
+    payload = b"x" * size
+    start = time.perf_counter()
+    for _ in range(bursts):
+        if batched:
+            sender.begin()
+        for _ in range(burst):
+            sender.sendto(payload, addr)
+        if batched:
+            sender.flush()
+    elapsed = time.perf_counter() - start
+    syscalls = transport.calls + (sender.batches if batched else 0)
+    sock.close()
+    return elapsed, syscalls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--bursts", type=int, default=2000)
+    parser.add_argument("--burst", type=int, default=32, help="datagrams per transmit()")
+    parser.add_argument("--size", type=int, default=1200, help="datagram size in bytes")
+    args = parser.parse_args()
+
+    sink = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    sink.bind(("::1", 0))
+    sink.settimeout(0.1)
+    stop = threading.Event()
+    thread = threading.Thread(target=drain, args=(sink, stop), daemon=True)
+    thread.start()
+
+    probe = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    modes = [("sendto", False)]
+    if gso_supported(probe):
+        modes.append(("gso", True))
+    else:
+        print("UDP GSO not supported here, only the sendto path is measured")
+    probe.close()
+
+    count = args.bursts * args.burst
+    print("%d datagrams of %d bytes, %d per transmit" % (count, args.size, args.burst))
+    for name, batched in modes:
+        elapsed, syscalls = run(batched, args.bursts, args.burst, args.size, sink.getsockname())
+        print(
+            "%-8s %10.0f datagrams/s %8.1f MB/s %6.1f syscalls/transmit"
+            % (name, count / elapsed, count * args.size / elapsed / 1e6, syscalls / args.bursts)
+        )
+    stop.set()
+    thread.join()
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
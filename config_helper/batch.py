@@ -0,0 +1,54 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Iterable, List, Tuple
+
+
+class BatchResult:
+    """批量操作结果"""
+
+    __slots__ = ("succeeded", "failed")
+
+    def __init__(self) -> None:
+        # (参数, 返回值)
+        self.succeeded: List[Tuple[dict, Any]] = []
+        self.failed: List[Tuple[dict, Any]] = []
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def __repr__(self) -> str:
+        return f"BatchResult(succeeded={len(self.succeeded)}, failed={len(self.failed)})"
+
+
+def is_ok(res: tuple) -> bool:
+    return isinstance(res[0], str) and res[0].strip() == "ok"
+
+
+async def run_batch(
+    func: Callable[..., Awaitable[tuple]],
+    items: Iterable[dict],
+    concurrency: int = 8,
+    check: Callable[[tuple], bool] = is_ok,
+) -> BatchResult:
+    """以有限并发对每组参数调用func并汇总结果
+    Args:
+        func: NacosClient的单实例方法
+        items: 每次调用的关键字参数
+        concurrency: 最大并发数
+        check: 判断单次调用是否成功
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    result = BatchResult()
+
+    async def run(item: dict) -> None:
+        async with semaphore:
+            try:
+                res = await func(**item)
+            except Exception as e:
+                result.failed.append((item, e))
+                return
+        (result.succeeded if check(res) else result.failed).append((item, res[0]))
+
+    await asyncio.gather(*(run(item) for item in items))
+    return result
@@ -0,0 +1,102 @@
+import asyncio
+import gzip
+import importlib.util
+import os
+import zlib
+
+from functools import lru_cache
+from typing import AsyncIterable, AsyncIterator, BinaryIO, Iterable, Optional, Union
+
+Source = Union[str, bytes, os.PathLike, BinaryIO, Iterable, AsyncIterable]
+
+
+@lru_cache(maxsize=None)
+def has_zstd() -> bool:
+    """是否安装zstandard，只检查不导入"""
+    return importlib.util.find_spec("zstandard") is not None
+
+
+def accept_encoding() -> str:
+    """客户端可解码的Accept-Encoding"""
+    return "zstd, gzip, deflate" if has_zstd() else "gzip, deflate"
+
+
+def check_encoding(encoding: Optional[str]) -> Optional[str]:
+    if encoding not in (None, "gzip", "zstd"):
+        raise ValueError(f"unsupported content encoding: {encoding}")
+    if encoding == "zstd" and not has_zstd():
+        raise RuntimeError("zstd content encoding requires zstandard")
+    return encoding
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if encoding == "zstd":
+        import zstandard
+
+        return zstandard.ZstdCompressor().compress(data)
+    raise ValueError(f"unsupported content encoding: {encoding}")
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return data
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompress(data, zlib.MAX_WBITS | 16)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(data)
+        except zlib.error:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+    if encoding == "zstd" and has_zstd():
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"unsupported content encoding: {encoding}")
+
+
+async def compress_stream(chunks: AsyncIterable[bytes], encoding: str) -> AsyncIterator[bytes]:
+    """流式压缩，不在内存中拼接完整内容"""
+    if encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    elif encoding == "zstd":
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        raise ValueError(f"unsupported content encoding: {encoding}")
+    async for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+async def iter_source(source: Source, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """将文件（路径对象或二进制文件对象）、bytes/str、同步或异步迭代器统一转换为bytes异步迭代器
+
+    文件在线程池中分块读取，不在内存中保留完整内容。
+    """
+    if isinstance(source, (str, bytes)):
+        yield source.encode() if isinstance(source, str) else source
+        return
+    if isinstance(source, os.PathLike) or hasattr(source, "read"):
+        loop = asyncio.get_running_loop()
+        fp = open(source, "rb") if isinstance(source, os.PathLike) else source
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, fp.read, chunk_size)
+                if not chunk:
+                    return
+                yield chunk.encode() if isinstance(chunk, str) else chunk
+        finally:
+            if fp is not source:
+                fp.close()
+    if hasattr(source, "__aiter__"):
+        async for chunk in source:
+            yield chunk.encode() if isinstance(chunk, str) else chunk
+        return
+    for chunk in source:
+        yield chunk.encode() if isinstance(chunk, str) else chunk
@@ -0,0 +1,149 @@
+import hashlib
+import ujson as json
+
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Optional, Union
+
+
+def decode_properties(content: str) -> dict:
+    ret = {}
+    lines = iter(content.splitlines())
+    for line in lines:
+        line = line.strip()
+        while line.endswith('\\'):
+            line = line[:-1] + next(lines, '').strip()
+        if not line or line[0] in '#!':
+            continue
+        index = min((i for i in (line.find('='), line.find(':')) if i >= 0), default=-1)
+        if index < 0:
+            ret[line] = ''
+        else:
+            ret[line[:index].strip()] = line[index + 1:].strip()
+    return ret
+
+
+def decode_yaml(content: str) -> Any:
+    # 可选依赖，仅在解码yaml配置时导入
+    try:
+        import yaml
+    except ImportError:
+        raise RuntimeError("yaml config requires PyYAML")
+    return yaml.safe_load(content)
+
+
+DECODERS: Dict[str, Callable[[str], Any]] = {
+    'json': json.loads,
+    'yaml': decode_yaml,
+    'yml': decode_yaml,
+    'properties': decode_properties,
+    'text': str,
+}
+
+
+def guess_type(dataId: str, default: str = 'json') -> str:
+    """根据dataId后缀推断配置类型"""
+    suffix = dataId.rpartition('.')[2].lower()
+    return suffix if suffix in DECODERS else default
+
+
+def freeze(value: Any) -> Any:
+    """递归转换为不可变对象：dict -> MappingProxyType，list -> tuple，set -> frozenset"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, set):
+        return frozenset(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """freeze的逆操作，返回可修改的副本"""
+    if isinstance(value, MappingProxyType):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    if isinstance(value, frozenset):
+        return {thaw(v) for v in value}
+    return value
+
+
+def content_md5(content: str) -> str:
+    return hashlib.md5(content.encode('utf-8')).hexdigest()
+
+
+Schema = Union[dict, Callable[[Any], Any], None]
+
+
+class ConfigEntry:
+    """解码后的配置，value为不可变视图"""
+
+    __slots__ = ('md5', 'type', 'value')
+
+    def __init__(self, md5: str, type: str, value: Any) -> None:
+        self.md5 = md5
+        self.type = type
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"ConfigEntry(md5={self.md5!r}, type={self.type!r})"
+
+
+# 已解析的json配置可直接作为这些类型的解码结果（yaml兼容json）
+JSON_COMPATIBLE = frozenset(('json', 'yaml', 'yml'))
+
+
+def schema_key(schema: Schema) -> Any:
+    """schema在缓存键中的表示，字典按内容区分，校验函数按对象区分"""
+    if isinstance(schema, dict):
+        return json.dumps(schema, sort_keys=True)
+    return schema
+
+
+class ConfigDecoder:
+    """按md5缓存解码结果，同一版本的配置以同一类型、schema只解析、校验一次"""
+
+    def __init__(self) -> None:
+        # (dataId, group, tenant) -> {(type, schema_key): ConfigEntry}
+        self._entries: Dict[tuple, Dict[tuple, ConfigEntry]] = {}
+
+    def invalidate(self, key: Optional[tuple] = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def decode(self, key: tuple, content: Any, type: str, schema: Schema = None, md5: Optional[str] = None) -> ConfigEntry:
+        """解码配置内容
+        Args:
+            key (tuple): (dataId, group, tenant)
+            content: 原始配置内容；NacosClient缓存中已按json解析的配置可直接传入解析后的值
+            type (str): 配置类型 json/yaml/properties/text
+            schema: jsonschema字典或校验函数，校验失败时抛出异常
+            md5 (str, optional): 原始内容的md5，默认按content计算
+        """
+        parsed = not isinstance(content, str)
+        if parsed and type not in JSON_COMPATIBLE:
+            content, parsed = json.dumps(content, ensure_ascii=False, escape_forward_slashes=False), False
+        if md5 is None:
+            md5 = content_md5(json.dumps(content, sort_keys=True) if parsed else content)
+        variant = (type, schema_key(schema))
+        entries = self._entries.setdefault(key, {})
+        entry = entries.get(variant)
+        if entry is not None and entry.md5 == md5:
+            return entry
+        decoder = DECODERS.get(type)
+        if decoder is None:
+            raise ValueError(f"unsupported config type: {type}")
+        value = content if parsed else decoder(content)
+        if callable(schema):
+            schema(value)
+        elif schema is not None:
+            try:
+                import jsonschema
+            except ImportError:
+                raise RuntimeError("schema validation requires jsonschema")
+            jsonschema.validate(value, schema)
+        entry = ConfigEntry(md5, type, freeze(value))
+        entries[variant] = entry
+        return entry
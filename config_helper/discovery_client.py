@@ -0,0 +1,199 @@
+import asyncio
+import random
+
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from http3_helper import tracing
+from utils import logger
+from config_helper.instance_watch import InstanceDelta, InstanceKey, InstanceWatcher, instance_key
+
+if TYPE_CHECKING:
+    import httpx
+
+SCHEME = "service"
+
+
+class NoInstanceError(Exception):
+    """服务没有可用实例"""
+
+
+class DiscoveryClient:
+    """基于nacos服务发现的HTTP客户端，请求地址为 service://服务名/路径
+
+    实例列表来自NacosClient的订阅缓存（watch_instance），首次访问某个服务时拉取一次，之后由后台刷新，
+    请求时不再查询nacos。每个实例维护独立的httpx连接池，实例下线时关闭其连接池。
+    按nacos权重随机选择健康且启用的实例，连接失败时换一个实例重试。
+    """
+
+    def __init__(
+        self,
+        nacos_client,
+        namespaceId: Optional[str] = None,
+        groupName: Optional[str] = None,
+        clusters: Optional[str] = None,
+        scheme: str = "http",
+        http2: bool = False,
+        limits: Optional["httpx.Limits"] = None,
+        retries: int = 1,
+    ) -> None:
+        """
+        :param nacos_client: NacosClient
+        :param namespaceId: 命名空间id
+        :param groupName: 服务分组
+        :param clusters: 集群名称，多个集群用逗号分隔
+        :param scheme: 访问实例使用的协议，实例元数据中的scheme优先
+        :param http2: 是否启用HTTP/2
+        :param limits: 每个实例连接池的限制
+        :param retries: 连接失败时换实例重试的次数
+        """
+        self.nacos_client = nacos_client
+        self.namespaceId = namespaceId
+        self.groupName = groupName
+        self.clusters = clusters
+        self.scheme = scheme
+        self.http2 = http2
+        self.limits = limits
+        self.retries = retries
+        self._watchers: Dict[str, InstanceWatcher] = {}
+        self._pools: Dict[InstanceKey, "httpx.AsyncClient"] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    async def _watcher(self, serviceName: str) -> InstanceWatcher:
+        watcher = self._watchers.get(serviceName)
+        if watcher is not None:
+            return watcher
+        lock = self._locks.setdefault(serviceName, asyncio.Lock())
+        async with lock:
+            watcher = self._watchers.get(serviceName)
+            if watcher is None:
+                watcher = self.nacos_client.watch_instance(
+                    serviceName,
+                    self._on_change,
+                    namespaceId=self.namespaceId,
+                    clusters=self.clusters,
+                    groupName=self.groupName,
+                )
+                await self.nacos_client.refresh_watch(watcher)
+                self._watchers[serviceName] = watcher
+        return watcher
+
+    async def _on_change(self, delta: InstanceDelta) -> None:
+        for host in delta.removed:
+            await self.evict(instance_key(host))
+
+    async def evict(self, key: InstanceKey) -> None:
+        """关闭某个实例的连接池"""
+        pool = self._pools.pop(key, None)
+        if pool is not None:
+            logger.info(f"实例下线，关闭连接池：{key}")
+            await pool.aclose()
+
+    async def instances(self, serviceName: str) -> List[dict]:
+        """服务当前健康且启用的实例"""
+        watcher = await self._watcher(serviceName)
+        if not watcher.instances:
+            # 首次拉取失败或服务暂无实例，请求时再拉取一次（singleflight合并并发请求）
+            await self.nacos_client.refresh_watch(watcher)
+        return [
+            host for host in watcher.instances
+            if host.get("healthy", True) and host.get("enabled", True) and host.get("weight", 1) > 0
+        ]
+
+    @staticmethod
+    def choose(hosts: List[dict]) -> dict:
+        """按权重随机选择实例"""
+        return random.choices(hosts, weights=[host.get("weight", 1) for host in hosts])[0]
+
+    def pool(self, host: dict) -> "httpx.AsyncClient":
+        """实例的连接池，不存在时创建"""
+        key = instance_key(host)
+        client = self._pools.get(key)
+        if client is None or client.is_closed:
+            import httpx
+
+            scheme = (host.get("metadata") or {}).get("scheme", self.scheme)
+            address = f"[{host['ip']}]" if ":" in host["ip"] else host["ip"]
+            client = httpx.AsyncClient(
+                base_url=f"{scheme}://{address}:{host['port']}",
+                http2=self.http2,
+                limits=self.limits or httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+            self._pools[key] = client
+        return client
+
+    @staticmethod
+    def parse(url: str) -> Tuple[str, str]:
+        """service://服务名/路径 -> (服务名, 路径)"""
+        parts = urlsplit(url)
+        if parts.scheme != SCHEME or not parts.netloc:
+            raise ValueError(f"not a {SCHEME}:// url: {url}")
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        return parts.netloc, path
+
+    async def request(self, method: str, url: str, **kwargs) -> "httpx.Response":
+        """
+        发起请求
+        :param method: 请求方法
+        :param url: service://服务名/路径
+        :param kwargs: 透传给httpx.AsyncClient.request
+        :return: httpx.Response
+        """
+        import httpx
+
+        serviceName, path = self.parse(url)
+        with tracing.start_span(f"discovery {method} {serviceName}", {
+            "http.request.method": method,
+            "nacos.service": serviceName,
+            "url.path": path,
+        }) as span:
+            if tracing.enabled():
+                kwargs["headers"] = tracing.inject(dict(kwargs.get("headers") or {}))
+            hosts = await self.instances(serviceName)
+            for attempt in range(self.retries + 1):
+                if not hosts:
+                    raise NoInstanceError(f"no available instance: {serviceName}")
+                host = self.choose(hosts)
+                span.set_attributes({
+                    "server.address": host["ip"],
+                    "server.port": host["port"],
+                    "nacos.retries": attempt,
+                })
+                try:
+                    response = await self.pool(host).request(method, path, **kwargs)
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    logger.info(f"连接实例失败：{serviceName} {host['ip']}:{host['port']}, {e}")
+                    if attempt == self.retries:
+                        raise
+                    hosts = [h for h in hosts if h is not host]
+                else:
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    return response
+
+    async def get(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("PUT", url, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> "httpx.Response":
+        return await self.request("DELETE", url, **kwargs)
+
+    def metrics(self) -> dict:
+        return {
+            "services": {name: len(watcher.instances) for name, watcher in self._watchers.items()},
+            "pools": len(self._pools),
+        }
+
+    async def close(self) -> None:
+        """取消订阅并关闭全部连接池"""
+        for watcher in self._watchers.values():
+            self.nacos_client.unwatch_instance(watcher, self._on_change)
+        self._watchers.clear()
+        for key in list(self._pools):
+            await self.evict(key)
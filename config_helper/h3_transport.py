@@ -0,0 +1,197 @@
+import asyncio
+
+from contextlib import AsyncExitStack
+from typing import Dict, Optional, Tuple, cast
+from aioquic.h3.events import DataReceived, HeadersReceived
+from aioquic.quic.configuration import QuicConfiguration
+
+from config_helper.compression import accept_encoding, decompress
+from config_helper.transport import Body, Transport, TransportConnectError, TransportResponse, encode_form, normalize_headers
+from http3_helper.aioquic import HttpClient, get_session_ticket, save_session_ticket
+from http3_helper.profiles import get_configuration
+from http3_helper.qlog import get_quic_logger
+from http3_helper.timing import RequestTiming
+from http3_helper.udp import LocalPortPool, connect, get_local_port_pool
+from utils import logger
+from config import setting
+
+
+class Http3Transport(Transport):
+    """基于aioquic的HTTP/3传输层，复用同一个QUIC连接并发多路请求，连接断开后自动重连
+
+    本地端口默认由系统分配；配置HTTP3_LOCAL_PORT_RANGE后从端口池中按worker分配，连接关闭时归还。
+    QUIC参数按profile（见http3_helper.profiles）选择，每个profile使用独立的连接，请求时可通过profile参数指定。
+    """
+
+    name = "http3"
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        local_ports: Optional[LocalPortPool] = None,
+        gso: bool = getattr(setting, "HTTP3_UDP_GSO", False),
+        ca_certs: Optional[str] = getattr(setting, "CA_CERTS", None),
+        profile: str = getattr(setting, "HTTP3_QUIC_PROFILE", "default"),
+        connect_timeout: float = getattr(setting, "HTTP3_CONNECT_TIMEOUT", 5),
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.host = host
+        self.port = port
+        self.authority = f"{host}:{port}"
+        self.local_ports = local_ports if local_ports is not None else get_local_port_pool()
+        self.gso = gso
+        if getattr(setting, "HTTP3_LOCAL_PORT", 0):
+            logger.info("HTTP3_LOCAL_PORT已弃用，固定端口会导致并发连接冲突，请使用HTTP3_LOCAL_PORT_RANGE")
+        self.ca_certs = ca_certs
+        self.profile = profile
+        # 建立QUIC连接的超时，不超过请求的超时
+        self.connect_timeout = connect_timeout
+        # profile -> (连接, 连接上下文)
+        self._clients: Dict[str, Tuple[HttpClient, AsyncExitStack]] = {}
+        # profile -> 进行中的建连，并发请求等待同一次建连，失败时一起失败
+        self._connecting: Dict[str, asyncio.Future] = {}
+        self._lock = asyncio.Lock()
+
+    def create_configuration(self, profile: Optional[str] = None) -> QuicConfiguration:
+        configuration = get_configuration(profile or self.profile)
+        configuration.quic_logger = get_quic_logger()
+        try:
+            get_session_ticket(configuration)
+        except (OSError, EOFError):
+            pass
+        if self.ca_certs:
+            configuration.load_verify_locations(self.ca_certs)
+        return configuration
+
+    def _active(self, profile: str) -> Optional[HttpClient]:
+        entry = self._clients.get(profile)
+        if entry is not None and not entry[0].closed:
+            return entry[0]
+        return None
+
+    async def get_client(self, profile: Optional[str] = None, timeout: Optional[float] = None) -> HttpClient:
+        """
+        获取profile对应的连接，不存在时建立
+        Args:
+            profile (str, optional): QUIC参数profile
+            timeout (float, optional): 等待建连的超时，默认connect_timeout
+        Raises:
+            TransportConnectError: 建连失败或超时
+        """
+        profile = profile or self.profile
+        client = self._active(profile)
+        if client is not None:
+            return client
+        timeout = self.connect_timeout if timeout is None else min(timeout, self.connect_timeout)
+        pending = self._connecting.get(profile)
+        if pending is None:
+            pending = asyncio.ensure_future(self._connect(profile, timeout))
+            self._connecting[profile] = pending
+            pending.add_done_callback(lambda _: self._connecting.pop(profile, None))
+        try:
+            # shield：单个请求等待超时不取消其他请求共用的建连
+            return await asyncio.wait_for(asyncio.shield(pending), timeout)
+        except asyncio.TimeoutError:
+            raise TransportConnectError(f"QUIC connect to {self.authority} timed out after {timeout}s")
+
+    async def _connect(self, profile: str, timeout: float) -> HttpClient:
+        async with self._lock:
+            client = self._active(profile)
+            if client is not None:
+                return client
+            await self._reset(profile)
+            stack = AsyncExitStack()
+            try:
+                protocol = await asyncio.wait_for(
+                    stack.enter_async_context(
+                        connect(
+                            self.host,
+                            self.port,
+                            configuration=self.create_configuration(profile),
+                            create_protocol=HttpClient,
+                            session_ticket_handler=save_session_ticket,
+                            local_ports=self.local_ports,
+                            gso=self.gso,
+                        )
+                    ),
+                    timeout,
+                )
+            except asyncio.TimeoutError:
+                await stack.aclose()
+                raise TransportConnectError(f"QUIC connect to {self.authority} timed out after {timeout}s")
+            except Exception as e:
+                await stack.aclose()
+                raise TransportConnectError(f"QUIC connect to {self.authority} failed: {e!r}") from e
+            except BaseException:
+                await stack.aclose()
+                raise
+            client = cast(HttpClient, protocol)
+            self._clients[profile] = (client, stack)
+            return client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        data: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        content: Optional[Body] = None,
+        timeout: float = 30,
+        profile: Optional[str] = None,
+    ) -> TransportResponse:
+        timing = RequestTiming()
+        headers = normalize_headers(headers)
+        headers.setdefault("accept-encoding", accept_encoding())
+        if params:
+            url += ("&" if "?" in url else "?") + encode_form(params)
+        url = f"https://{self.authority}{url}"
+        content = self.encode_body(data, content, headers)
+        profile = profile or self.profile
+        client = await self.get_client(profile, timeout)
+        if content is None or isinstance(content, bytes):
+            if content:
+                headers["content-length"] = str(len(content))
+            pending = client.request(method, url, content or b"", headers, timing)
+        else:
+            pending = client.stream_request(method, url, content, headers, timing)
+        try:
+            http_events = await asyncio.wait_for(pending, timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            await self._drop(profile, client)
+            raise
+        status_code, response_headers, body = 0, {}, bytearray()
+        for http_event in http_events:
+            if isinstance(http_event, HeadersReceived):
+                for k, v in http_event.headers:
+                    if k == b":status":
+                        status_code = int(v)
+                    else:
+                        response_headers[k.decode()] = v.decode()
+            elif isinstance(http_event, DataReceived):
+                body += http_event.data
+        content = bytes(body)
+        if "content-encoding" in response_headers:
+            content = decompress(content, response_headers.pop("content-encoding"))
+        timing.mark("end")
+        return TransportResponse(status_code, response_headers, content, timing.elapsed, "HTTP/3", timing)
+
+    async def _drop(self, profile: str, client: HttpClient) -> None:
+        async with self._lock:
+            if self._active(profile) is client:
+                await self._reset(profile)
+
+    async def _reset(self, profile: str) -> None:
+        entry = self._clients.pop(profile, None)
+        if entry is not None:
+            try:
+                await entry[1].aclose()
+            except Exception as e:
+                logger.info(f"关闭QUIC连接异常：{e}")
+
+    async def close(self) -> None:
+        async with self._lock:
+            for profile in list(self._clients):
+                await self._reset(profile)
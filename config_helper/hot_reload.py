@@ -0,0 +1,204 @@
+import asyncio
+import inspect
+
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, MutableMapping, Optional, Tuple, Union
+
+from utils import logger
+from config_helper.config_decoder import ConfigEntry, Schema, thaw
+
+# hook(key, old, new)，可为协程函数
+Hook = Callable[[str, Any, Any], Any]
+
+
+class ConfigBinding:
+    """nacos配置与app.config的绑定
+
+    指定key时整个配置值写入app.config[key]；否则配置须为字典，各项以 prefix + 大写键名 写入app.config。
+    """
+
+    def __init__(
+        self,
+        dataId: str,
+        group: str,
+        tenant: Optional[str] = None,
+        key: Optional[str] = None,
+        prefix: str = "",
+        type: Optional[str] = None,
+        schema: Schema = None,
+    ) -> None:
+        self.dataId = dataId
+        self.group = group
+        self.tenant = tenant
+        self.key = key
+        self.prefix = prefix
+        self.type = type
+        self.schema = schema
+        # 已应用配置的md5，用于长轮询
+        self.md5 = ""
+
+    @property
+    def id(self) -> Tuple[str, str, Optional[str]]:
+        return self.dataId, self.group, self.tenant
+
+    def values(self, entry: ConfigEntry) -> Dict[str, Any]:
+        """配置值 -> 待写入app.config的键值，均为可修改的新副本"""
+        if self.key is not None:
+            return {self.key: thaw(entry.value)}
+        if not isinstance(entry.value, Mapping):
+            raise ValueError(f"config {self.dataId} is not a mapping, bind it to a key")
+        return {f"{self.prefix}{k}".upper(): thaw(v) for k, v in entry.value.items()}
+
+
+class ConfigReloader:
+    """监听nacos配置变更并热更新app.config
+
+    所有绑定通过一个长轮询请求监听，变更的配置全部拉取、解码、校验成功后才一次性写入app.config，
+    写入过程中没有await，请求处理不会看到只更新了一部分的配置；写入的是新对象，不修改旧值，
+    持有旧值的代码不受影响（copy-on-write）。解码或校验失败时保留原配置。
+    写入后按键调用变更回调，可在回调中就地调整数据库、redis连接池等。
+    """
+
+    def __init__(
+        self,
+        nacos_client,
+        config: MutableMapping,
+        timeout: int = 30000,
+        retry_interval: float = 5,
+    ) -> None:
+        """
+        :param nacos_client: NacosClient
+        :param config: 要更新的配置，通常为app.config
+        :param timeout: 长轮询超时（毫秒）
+        :param retry_interval: 请求或解码失败后的重试间隔（秒）
+        """
+        self.nacos_client = nacos_client
+        self.config = config
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.bindings: Dict[tuple, ConfigBinding] = {}
+        self.hooks: Dict[str, List[Hook]] = {}
+        self.version = 0
+        self.failures = 0
+
+    def bind(
+        self,
+        dataId: str,
+        group: str,
+        tenant: Optional[str] = None,
+        key: Optional[str] = None,
+        prefix: str = "",
+        type: Optional[str] = None,
+        schema: Schema = None,
+    ) -> ConfigBinding:
+        """
+        绑定nacos配置
+        :param dataId: 配置的唯一标识
+        :param group: 配置的分组
+        :param tenant: 租户
+        :param key: 写入的app.config键，不指定时将字典配置展开写入
+        :param prefix: 展开写入时的键名前缀
+        :param type: 配置类型 json/yaml/properties/text，默认按dataId后缀推断
+        :param schema: jsonschema字典或校验函数
+        :return: ConfigBinding
+        """
+        binding = ConfigBinding(dataId, group, tenant, key, prefix, type, schema)
+        self.bindings[binding.id] = binding
+        return binding
+
+    def on_change(self, keys: Union[str, Iterable[str]], hook: Hook) -> None:
+        """
+        注册变更回调，键的值变化时调用 hook(key, old, new)
+        :param keys: app.config键，"*"表示所有键
+        :param hook: 回调函数，可为协程函数
+        """
+        for key in [keys] if isinstance(keys, str) else keys:
+            self.hooks.setdefault(key, []).append(hook)
+
+    async def _fetch(self, binding: ConfigBinding) -> Optional[ConfigEntry]:
+        return await self.nacos_client.get_typed_config(
+            binding.dataId, binding.group, binding.tenant, type=binding.type, schema=binding.schema, refresh=True
+        )
+
+    async def reload(self, bindings: Iterable[ConfigBinding], notify: bool = True) -> Dict[str, Tuple[Any, Any]]:
+        """
+        拉取配置并一次性写入
+        :param bindings: 要重新加载的绑定
+        :param notify: 是否调用变更回调
+        :return: 发生变化的键 -> (旧值, 新值)
+        """
+        bindings = list(bindings)
+        try:
+            entries = await asyncio.gather(*(self._fetch(binding) for binding in bindings))
+            updates: Dict[str, Any] = {}
+            for binding, entry in zip(bindings, entries):
+                if entry is not None:
+                    updates.update(binding.values(entry))
+        except Exception as e:
+            self.failures += 1
+            logger.info(f"nacos配置热更新失败，保留原配置：{e}")
+            return {}
+
+        missing = object()
+        changes = {}
+        for key, value in updates.items():
+            old = self.config.get(key, missing)
+            if old != value:
+                changes[key] = (None if old is missing else old, value)
+        # 同步写入，期间不会切换到其他协程
+        if changes:
+            self.config.update({key: new for key, (_, new) in changes.items()})
+            self.version += 1
+        for binding, entry in zip(bindings, entries):
+            if entry is not None:
+                binding.md5 = entry.md5
+        if changes:
+            logger.info(f"nacos配置热更新：{sorted(changes)}, version:{self.version}")
+            if notify:
+                await self._notify(changes)
+        return changes
+
+    async def _notify(self, changes: Dict[str, Tuple[Any, Any]]) -> None:
+        for key, (old, new) in changes.items():
+            for hook in self.hooks.get(key, []) + self.hooks.get("*", []):
+                try:
+                    ret = hook(key, old, new)
+                    if inspect.isawaitable(ret):
+                        await ret
+                except Exception as e:
+                    logger.info(f"nacos配置变更回调异常：{key}, {e}")
+
+    async def load(self) -> Dict[str, Tuple[Any, Any]]:
+        """启动时加载全部绑定的配置，不调用变更回调"""
+        return await self.reload(self.bindings.values(), notify=False)
+
+    async def poll(self) -> Dict[str, Tuple[Any, Any]]:
+        """长轮询一次，有变更时重新加载变更的配置"""
+        configs = [(b.dataId, b.group, b.tenant, b.md5) for b in self.bindings.values()]
+        changed = await self.nacos_client.listener_configs(configs, self.timeout)
+        if changed is None:
+            self.failures += 1
+            await asyncio.sleep(self.retry_interval)
+            return {}
+        bindings = [self.bindings[key] for key in changed if key in self.bindings]
+        if not bindings:
+            return {}
+        before = [binding.md5 for binding in bindings]
+        changes = await self.reload(bindings)
+        if any(binding.md5 == md5 for binding, md5 in zip(bindings, before)):
+            # 拉取或解码失败，md5未更新，立即重试会被nacos马上返回
+            await asyncio.sleep(self.retry_interval)
+        return changes
+
+    async def run(self) -> None:
+        while True:
+            if not self.bindings:
+                return
+            await self.poll()
+
+    def metrics(self) -> dict:
+        return {
+            "bindings": len(self.bindings),
+            "version": self.version,
+            "failures": self.failures,
+        }
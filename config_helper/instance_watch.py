@@ -0,0 +1,117 @@
+import inspect
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils import logger
+
+InstanceKey = Tuple[str, int, str]
+
+# 参与变更判断的实例字段
+WATCH_FIELDS = ("weight", "healthy", "enabled", "ephemeral", "metadata")
+
+
+class InstanceDelta:
+    """两次实例列表之间的差异"""
+
+    __slots__ = ("serviceName", "added", "removed", "changed")
+
+    def __init__(
+        self,
+        serviceName: str,
+        added: List[dict],
+        removed: List[dict],
+        changed: List[Tuple[dict, dict]],
+    ) -> None:
+        self.serviceName = serviceName
+        self.added = added
+        self.removed = removed
+        # (旧实例, 新实例)
+        self.changed = changed
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self) -> str:
+        return (
+            f"InstanceDelta(serviceName={self.serviceName!r}, added={len(self.added)}, "
+            f"removed={len(self.removed)}, changed={len(self.changed)})"
+        )
+
+
+def instance_key(host: dict) -> InstanceKey:
+    return host["ip"], int(host["port"]), host.get("clusterName") or "DEFAULT"
+
+
+def instance_fingerprint(host: dict) -> tuple:
+    metadata = host.get("metadata") or {}
+    return tuple(
+        tuple(sorted(metadata.items())) if field == "metadata" else host.get(field)
+        for field in WATCH_FIELDS
+    )
+
+
+class InstanceWatcher:
+    """订阅某个服务的实例列表，按 (ip, port, cluster) 建立索引，只向回调发送增量"""
+
+    def __init__(
+        self,
+        serviceName: str,
+        namespaceId: Optional[str] = None,
+        clusters: Optional[str] = None,
+        groupName: Optional[str] = None,
+        healthyOnly: bool = False,
+    ) -> None:
+        self.serviceName = serviceName
+        self.params = {
+            "namespaceId": namespaceId,
+            "clusters": clusters,
+            "groupName": groupName,
+            "healthyOnly": healthyOnly,
+        }
+        self.callbacks: List[Callable[[InstanceDelta], None]] = []
+        self._index: Dict[InstanceKey, Tuple[tuple, dict]] = {}
+        self._revision: Optional[tuple] = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.serviceName, *self.params.values())
+
+    @property
+    def instances(self) -> List[dict]:
+        return [host for _, host in self._index.values()]
+
+    def diff(self, result: dict) -> Optional[InstanceDelta]:
+        """与上一次的实例列表比较
+        Args:
+            result (dict): get_instance 的返回值
+        Returns:
+            Optional[InstanceDelta]: checksum/lastRefTime 未变化时返回None
+        """
+        revision = (result.get("checksum"), result.get("lastRefTime"))
+        if revision != (None, None) and revision == self._revision:
+            return None
+        self._revision = revision
+
+        index: Dict[InstanceKey, Tuple[tuple, dict]] = {}
+        added, changed = [], []
+        for host in result.get("hosts") or []:
+            key = instance_key(host)
+            fingerprint = instance_fingerprint(host)
+            index[key] = (fingerprint, host)
+            old = self._index.pop(key, None)
+            if old is None:
+                added.append(host)
+            elif old[0] != fingerprint:
+                changed.append((old[1], host))
+        removed = [host for _, host in self._index.values()]
+        self._index = index
+        return InstanceDelta(self.serviceName, added, removed, changed)
+
+    async def dispatch(self, delta: InstanceDelta) -> None:
+        for callback in list(self.callbacks):
+            try:
+                ret = callback(delta)
+                if inspect.isawaitable(ret):
+                    await ret
+            except Exception as e:
+                logger.info(f"实例变更回调执行异常：{self.serviceName}, {e}")
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+
+from typing import Callable, Optional
+
+from utils import logger
+from config_helper.loop_monitor import LoopMonitor
+
+
+class LoadReporter:
+    """根据本地负载调整nacos实例权重及健康状态
+
+    负载取以下三项中的最大值，均归一化为 0~1（超过1表示过载）：
+    - 进行中的请求数 / inflight_capacity
+    - 事件循环延迟 / lag_limit
+    - 进程CPU占用 / cpu_limit
+    负载经指数加权平均后换算为权重，变化超过step才上报；平均负载达到unhealthy_threshold时标记为不健康，
+    回落到healthy_threshold以下才恢复，两个阈值之间保持原状态避免反复切换。
+    多worker时各worker把本地负载写入WorkerLoads，只有leader汇总后上报，避免各worker轮流覆盖同一实例的权重。
+    """
+
+    def __init__(
+        self,
+        nacos_client,
+        serviceName: str,
+        ip: str,
+        port: int,
+        inflight: Callable[[], int],
+        monitor: Optional[LoopMonitor] = None,
+        namespaceId: Optional[str] = None,
+        groupName: Optional[str] = None,
+        clusterName: Optional[str] = None,
+        ephemeral: bool = False,
+        interval: float = 5,
+        alpha: float = 0.3,
+        max_weight: float = 1.0,
+        min_weight: float = 0.01,
+        step: float = 0.05,
+        inflight_capacity: int = 100,
+        lag_limit: float = 0.2,
+        cpu_limit: float = 0.9,
+        unhealthy_threshold: float = 0.95,
+        healthy_threshold: float = 0.7,
+        workers: Optional["WorkerLoads"] = None,
+        leader: Callable[[], bool] = lambda: True,
+    ) -> None:
+        """
+        :param workers: 多worker负载表，不指定时只按本进程负载上报
+        :param leader: 当前进程是否负责上报，仅在指定workers时使用
+        """
+        self.nacos_client = nacos_client
+        self.instance = {
+            "serviceName": serviceName,
+            "ip": ip,
+            "port": port,
+            "namespaceId": namespaceId,
+            "groupName": groupName,
+            "clusterName": clusterName,
+        }
+        self.inflight = inflight
+        self.monitor = monitor
+        self.ephemeral = ephemeral
+        self.interval = interval
+        self.alpha = alpha
+        self.max_weight = max_weight
+        self.min_weight = min_weight
+        self.step = step
+        self.inflight_capacity = inflight_capacity
+        self.lag_limit = lag_limit
+        self.cpu_limit = cpu_limit
+        self.unhealthy_threshold = unhealthy_threshold
+        self.healthy_threshold = healthy_threshold
+        self.load = 0.0
+        self.weight = max_weight
+        self.healthy = True
+        self.reports = 0
+        self.workers = workers
+        self.leader = leader
+        self._leading = False
+        # 最近一次成功上报的值，None表示不确定（如刚接替leader），下次必定上报
+        self._reported_weight: Optional[float] = max_weight
+        self._reported_healthy: Optional[bool] = True
+        self._cpu = (time.monotonic(), time.process_time())
+
+    def _cpu_usage(self) -> float:
+        """上次采样以来本进程占用的CPU比例（单核）"""
+        wall, cpu = time.monotonic(), time.process_time()
+        last_wall, last_cpu = self._cpu
+        self._cpu = (wall, cpu)
+        return min(1.0, (cpu - last_cpu) / (wall - last_wall)) if wall > last_wall else 0.0
+
+    def sample(self) -> float:
+        """采样当前负载"""
+        loads = [self.inflight() / self.inflight_capacity, self._cpu_usage() / self.cpu_limit]
+        if self.monitor is not None:
+            loads.append(self.monitor.last_lag / self.lag_limit)
+        return max(loads)
+
+    def update(self, load: float) -> None:
+        """更新平均负载，按阈值计算权重及健康状态"""
+        self.load += (load - self.load) * self.alpha
+        self.weight = round(max(self.min_weight, self.max_weight * (1 - min(self.load, 1.0))), 2)
+        if self.healthy and self.load >= self.unhealthy_threshold:
+            self.healthy = False
+        elif not self.healthy and self.load <= self.healthy_threshold:
+            self.healthy = True
+
+    async def report(self, weight: float, healthy: bool) -> None:
+        """上报权重及健康状态，持久实例使用健康检查接口，临时实例通过enabled下线"""
+        weight_changed = self._reported_weight is None or abs(weight - self._reported_weight) >= self.step
+        health_changed = healthy != self._reported_healthy
+        if not weight_changed and not health_changed:
+            return
+        if self.ephemeral:
+            res = await self.nacos_client.update_instance(
+                weight=weight, enabled=healthy, ephemeral=True, **self.instance
+            )
+        else:
+            res = await self.nacos_client.update_instance(weight=weight, ephemeral=False, **self.instance)
+            if health_changed and res[0] == 'ok':
+                res = await self.nacos_client.update_instance_health(healthy=healthy, **self.instance)
+        if res[0] != 'ok':
+            logger.info(f"nacos负载上报失败：{res[0]}")
+            return
+        if health_changed:
+            logger.info(f"nacos实例{'恢复健康' if healthy else '标记为不健康'}，平均负载：{self.load:.2f}")
+        self._reported_weight, self._reported_healthy = weight, healthy
+        self.reports += 1
+
+    def _collect(self) -> Optional[float]:
+        """采样并汇总负载，非leader返回None"""
+        load = self.sample()
+        if self.workers is None:
+            return load
+        self.workers.publish(load)
+        if not self.leader():
+            self._leading = False
+            return None
+        load = self.workers.aggregate()
+        if not self._leading:
+            # 接替leader：以当前汇总负载为起点，并重新上报一次覆盖前任leader的值
+            self._leading = True
+            self.load = load
+            self._reported_weight = self._reported_healthy = None
+        return load
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            load = self._collect()
+            if load is None:
+                continue
+            self.update(load)
+            try:
+                await self.report(self.weight, self.healthy)
+            except Exception as e:
+                logger.info(f"nacos负载上报异常：{e}")
+
+    def metrics(self) -> dict:
+        return {
+            "load": self.load,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "reports": self.reports,
+        }
+
+
+class WorkerLoads:
+    """多worker负载表，共享数组中每个worker占一行 (pid, 负载, 更新时间)
+
+    leader汇总各worker的负载后统一上报；已退出或超过ttl未更新的worker不参与汇总，其行可被新worker复用。
+    """
+
+    FIELDS = 3
+
+    def __init__(self, array, ttl: float = 15) -> None:
+        """
+        :param array: WorkerLoads.create()创建的multiprocessing.Array
+        :param ttl: 行的有效期（秒），通常为上报间隔的数倍
+        """
+        self.array = array
+        self.ttl = ttl
+        self.slots = len(array) // self.FIELDS
+
+    @classmethod
+    def create(cls, slots: int = 64):
+        """在主进程中创建共享数组，放入app.shared_ctx供各worker使用"""
+        import multiprocessing
+
+        return multiprocessing.Array('d', slots * cls.FIELDS)
+
+    def _row(self, slot: int):
+        base = slot * self.FIELDS
+        return self.array[base:base + self.FIELDS]
+
+    def publish(self, load: float) -> None:
+        """写入本进程的负载"""
+        pid, now = os.getpid(), time.time()
+        with self.array.get_lock():
+            free = None
+            for slot in range(self.slots):
+                owner, _, updated = self._row(slot)
+                if owner == pid:
+                    free = slot
+                    break
+                if free is None and (not owner or now - updated > self.ttl):
+                    free = slot
+            if free is None:
+                logger.info("nacos负载表已满，本worker的负载不参与汇总")
+                return
+            base = free * self.FIELDS
+            self.array[base:base + self.FIELDS] = [pid, load, now]
+
+    def aggregate(self) -> float:
+        """有效行负载的平均值，即实例整体的负载"""
+        now = time.time()
+        with self.array.get_lock():
+            loads = [
+                load for owner, load, updated in map(self._row, range(self.slots))
+                if owner and now - updated <= self.ttl
+            ]
+        return sum(loads) / len(loads) if loads else 0.0
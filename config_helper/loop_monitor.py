@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import threading
+import time
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils import logger
+
+
+class LoopMonitor:
+    """事件循环延迟及协程卡顿检测
+
+    - 周期性sleep(interval)，实际唤醒时间与预期之差即为事件循环延迟
+    - record_beat 统计晚于预期间隔发送的心跳
+    - start_call/end_call 跟踪进行中的调用，超过stall_threshold（或调用自身的阈值）仍未完成的标记为卡顿
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.5,
+        lag_threshold: float = 0.2,
+        stall_threshold: float = 5.0,
+    ) -> None:
+        self.interval = interval
+        self.lag_threshold = lag_threshold
+        self.stall_threshold = stall_threshold
+        self.samples = 0
+        self.lagged = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.avg_lag = 0.0
+        self.beats = 0
+        self.late_beats = 0
+        self.stalled_calls = 0
+        self.on_lag: List[Callable[[float], None]] = []
+        self._last_beat: Optional[float] = None
+        self._pending: Dict[int, Tuple[str, float, float]] = {}
+        self._flagged = set()
+        self._tokens = itertools.count()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            self._record_lag(max(0.0, now - start - self.interval))
+            self._check_stalls(now)
+
+    def _record_lag(self, lag: float) -> None:
+        self.samples += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        # 指数加权平均
+        self.avg_lag += (lag - self.avg_lag) * 0.1
+        if lag < self.lag_threshold:
+            return
+        self.lagged += 1
+        logger.info(f"事件循环延迟：{lag * 1000:.1f}ms")
+        for callback in list(self.on_lag):
+            try:
+                callback(lag)
+            except Exception as e:
+                logger.info(f"事件循环延迟回调异常：{e}")
+
+    def _check_stalls(self, now: float) -> None:
+        for token, (name, start, threshold) in list(self._pending.items()):
+            if token not in self._flagged and now - start > threshold:
+                self._flagged.add(token)
+                self.stalled_calls += 1
+                logger.info(f"调用卡顿：{name} 已等待 {now - start:.1f}s")
+
+    def record_beat(self, expected: float) -> None:
+        """记录一次心跳，与上次心跳间隔超过预期1.5倍时计为延迟心跳"""
+        now = time.monotonic()
+        if self._last_beat is not None and now - self._last_beat > expected * 1.5:
+            self.late_beats += 1
+            logger.info(f"nacos心跳延迟：间隔{now - self._last_beat:.1f}s，预期{expected}s")
+        self._last_beat = now
+        self.beats += 1
+
+    def start_call(self, name: str, threshold: Optional[float] = None) -> int:
+        """
+        开始跟踪一次调用
+        :param name: 调用名称
+        :param threshold: 卡顿阈值（秒），长轮询等本就长时间挂起的调用按自身超时设置，默认stall_threshold
+        :return: end_call使用的token
+        """
+        token = next(self._tokens)
+        self._pending[token] = (
+            name, asyncio.get_running_loop().time(), self.stall_threshold if threshold is None else threshold
+        )
+        return token
+
+    def end_call(self, token: int) -> None:
+        self._pending.pop(token, None)
+        self._flagged.discard(token)
+
+    def metrics(self) -> dict:
+        return {
+            "samples": self.samples,
+            "lagged": self.lagged,
+            "last_lag_ms": self.last_lag * 1000,
+            "avg_lag_ms": self.avg_lag * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "beats": self.beats,
+            "late_beats": self.late_beats,
+            "pending_calls": len(self._pending),
+            "stalled_calls": self.stalled_calls,
+        }
+
+
+class ThreadedHeartbeat:
+    """在独立线程及事件循环中发送心跳，不受主事件循环阻塞影响
+
+    client_factory在心跳线程中调用，返回该线程专用的NacosClient。
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Any],
+        send: Callable[[Any], Awaitable],
+        interval: float = 5,
+        monitor: Optional[LoopMonitor] = None,
+    ) -> None:
+        self.client_factory = client_factory
+        self.send = send
+        self.interval = interval
+        self.monitor = monitor
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="nacos-heartbeat", daemon=True)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self, timeout: float = 1) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        asyncio.run(self._beat_loop())
+
+    async def _beat_loop(self) -> None:
+        client = self.client_factory()
+        try:
+            while not self._stop.is_set():
+                try:
+                    await self.send(client)
+                except Exception as e:
+                    logger.info(f"nacos心跳线程发送异常：{e}")
+                if self.monitor is not None:
+                    self.monitor.record_beat(self.interval)
+                await asyncio.get_running_loop().run_in_executor(None, self._stop.wait, self.interval)
+        finally:
+            await client.close()
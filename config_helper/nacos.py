@@ -1,19 +1,23 @@
 import asyncio
+import queue
+import time
 import ujson as json
-import aioquic
-import httpx
-
-from sanic.log import logger
-from aioquic.asyncio.client import connect
-from aioquic.quic.configuration import QuicConfiguration
-from aioquic.h3.connection import H3_ALPN
-from aioquic.quic.logger import QuicFileLogger
-from typing import Optional, Union, cast
-from sanic_ext import Extend, Extension
-from sanic import Sanic
-
-from utils import get_local_ip
-from http3_helper.aioquic import HttpClient, get_session_ticket, perform_http_request, save_session_ticket
+
+from importlib.util import find_spec
+from typing import Callable, Dict, List, Optional, Union
+from urllib.parse import quote_plus, unquote_plus
+
+from utils import logger
+from config_helper.snapshot import NacosSnapshot
+from config_helper.instance_watch import InstanceDelta, InstanceWatcher
+from config_helper.config_decoder import DECODERS, ConfigDecoder, ConfigEntry, Schema, content_md5, guess_type
+from config_helper.loop_monitor import LoopMonitor
+from config_helper.singleflight import SingleFlight
+from config_helper.batch import BatchResult, run_batch
+from config_helper.compression import Source, iter_source
+from config_helper.transport import Transport, TransportResponse, create_transport, encode_form
+from http3_helper import tracing
+from http3_helper.timing import TimingAggregator
 from config import setting
 
 
@@ -22,73 +26,376 @@ class NacosClient:
     INSTANCE_BASE_URL = '''/nacos/v1/ns/instance'''
     SERVICE_BASE_URL = '''/nacos/v1/ns/service'''
     NAMESPACE_BASE_URL = '''/nacos/v1/console/namespaces'''
+    # follower缓存未命中时通知leader的最小间隔（秒），期间使用本进程上次获取的数据
+    SHARED_INTEREST_INTERVAL = 10
 
-    def __init__(self, ssl=setting.NACOS_SSL):
-        # TODO: aioquic 替换httpx 需nginx支持
+    def __init__(
+        self,
+        ssl=setting.NACOS_SSL,
+        snapshot_file: Optional[str] = getattr(setting, 'NACOS_SNAPSHOT_FILE', None),
+        transport: Union[str, Transport, None] = getattr(setting, 'NACOS_TRANSPORT', None),
+    ):
+        """
+        :param ssl: 是否使用https，未指定transport时https走HTTP/3
+        :param snapshot_file: 本地快照文件路径
+        :param transport: 传输层实例或名称（httpx/http3/auto/memory）
+        """
         self.log = logger
         self.base_host = ''
         self.ssl = ssl
+        self._inflight = 0
+        # 按阶段汇总请求耗时
+        self.timings = TimingAggregator()
+        # 事件循环延迟检测，由NacosPlugin设置
+        self.monitor: Optional[LoopMonitor] = None
+        self.transport = transport if isinstance(transport, Transport) else create_transport(transport, ssl)
+        # 配置及实例列表缓存，nacos不可用时作为兜底并定期写入本地快照
+        self._config_cache = {}
+        self._instance_cache = {}
+        self._cache_version = 0
+        self._snapshot_version = 0
+        # 从快照恢复、尚未从nacos刷新的缓存：(section, key)，读取时直接返回并在后台刷新
+        self._stale = set()
+        self._revalidating: Dict[tuple, asyncio.Future] = {}
+        self.snapshot = NacosSnapshot(snapshot_file) if snapshot_file else None
+        self._watchers: Dict[tuple, InstanceWatcher] = {}
+        # 并发的相同get_config/get_instance只发起一次请求
+        self.singleflight = SingleFlight()
+        self.decoder = ConfigDecoder()
+        # 多worker共享缓存，follower优先读取leader发布的数据
+        self.shared = None
+        self.leader = True
+        self._shared_version = 0
+        # follower -> leader：需要leader接管刷新的 (section, key)
+        self._interest = None
+        self._interest_sent: Dict[tuple, float] = {}
+        # leader负责刷新并发布的键
+        self._tracked = {"configs": set(), "instances": set()}
+        # 配置内容md5，leader长轮询监听共享的配置，get_typed_config据此判断解码缓存是否过期
+        self._config_md5: Dict[tuple, str] = {}
+        # nacos返回的Config-Type
+        self._config_type: Dict[tuple, str] = {}
 
-    def __responseHa(self, res):
-        if self.ssl:
-            # 支持https则使用http3请求
-            self.log.info(f"响应信息：{res[0]}")
-            try:
-                ret = res[0]
-                time = res[-1]
-            except Exception as e:
-                ret = res[0]
-                time = -1
-            return ret, time
-        else:
-            self.log.info(f"响应信息：{res.text}")
-            try:
-                ret = res.json()
-                time = res.elapsed.total_seconds()
-            except Exception as e:
-                ret = res.text
-                time = -1
-            return ret, time
+    def load_snapshot(self) -> bool:
+        """从本地快照恢复配置及实例缓存，已有缓存优先
+        :return: 是否成功加载
+        """
+        if not self.snapshot:
+            return False
+        payload = self.snapshot.load()
+        if not payload:
+            return False
+        for section, cache in (("configs", self._config_cache), ("instances", self._instance_cache)):
+            for key, value in payload[section].items():
+                if key not in cache:
+                    cache[key] = value
+                    self._stale.add((section, key))
+        self.log.info(
+            f"加载nacos快照：configs:{len(payload['configs'])},"
+            f"instances:{len(payload['instances'])},created:{payload['created']}"
+        )
+        return True
 
-    async def call_api(self, data, session=None, timeout=30):
-        self.log.info("call_api接受的参数data是： %s" % data)
-        if self.ssl:
-            # 支持https则使用http3请求
+    async def save_snapshot(self, force: bool = False) -> bool:
+        """缓存有变化时将其写入本地快照，写文件在线程池中执行避免阻塞事件循环
+        :param force: 缓存无变化时也写入
+        :return: 是否写入
+        """
+        if not self.snapshot or not self.leader:
+            return False
+        version = self._cache_version
+        if not force and version == self._snapshot_version:
+            return False
+        configs, instances = dict(self._config_cache), dict(self._instance_cache)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.snapshot.dump, configs, instances)
+        except Exception as e:
+            self.log.info(f"写入nacos快照失败：{e}")
+            return False
+        self._snapshot_version = version
+        return True
+
+    async def snapshot_loop(self, interval: float = getattr(setting, 'NACOS_SNAPSHOT_INTERVAL', 30)):
+        """后台定期写入本地快照
+        :param interval: 写入间隔（秒）
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.save_snapshot()
+
+    def attach_shared(self, registry, leader: bool, interest=None) -> None:
+        """接入多worker共享缓存
+        :param registry: SharedRegistry
+        :param leader: 当前进程是否负责请求nacos并发布缓存
+        :param interest: multiprocessing.Queue，follower通过它把缓存未命中的键交给leader刷新
+        """
+        self.shared = registry
+        self.leader = leader
+        self._interest = interest
+
+    def set_leader(self, leader: bool) -> None:
+        """更新leader状态，接替时接管共享缓存中已有的键"""
+        if leader and not self.leader and self.shared is not None:
+            payload = self.shared.read()
+            if payload:
+                for section, cache in (("configs", self._config_cache), ("instances", self._instance_cache)):
+                    for key, value in payload[section].items():
+                        cache.setdefault(key, value)
+                        self._tracked[section].add(key)
+            # 立即以本进程的缓存重新发布
+            self._cache_version += 1
+            self.log.info(f"接替nacos共享缓存leader：configs:{len(self._tracked['configs'])},"
+                          f"instances:{len(self._tracked['instances'])}")
+        self.leader = leader
+
+    async def adopt_interest(self) -> int:
+        """leader接收follower提交的键并立即获取，之后由leader负责刷新
+        :return: 新接管的键数量
+        """
+        if self._interest is None or not self.leader:
+            return 0
+        adopted = []
+        while True:
             try:
-                config = QuicConfiguration(
-                    is_client=True,
-                    alpn_protocols=H3_ALPN,
-                    quic_logger=QuicFileLogger(setting.HTTP3_CLIENT_LOG_DIR),
-                )
-                get_session_ticket(config)
-                config.load_verify_locations(setting.CA_CERTS)
-                async with connect(
-                    host='https://' + setting.NACOS_HOST,
-                    port=int(setting.NACOS_PORT),
-                    configuration=config,
-                    create_protocol=HttpClient,
-                    session_ticket_handler=save_session_ticket,
-                    local_port=setting.HTTP3_LOCAL_PORT,
-                ) as session:
-                    client = cast(HttpClient, session)
-                    response = await perform_http_request(client, **data)
-            except Exception as e:
-                self.log.info("调用接口发生异常 ： %s" % e)
-                return False, -1
+                section, key = self._interest.get_nowait()
+            except queue.Empty:
+                break
+            if key not in self._tracked[section]:
+                self._tracked[section].add(key)
+                adopted.append((section, key))
+        for section, key in adopted:
+            if section == "configs":
+                await self.get_config(*key)
             else:
-                self.log.info("接口返回的消息体是： %s" % [r.data for r in response[0]])
-                return self.__responseHa(res=response)
-        else:
+                await self.get_instance(*key)
+        return len(adopted)
+
+    async def refresh_tracked_instances(self) -> None:
+        """leader刷新共享的实例列表，已订阅的服务由watch_loop刷新"""
+        for key in list(self._tracked["instances"]):
+            if key not in self._watchers:
+                await self.get_instance(*key)
+
+    async def shared_config_loop(self, timeout: int = 30000, interval: float = 1):
+        """leader长轮询监听共享的配置，变更后重新获取，follower不再请求nacos
+        :param timeout: 长轮询超时（毫秒）
+        :param interval: 非leader或请求失败时的等待间隔（秒）
+        """
+        while True:
+            if self.shared is None or not self.leader or not self._tracked["configs"]:
+                await asyncio.sleep(interval)
+                continue
+            configs = [(*key, self._config_md5.get(key, "")) for key in self._tracked["configs"]]
+            changed = await self.listener_configs(configs, timeout)
+            if changed is None:
+                await asyncio.sleep(interval)
+                continue
+            for key in changed:
+                if key in self._tracked["configs"]:
+                    self._stale.discard(("configs", key))
+                    await self.get_config(*key)
+            if changed:
+                self.publish_shared()
+
+    def publish_shared(self) -> bool:
+        """leader将缓存发布到共享内存，缓存无变化时跳过
+        :return: 是否发布
+        """
+        if self.shared is None or not self.leader:
+            return False
+        version = self._cache_version
+        if version == self._shared_version:
+            return False
+        if self.shared.publish({"configs": self._config_cache, "instances": self._instance_cache}):
+            self._shared_version = version
+            return True
+        return False
+
+    def _revalidate(self, name: tuple, fetch: Callable) -> None:
+        """后台刷新快照中的缓存，同一键同时只有一个刷新任务"""
+        if name in self._revalidating:
+            return
+        task = asyncio.ensure_future(self.singleflight.do(name, fetch))
+        self._revalidating[name] = task
+        task.add_done_callback(lambda _: self._revalidating.pop(name, None))
+
+    def _shared_lookup(self, section: str, key: tuple):
+        """共享缓存查询：leader记录键并由自己刷新；follower读取leader发布的数据，
+        未命中时通知leader接管该键，在通知间隔内复用本进程上次获取的数据
+        :return: 数据，需要由本进程请求nacos时返回None
+        """
+        if self.shared is None:
+            return None
+        if self.leader:
+            self._tracked[section].add(key)
+            return None
+        payload = self.shared.read()
+        value = payload[section].get(key) if payload else None
+        if value is not None:
+            return value
+        cache = self._config_cache if section == "configs" else self._instance_cache
+        now = time.monotonic()
+        sent = self._interest_sent.get((section, key))
+        if sent is not None and now - sent < self.SHARED_INTEREST_INTERVAL and key in cache:
+            return cache[key]
+        self._interest_sent[(section, key)] = now
+        if self._interest is not None:
             try:
-                async with httpx.AsyncClient(base_url=f"{'http://' if not self.ssl else 'https://'}{setting.NACOS_HOST}:{setting.NACOS_PORT}") as session:
-                    data["timeout"] = timeout
-                    response = await session.request(**data)
+                self._interest.put_nowait((section, key))
             except Exception as e:
-                self.log.info("调用接口发生异常 ： %s" % e)
-                return False, -1
-            else:
-                self.log.info("接口返回的消息体是： %s" % response.content)
-                return self.__responseHa(res=response)
+                self.log.info(f"通知nacos共享缓存leader失败：{e}")
+        return None
+
+    def watch_instance(
+        self,
+        serviceName: str,
+        callback: Callable[[InstanceDelta], None],
+        namespaceId: Optional[str] = None,
+        clusters: Optional[str] = None,
+        groupName: Optional[str] = None,
+        healthyOnly: bool = False,
+    ) -> InstanceWatcher:
+        """订阅服务实例列表变更，回调只接收新增、删除及变更的实例
+        :param serviceName: 应用名称
+        :param callback: 变更回调，参数为InstanceDelta，可为协程函数
+        :param namespaceId: 命名空间id
+        :param clusters: 实例所属集群名称，多个集群用逗号分隔
+        :param groupName: 实例所属分组名称
+        :param healthyOnly: 是否只返回健康的实例
+        :return: 订阅对象
+        """
+        watcher = InstanceWatcher(serviceName, namespaceId, clusters, groupName, healthyOnly)
+        watcher = self._watchers.setdefault(watcher.key, watcher)
+        watcher.callbacks.append(callback)
+        return watcher
+
+    def unwatch_instance(self, watcher: InstanceWatcher, callback: Optional[Callable] = None):
+        """取消订阅，不传callback时移除该服务的全部回调"""
+        if callback is not None and callback in watcher.callbacks:
+            watcher.callbacks.remove(callback)
+        if callback is None or not watcher.callbacks:
+            self._watchers.pop(watcher.key, None)
+
+    async def refresh_watch(self, watcher: InstanceWatcher) -> Optional[InstanceDelta]:
+        """拉取一次实例列表并向订阅者发送增量
+        :return: 实例变更，无变化时返回None
+        """
+        res = await self.get_instance(watcher.serviceName, **watcher.params)
+        if not isinstance(res[0], dict):
+            return None
+        delta = watcher.diff(res[0])
+        if delta:
+            await watcher.dispatch(delta)
+            return delta
+        return None
+
+    async def watch_loop(self, interval: float = getattr(setting, 'NACOS_WATCH_INTERVAL', 10)):
+        """后台定期刷新所有订阅的实例列表
+        :param interval: 刷新间隔（秒）
+        """
+        while True:
+            # follower的get_instance读取leader发布的共享缓存，不请求nacos
+            for watcher in list(self._watchers.values()):
+                await self.refresh_watch(watcher)
+            if self.shared is not None and self.leader:
+                await self.refresh_tracked_instances()
+            await asyncio.sleep(interval)
+
+    def cached_config(self, dataId: str, group: str, tenant: Optional[str] = None):
+        """读取缓存的配置，不发起请求
+        :return: 配置值，无缓存时返回None
+        """
+        return self._config_cache.get((dataId, group, tenant))
+
+    def cached_instance(
+        self,
+        serviceName: str,
+        namespaceId: Optional[str] = None,
+        clusters: Optional[str] = None,
+        groupName: Optional[str] = None,
+        healthyOnly: bool = False,
+    ):
+        """读取缓存的实例列表，不发起请求
+        :return: 实例列表，无缓存时返回None
+        """
+        return self._instance_cache.get((serviceName, namespaceId, clusters, groupName, healthyOnly))
+
+    def __responseHa(self, res: TransportResponse):
+        self.log.info(f"响应信息：{res.text}")
+        try:
+            ret = res.json()
+            time = res.elapsed
+        except Exception as e:
+            ret = res.text
+            time = -1
+        return ret, time
+
+    async def call_api(self, data, session=None, timeout=30, raw=False, stall_threshold=None):
+        self.log.info("call_api接受的参数data是： %s" % data)
+        self._inflight += 1
+        token = self.monitor.start_call(
+            f"{data.get('method')} {data.get('url')}", stall_threshold
+        ) if self.monitor else None
+        attributes = {
+            "nacos.endpoint": data.get('url'),
+            "http.request.method": data.get('method'),
+            "nacos.transport": self.transport.name,
+        }
+        try:
+            with tracing.start_span(f"nacos {data.get('method')} {data.get('url')}", attributes) as span:
+                return await self._call_api(span, data, timeout, raw)
+        finally:
+            self._inflight -= 1
+            if token is not None:
+                self.monitor.end_call(token)
+
+    async def _call_api(self, span, data, timeout, raw):
+        try:
+            if tracing.enabled():
+                # 注入trace上下文，不修改调用方的headers
+                data = {**data, "headers": tracing.inject(dict(data.get("headers") or {}))}
+            response = await self.transport.request(timeout=timeout, **data)
+        except Exception as e:
+            self.log.info("调用接口发生异常 ： %s" % e)
+            span.record_exception(e)
+            span.set_attribute("error.type", type(e).__name__)
+            return False, -1
+        self.log.info("接口返回的消息体是： %s" % response.content)
+        span.set_attributes({
+            "http.response.status_code": response.status_code,
+            "http.response.body.size": len(response.content),
+            "network.protocol.version": response.http_version,
+        })
+        if response.timing is not None:
+            self.timings.record(response.timing)
+        if raw:
+            # 返回原始响应，由调用方自行解析
+            return response, response.elapsed
+        return self.__responseHa(res=response)
+
+    def metrics(self) -> dict:
+        """客户端运行指标"""
+        return {
+            "inflight": self._inflight,
+            "singleflight": self.singleflight.metrics(),
+            "timing": self.timings.summary(),
+            "loop": self.monitor.metrics() if self.monitor else None,
+        }
+
+    async def drain(self, interval: float = 0.05):
+        """等待进行中的请求完成，调用方通过wait_for限定时间"""
+        while self._inflight:
+            await asyncio.sleep(interval)
+
+    async def close(self):
+        """关闭传输层连接池及共享缓存"""
+        for task in list(self._revalidating.values()):
+            task.cancel()
+        await self.transport.close()
+        if self.shared is not None:
+            self.shared.shm.close()
+            self.shared = None
 
     async def get_config(
         self,
@@ -113,6 +420,18 @@ class NacosClient:
             f"获取配置的参数是： id:{dataId},group:{group}"
             f"{',tenant:' + tenant if tenant else ''}"
         )
+        data = self._config_request(dataId, group, tenant)
+        key = (dataId, group, tenant)
+        shared = self._shared_lookup('configs', key)
+        if shared is not None:
+            return shared, 0
+        if ('configs', key) in self._stale:
+            # 快照数据立即返回（stale-while-revalidate），不等待nacos
+            self._revalidate(('config', key), lambda: self._fetch_config(key, data))
+            return self._config_cache[key], 0
+        return await self.singleflight.do(('config', key), lambda: self._fetch_config(key, data))
+
+    def _config_request(self, dataId: str, group: str, tenant: Optional[str] = None) -> dict:
         data = {
             "params": {
                 "dataId": dataId,
@@ -123,7 +442,77 @@ class NacosClient:
         }
         if tenant:
             data["params"]["tenant"] = tenant
-        return await self.call_api(data=data)
+        return data
+
+    async def _fetch_config(self, key: tuple, data: dict):
+        res = await self.call_api(data=data, raw=True)
+        if res[0] is False or res[0].status_code >= 500:
+            # nacos不可用时使用缓存，4xx（无权限、配置不存在等）如实返回
+            if key in self._config_cache:
+                self.log.info(f"获取配置失败，使用缓存：{key}")
+                return self._config_cache[key], -1
+            if res[0] is False:
+                return res
+        ret = self.__responseHa(res=res[0])
+        # 只缓存成功的响应，错误信息不能作为配置兜底
+        if res[0].status_code == 200:
+            self._config_cache[key] = ret[0]
+            self._config_md5[key] = content_md5(res[0].text)
+            self._config_type[key] = res[0].headers.get('config-type', '').lower()
+            self._cache_version += 1
+            self._stale.discard(('configs', key))
+        return ret
+
+    async def get_typed_config(
+        self,
+        dataId: str,
+        group: str,
+        tenant: Optional[str] = None,
+        type: Optional[str] = None,
+        schema: Schema = None,
+        refresh: bool = False,
+    ) -> Optional[ConfigEntry]:
+        """
+        获取解码后的配置，与get_config共用缓存、快照及共享缓存，同一版本（md5）按同一类型、schema只解码一次，返回值为不可变视图
+        :param dataId: 配置的唯一标识
+        :param group: 配置的分组
+        :param tenant: 租户
+        :param type: 配置类型 json/yaml/properties/text，默认使用nacos返回的Config-Type，缺失时按dataId后缀推断
+        :param schema: jsonschema字典或校验函数
+        :param refresh: 不使用缓存、快照及共享缓存，重新请求nacos
+        :return: ConfigEntry，配置不存在或请求失败且无缓存时返回None
+        """
+        key = (dataId, group, tenant)
+        data = self._config_request(dataId, group, tenant)
+        shared = None if refresh else self._shared_lookup('configs', key)
+        if shared is not None:
+            value, md5 = shared, None
+        else:
+            if ('configs', key) in self._stale and not refresh:
+                self._revalidate(('config', key), lambda: self._fetch_config(key, data))
+            else:
+                await self.singleflight.do(('config', key), lambda: self._fetch_config(key, data))
+            # 缓存中只有成功获取的配置，nacos不可用时为上次的配置
+            value, md5 = self._config_cache.get(key), self._config_md5.get(key)
+        if value is None:
+            return None
+        if type is None:
+            # 优先使用nacos返回的配置类型，旧版本nacos没有该响应头、或配置来自快照及共享缓存时按dataId后缀推断
+            type = self._config_type.get(key) or guess_type(dataId)
+            if type not in DECODERS:
+                # xml/html等没有解码器的类型按文本返回
+                type = 'text'
+        return self.decoder.decode(key, value, type, schema, md5)
+
+    def invalidate_typed_config(self, dataId: str, group: str, tenant: Optional[str] = None):
+        """丢弃已解码的配置，下次get_typed_config时重新解码"""
+        self.decoder.invalidate((dataId, group, tenant))
+
+    def _long_poll_stall(self, timeout: int) -> Optional[float]:
+        """长轮询的卡顿阈值：超过长轮询超时（毫秒）后再等待stall_threshold仍未返回才算卡顿"""
+        if self.monitor is None:
+            return None
+        return timeout / 1000 + self.monitor.stall_threshold
 
     async def listener_config(
         self,
@@ -162,7 +551,42 @@ class NacosClient:
             "method": "POST",
             "url": self.base_host + self.CONFIG_BASE_URL + '/listener'
         }
-        return await self.call_api(data=data)
+        # 长轮询在无变更时挂起整个timeout，不应计为卡顿
+        return await self.call_api(data=data, stall_threshold=self._long_poll_stall(timeout))
+
+    async def listener_configs(
+        self,
+        configs: List[tuple],
+        timeout: int = 30000,
+    ) -> Optional[List[tuple]]:
+        """
+        一次长轮询监听多个配置
+        :param configs: [(dataId, group, tenant, contentMD5), ...]，tenant可为None
+        :param timeout: 长轮询超时（毫秒）
+        :return: 发生变更的 [(dataId, group, tenant), ...]，请求失败时返回None
+        """
+        listening = "".join(
+            "\x02".join((dataId, group, contentMD5) + ((tenant,) if tenant else ())) + "\x01"
+            for dataId, group, tenant, contentMD5 in configs
+        )
+        data = {
+            "data": {"Listening-Configs": listening},
+            "headers": {"Long-Pulling-Timeout": timeout},
+            "method": "POST",
+            "url": self.base_host + self.CONFIG_BASE_URL + '/listener'
+        }
+        # 请求超时需长于长轮询超时，否则无变更时总是超时
+        res = await self.call_api(
+            data=data, timeout=timeout / 1000 + 10, raw=True, stall_threshold=self._long_poll_stall(timeout)
+        )
+        if res[0] is False or res[0].status_code != 200:
+            return None
+        changed = []
+        for item in unquote_plus(res[0].text).split("\x01"):
+            if item:
+                dataId, group, *tenant = item.split("\x02")
+                changed.append((dataId, group, tenant[0] if tenant else None))
+        return changed
 
     async def publish_config(
         self,
@@ -206,6 +630,52 @@ class NacosClient:
             data["data"]['type'] = type
         return await self.call_api(data=data)
 
+    async def publish_config_stream(
+        self,
+        dataId: str,
+        group: str,
+        source: Source,
+        tenant: Optional[str] = None,
+        type: str = "text",
+        chunk_size: int = 64 * 1024,
+    ):
+        """
+        流式发布配置，内容按块读取并编码后直接写入请求体，不在内存中拼接完整内容
+        :param dataId: 配置的唯一标识
+        :param group: 配置的分组
+        :param source: 配置内容，可为文件路径对象、二进制文件对象、str/bytes或其(异步)迭代器
+        :param tenant: 租户
+        :param type: 配置的类型
+        :param chunk_size: 读取文件的块大小
+        :return: 配置值
+        err code:
+        400	Bad Request	客户端请求中的语法错误
+        403	Forbidden	没有权限
+        404	Not Found	无法找到资源
+        500	Internal Server Error	服务器内部错误
+        200	OK	正常
+        """
+        self.log.info(
+            f"流式发布配置的参数是： id:{dataId},group:{group},type:{type}"
+            f"{',tenant:' + tenant if tenant else ''}"
+        )
+        fields = {"dataId": dataId, "group": group, "type": type}
+        if tenant:
+            fields["tenant"] = tenant
+
+        async def body():
+            yield (encode_form(fields) + "&content=").encode()
+            async for chunk in iter_source(source, chunk_size):
+                yield quote_plus(chunk).encode()
+
+        data = {
+            "content": body(),
+            "headers": {"content-type": "application/x-www-form-urlencoded"},
+            "method": "POST",
+            "url": self.base_host + self.CONFIG_BASE_URL
+        }
+        return await self.call_api(data=data)
+
     async def delete_config(
         self,
         dataId: str,
@@ -405,11 +875,11 @@ class NacosClient:
             f"更新实例的参数是： serviceName:{serviceName},ip:{ip},port:{port}"
             f"{',namespaceId:' + namespaceId if namespaceId else ''}"
             f"{',weight:' + str(weight) if weight else ''}"
-            f"{',enabled:' + str(enabled) if enabled else ''}"
+            f"{',enabled:' + str(enabled) if enabled is not None else ''}"
             f"{',metadata:' + metadata if metadata else ''}"
             f"{',clusterName:' + clusterName if clusterName else ''}"
             f"{',groupName:' + groupName if groupName else ''}"
-            f"{',ephemeral:' + str(ephemeral) if ephemeral else ''}"
+            f"{',ephemeral:' + str(ephemeral) if ephemeral is not None else ''}"
         )
         data = {
             "params": {
@@ -426,16 +896,95 @@ class NacosClient:
             data["params"]["groupName"] = groupName
         if clusterName:
             data["params"]["clusterName"] = clusterName
-        if ephemeral:
+        if ephemeral is not None:
             data["params"]["ephemeral"] = ephemeral
         if weight:
             data["params"]["weight"] = weight
-        if enabled:
+        if enabled is not None:
             data["params"]["enabled"] = enabled
         if metadata:
             data["params"]["metadata"] = metadata
         return await self.call_api(data=data)
 
+    async def batch_register_instance(self, instances: List[dict], concurrency: int = 8) -> BatchResult:
+        """
+        批量注册实例，以有限并发复用同一传输层连接
+        :param instances: 每个元素为register_instance的关键字参数
+        :param concurrency: 最大并发数
+        :return: BatchResult，汇总成功及失败的实例
+        """
+        self.log.info(f"批量注册实例：count:{len(instances)},concurrency:{concurrency}")
+        return await run_batch(self.register_instance, instances, concurrency)
+
+    async def batch_cancellation_instance(self, instances: List[dict], concurrency: int = 8) -> BatchResult:
+        """
+        批量取消注册实例
+        :param instances: 每个元素为cancellation_instance的关键字参数
+        :param concurrency: 最大并发数
+        :return: BatchResult，汇总成功及失败的实例
+        """
+        self.log.info(f"批量取消注册实例：count:{len(instances)},concurrency:{concurrency}")
+        return await run_batch(self.cancellation_instance, instances, concurrency)
+
+    async def batch_update_instance(self, instances: List[dict], concurrency: int = 8) -> BatchResult:
+        """
+        批量更新实例
+        :param instances: 每个元素为update_instance的关键字参数
+        :param concurrency: 最大并发数
+        :return: BatchResult，汇总成功及失败的实例
+        """
+        self.log.info(f"批量更新实例：count:{len(instances)},concurrency:{concurrency}")
+        return await run_batch(self.update_instance, instances, concurrency)
+
+    async def batch_update_instance_metadata(
+        self,
+        serviceName: str,
+        instances: List[dict],
+        metadata: dict,
+        namespaceId: Optional[str] = None,
+        groupName: Optional[str] = None,
+        consistencyType: Optional[str] = None,
+        delete: bool = False,
+    ):
+        """
+        批量更新或删除实例元数据（nacos 1.4+），一次请求完成
+        :param serviceName: 应用名称
+        :param instances: 实例列表，元素包含ip、port、clusterName、ephemeral，为空时作用于服务下全部实例
+        :param metadata: 元数据，删除时只使用其中的key
+        :param namespaceId: 命名空间id
+        :param groupName: 实例所属分组名称
+        :param consistencyType: 实例类型 ephemeral/persist
+        :param delete: 是否删除元数据
+        :return: 配置值
+        err code:
+        400	Bad Request	客户端请求中的语法错误
+        403	Forbidden	没有权限
+        404	Not Found	无法找到资源
+        500	Internal Server Error	服务器内部错误
+        200	OK	正常
+        """
+        self.log.info(
+            f"批量{'删除' if delete else '更新'}实例元数据的参数是： serviceName:{serviceName}"
+            f",instances:{len(instances)},metadata:{metadata}"
+            f"{',namespaceId:' + namespaceId if namespaceId else ''}"
+            f"{',groupName:' + groupName if groupName else ''}"
+            f"{',consistencyType:' + consistencyType if consistencyType else ''}"
+        )
+        data = {
+            "params": {
+                "serviceName": f"{groupName}@@{serviceName}" if groupName else serviceName,
+                "instances": json.dumps(instances),
+                "metadata": json.dumps(metadata),
+            },
+            "method": "DELETE" if delete else "PUT",
+            "url": self.base_host + self.INSTANCE_BASE_URL + '/metadata/batch'
+        }
+        if namespaceId:
+            data["params"]["namespaceId"] = namespaceId
+        if consistencyType:
+            data["params"]["consistencyType"] = consistencyType
+        return await self.call_api(data=data)
+
     async def get_instance(
         self,
         serviceName: str,
@@ -481,7 +1030,25 @@ class NacosClient:
             data["params"]["groupName"] = groupName
         if healthyOnly:
             data["params"]["healthyOnly"] = healthyOnly
-        return await self.call_api(data=data)
+        key = (serviceName, namespaceId, clusters, groupName, healthyOnly)
+        shared = self._shared_lookup('instances', key)
+        if shared is not None:
+            return shared, 0
+        if ('instances', key) in self._stale:
+            self._revalidate(('instance', key), lambda: self._fetch_instance(key, data))
+            return self._instance_cache[key], 0
+        return await self.singleflight.do(('instance', key), lambda: self._fetch_instance(key, data))
+
+    async def _fetch_instance(self, key: tuple, data: dict):
+        res = await self.call_api(data=data)
+        if isinstance(res[0], dict) and 'hosts' in res[0]:
+            self._instance_cache[key] = res[0]
+            self._cache_version += 1
+            self._stale.discard(('instances', key))
+        elif key in self._instance_cache:
+            self.log.info(f"获取实例失败，使用缓存：{key}")
+            return self._instance_cache[key], -1
+        return res
 
     async def detail_instance(
         self,
@@ -961,188 +1528,14 @@ class NacosClient:
         return await self.call_api(data=data)
 
 
-class NacosPlugin(Extension):
-    name = 'nacos'
-
-    def startup(self, bootstrap) -> None:
-        if self.included():
-            self.app.before_server_start(self.set_nacos_dependency)
-            self.app.before_server_start(self.create_nacose_service)
-            self.app.before_server_start(self.create_nacose_config)
-            self.app.before_server_stop(self.cancellation_nacos)
-        return super().startup(bootstrap)
-
-    @staticmethod
-    async def create_nacose_service(app: Sanic):
-        """在服务器启动时初始化nacos命名空间、服务及实例并开始后台beat
-        Args:
-            app (Sanic): sanic app
-        Raises:
-            Exception: 获取namespace错误
-            Exception: 创建namespace失败
-            Exception: 创建service失败
-        """
-        nacos_client = NacosClient()
-        res = await nacos_client.get_namespace()
-        namespace_exists = False
-        if res[0]:
-            for namespace in res[0]['data']:
-                if namespace['namespace'] == app.config.NACOS_NAMESPACE:
-                    namespace_exists = True
-                    break
-                else:
-                    continue
-        else:
-            raise Exception("get namespace error")
-        if not namespace_exists:
-            res = await nacos_client.create_namespace(app.config.NACOS_NAMESPACE, app.config.NACOS_NAMESPACE, app.config.APP_NAME)
-            if not res[0]:
-                raise Exception("create namespace error")
-        res = await nacos_client.get_service(app.config.NACOS_NAMESPACE, app.config.NACOS_SERVICENAME, groupName=app.config.NACOS_GROUP)
-        if 'service not found' in res[0]:
-            res = await nacos_client.create_service(app.config.NACOS_SERVICENAME, namespaceId=app.config.NACOS_NAMESPACE, groupName=app.config.NACOS_GROUP)
-            if 'ok' not in res[0]:
-                raise Exception("create service error")
-        # await self.create_nacose_instance(nacos_client)
-
-    async def create_nacose_instance(self, nacos_client: NacosClient):
-        """启动服务创建实例
-        Args:
-            nacos_client (NacosClient): nacos client
-        Raises:
-            Exception: 创建instance失败
-        """
-        res = await nacos_client.register_instance(
-            get_local_ip(),
-            self.app.config.PORT,
-            self.app.config.NACOS_SERVICENAME,
-            namespaceId=self.app.config.NACOS_NAMESPACE,
-            groupName=self.app.config.NACOS_GROUP,
-            enabled=True, healthy=True, ephemeral=self.app.config.NACOS_EPHEMERAL
-        )
-        if 'ok' not in res[0]:
-            res = await nacos_client.cancellation_instance(
-                self.app.config.NACOS_SERVICENAME,
-                get_local_ip(),
-                self.app.config.PORT,
-                namespaceId=self.app.config.NACOS_NAMESPACE,
-                groupName=self.app.config.NACOS_GROUP,
-                ephemeral=self.app.config.NACOS_EPHEMERAL
-            )
-            raise Exception(
-                f"create instance error, cancellation instance:{res[0]}")
-        await self.send_nacos_beat(
-            self.app.config.NACOS_HEARTBEAT_TASK,
-            self.app.config.NACOS_SERVICENAME,
-            beat={"ip": get_local_ip(), "port": self.app.config.PORT},
-            groupName=self.app.config.NACOS_GROUP,
-            ephemeral=self.app.config.NACOS_EPHEMERAL
-        )
-
-    async def send_nacos_beat(
-        self,
-        task_name: str,
-        serviceName: str,
-        beat: dict,
-        groupName: Optional[str] = None,
-        ephemeral: bool = False
-    ):
-        """启动nacos心跳后台任务
-        Args:
-            serviceName (str): 服务名称
-            beat (dict): 心跳信息
-            groupName (str, optional): 组名称. Defaults to None.
-            ephemeral (bool, optional): 是否临时实例. Defaults to None.
-        """
-        self.app.add_task(self.nacos_beat(serviceName, beat,
-                          groupName, ephemeral), name=task_name)
-
-    async def nacos_beat(
-        self,
-        serviceName: str,
-        beat: dict,
-        nacos_client: NacosClient,
-        groupName: Optional[str] = None,
-        ephemeral: bool = False
-    ):
-        while True:
-            await nacos_client.send_beat(serviceName, beat, groupName, ephemeral)
-            await asyncio.sleep(5)
-
-    @staticmethod
-    async def create_nacose_config(app: Sanic):
-        """在服务器启动时将mysql及redis共享至nacos配置
-        Args:
-            app (Sanic): sanic app
-        Raises:
-            Exception: nacos配置错误
-            Exception: nacos配置错误
-        """
-        nacos_client = NacosClient()
-        res = await nacos_client.get_config('redis', app.config.NACOS_GROUP, app.config.NACOS_NAMESPACE)
-        if 'config data not exist' in res[0]:
-            res = await nacos_client.publish_config(
-                'redis',
-                app.config.NACOS_GROUP,
-                {
-                    "host": app.config.REDIS_HOST,
-                    "port": app.config.REDIS_PORT,
-                    "password": app.config.REDIS_PASSWORD
-                },
-                app.config.NACOS_NAMESPACE
-            )
-            if not res:
-                raise Exception("create config error")
-        res = await nacos_client.get_config('mysql', app.config.NACOS_GROUP, app.config.NACOS_NAMESPACE)
-        if 'config data not exist' in res[0]:
-            res = await nacos_client.publish_config(
-                'mysql',
-                app.config.NACOS_GROUP,
-                {
-                    "host": app.config.DB_HOST,
-                    "port": app.config.DB_PORT,
-                    "username": app.config.DB_USER,
-                    "password": app.config.DB_PASSWORD,
-                    "db": app.config.DB_NAME
-                },
-                app.config.NACOS_NAMESPACE
-            )
-            if not res:
-                raise Exception("create config error")
-
-    @staticmethod
-    async def set_nacos_dependency(app: Sanic):
-        """通过sanic-ext dependency injection 添加nacos连接
-        Args:
-            app (Sanic): sanic app
-        """
-        con_nacos = NacosClient()
-        app.ext.dependency(con_nacos)
-
-    @staticmethod
-    async def cancellation_nacos(app: Sanic):
-        """服务停止，注销nacos实例，取消心跳任务
-        Args:
-            app (Sanic): sanic app
-        """
-        nacos_client = NacosClient()
-        res = await nacos_client.cancellation_instance(
-            app.config.NACOS_SERVICENAME,
-            get_local_ip(),
-            app.config.PORT,
-            namespaceId=app.config.NACOS_NAMESPACE,
-            groupName=app.config.NACOS_GROUP,
-            ephemeral=app.config.NACOS_EPHEMERAL
-        )
-        logger.info(f"cancellation instance:{res[0]}")
-        try:
-            await app.cancel_task(app.config.NACOS_HEARTBEAT_TASK)
-            logger.info(f"stop 【{app.config.NACOS_HEARTBEAT_TASK}】 task.")
-        except:
-            ...
-
-    def included(self):
-        return self.app.config.NACOS
+def __getattr__(name: str):
+    # 保持旧的导入路径 config_helper.nacos.NacosPlugin 可用
+    if name == 'NacosPlugin':
+        from config_helper.plugin import NacosPlugin
+        return NacosPlugin
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-Extend.register(NacosPlugin)
\ No newline at end of file
+# 导入本模块即注册sanic扩展（与拆分plugin.py之前一致）；未安装sanic_ext时只作为nacos客户端使用
+if find_spec('sanic_ext') is not None:
+    import config_helper.plugin  # noqa: F401,E402
@@ -0,0 +1,434 @@
+import asyncio
+import sys
+import weakref
+
+from typing import Optional
+from sanic_ext import Extend, Extension
+from sanic import Sanic
+
+from utils import HostIdentity, logger
+from config_helper.nacos import NacosClient
+from config_helper.discovery_client import DiscoveryClient
+from config_helper.loop_monitor import LoopMonitor, ThreadedHeartbeat
+from config_helper.shutdown import ShutdownCoordinator
+
+
+class NacosPlugin(Extension):
+    name = 'nacos'
+    BACKGROUND_TASKS = (
+        'nacos_snapshot', 'nacos_instance_watch', 'nacos_shared_cache', 'nacos_loop_monitor', 'nacos_load_reporter',
+        'nacos_config_reload', 'nacos_shared_config',
+    )
+
+    def startup(self, bootstrap) -> None:
+        if self.included():
+            if self.app.config.get('NACOS_SHARED_CACHE', False):
+                self.app.main_process_start(self.create_shared_cache)
+                self.app.main_process_stop(self.close_shared_cache)
+            self.app.before_server_start(self.set_nacos_dependency)
+            self.app.before_server_start(self.create_nacose_service)
+            self.app.before_server_start(self.create_nacose_config)
+            if self.app.config.get('NACOS_HOT_RELOAD'):
+                self.app.before_server_start(self.start_config_reloader)
+            if self.app.config.get('NACOS_LOAD_REPORT', False):
+                self.app.main_process_start(self.create_load_table)
+                self.app.register_middleware(self.track_request, 'request')
+                self.app.register_middleware(self.track_response, 'response')
+                self.app.before_server_start(self.start_load_reporter)
+            self.app.before_server_stop(self.cancellation_nacos)
+        return super().startup(bootstrap)
+
+    @staticmethod
+    async def create_nacose_service(app: Sanic):
+        """在服务器启动时初始化nacos命名空间、服务及实例并开始后台beat
+        Args:
+            app (Sanic): sanic app
+        Raises:
+            Exception: 获取namespace错误
+            Exception: 创建namespace失败
+            Exception: 创建service失败
+        """
+        nacos_client = app.ctx.nacos_client
+        res = await nacos_client.get_namespace()
+        namespace_exists = False
+        if res[0]:
+            for namespace in res[0]['data']:
+                if namespace['namespace'] == app.config.NACOS_NAMESPACE:
+                    namespace_exists = True
+                    break
+                else:
+                    continue
+        else:
+            raise Exception("get namespace error")
+        if not namespace_exists:
+            res = await nacos_client.create_namespace(app.config.NACOS_NAMESPACE, app.config.NACOS_NAMESPACE, app.config.APP_NAME)
+            if not res[0]:
+                raise Exception("create namespace error")
+        res = await nacos_client.get_service(app.config.NACOS_NAMESPACE, app.config.NACOS_SERVICENAME, groupName=app.config.NACOS_GROUP)
+        if 'service not found' in res[0]:
+            res = await nacos_client.create_service(app.config.NACOS_SERVICENAME, namespaceId=app.config.NACOS_NAMESPACE, groupName=app.config.NACOS_GROUP)
+            if 'ok' not in res[0]:
+                raise Exception("create service error")
+        # await self.create_nacose_instance(nacos_client)
+
+    async def create_nacose_instance(self, nacos_client: NacosClient):
+        """启动服务创建实例
+        Args:
+            nacos_client (NacosClient): nacos client
+        Raises:
+            Exception: 创建instance失败
+        """
+        local_ip = self.app.ctx.nacos_host.ip
+        res = await nacos_client.register_instance(
+            local_ip,
+            self.app.config.PORT,
+            self.app.config.NACOS_SERVICENAME,
+            namespaceId=self.app.config.NACOS_NAMESPACE,
+            groupName=self.app.config.NACOS_GROUP,
+            enabled=True, healthy=True, ephemeral=self.app.config.NACOS_EPHEMERAL
+        )
+        if 'ok' not in res[0]:
+            res = await nacos_client.cancellation_instance(
+                self.app.config.NACOS_SERVICENAME,
+                local_ip,
+                self.app.config.PORT,
+                namespaceId=self.app.config.NACOS_NAMESPACE,
+                groupName=self.app.config.NACOS_GROUP,
+                ephemeral=self.app.config.NACOS_EPHEMERAL
+            )
+            raise Exception(
+                f"create instance error, cancellation instance:{res[0]}")
+        await self.send_nacos_beat(
+            self.app.config.NACOS_HEARTBEAT_TASK,
+            self.app.config.NACOS_SERVICENAME,
+            beat={"ip": local_ip, "port": self.app.config.PORT},
+            groupName=self.app.config.NACOS_GROUP,
+            ephemeral=self.app.config.NACOS_EPHEMERAL
+        )
+
+    async def send_nacos_beat(
+        self,
+        task_name: str,
+        serviceName: str,
+        beat: dict,
+        groupName: Optional[str] = None,
+        ephemeral: bool = False
+    ):
+        """启动nacos心跳后台任务
+        Args:
+            serviceName (str): 服务名称
+            beat (dict): 心跳信息
+            groupName (str, optional): 组名称. Defaults to None.
+            ephemeral (bool, optional): 是否临时实例. Defaults to None.
+        """
+        self.app.add_task(self.nacos_beat(serviceName, beat, self.app.ctx.nacos_client,
+                          groupName, ephemeral), name=task_name)
+        threshold = self.app.config.get('NACOS_BEAT_THREAD_LAG')
+        if not threshold:
+            return
+        monitor = self.app.ctx.nacos_monitor
+        interval = self.app.config.get('NACOS_BEAT_INTERVAL', 5)
+
+        async def send(client: NacosClient):
+            if self.app.ctx.nacos_client.leader:
+                await client.send_beat(serviceName, beat, groupName, ephemeral)
+
+        def move_to_thread(lag: float):
+            # 事件循环延迟超过阈值后心跳改由独立线程发送，不再切回
+            if lag < threshold or getattr(self.app.ctx, 'nacos_beat_thread', None):
+                return
+            logger.info(f"事件循环延迟{lag * 1000:.1f}ms，nacos心跳切换至独立线程")
+            heartbeat = ThreadedHeartbeat(NacosClient, send, interval, monitor)
+            self.app.ctx.nacos_beat_thread = heartbeat
+            heartbeat.start()
+
+        monitor.on_lag.append(move_to_thread)
+
+    async def nacos_beat(
+        self,
+        serviceName: str,
+        beat: dict,
+        nacos_client: NacosClient,
+        groupName: Optional[str] = None,
+        ephemeral: bool = False
+    ):
+        interval = self.app.config.get('NACOS_BEAT_INTERVAL', 5)
+        while not getattr(self.app.ctx, 'nacos_beat_thread', None):
+            # 多worker共享缓存时同一实例只由leader发送心跳
+            if nacos_client.leader:
+                await nacos_client.send_beat(serviceName, beat, groupName, ephemeral)
+            if nacos_client.monitor is not None:
+                nacos_client.monitor.record_beat(interval)
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    async def create_nacose_config(app: Sanic):
+        """在服务器启动时将mysql及redis共享至nacos配置
+        Args:
+            app (Sanic): sanic app
+        Raises:
+            Exception: nacos配置错误
+            Exception: nacos配置错误
+        """
+        nacos_client = app.ctx.nacos_client
+        res = await nacos_client.get_config('redis', app.config.NACOS_GROUP, app.config.NACOS_NAMESPACE)
+        if 'config data not exist' in res[0]:
+            res = await nacos_client.publish_config(
+                'redis',
+                app.config.NACOS_GROUP,
+                {
+                    "host": app.config.REDIS_HOST,
+                    "port": app.config.REDIS_PORT,
+                    "password": app.config.REDIS_PASSWORD
+                },
+                app.config.NACOS_NAMESPACE
+            )
+            if not res:
+                raise Exception("create config error")
+        res = await nacos_client.get_config('mysql', app.config.NACOS_GROUP, app.config.NACOS_NAMESPACE)
+        if 'config data not exist' in res[0]:
+            res = await nacos_client.publish_config(
+                'mysql',
+                app.config.NACOS_GROUP,
+                {
+                    "host": app.config.DB_HOST,
+                    "port": app.config.DB_PORT,
+                    "username": app.config.DB_USER,
+                    "password": app.config.DB_PASSWORD,
+                    "db": app.config.DB_NAME
+                },
+                app.config.NACOS_NAMESPACE
+            )
+            if not res:
+                raise Exception("create config error")
+
+    @staticmethod
+    async def set_nacos_dependency(app: Sanic):
+        """通过sanic-ext dependency injection 添加nacos连接，并初始化本机注册地址
+        Args:
+            app (Sanic): sanic app
+        """
+        app.ctx.nacos_host = HostIdentity(
+            ip=app.config.get('NACOS_IP'),
+            interface=app.config.get('NACOS_INTERFACE'),
+            cidr=app.config.get('NACOS_CIDR'),
+            ipv6=app.config.get('NACOS_IPV6', False),
+        )
+        con_nacos = NacosClient()
+        con_nacos.load_snapshot()
+        if con_nacos.snapshot:
+            app.add_task(con_nacos.snapshot_loop(), name='nacos_snapshot')
+        app.add_task(con_nacos.watch_loop(), name='nacos_instance_watch')
+        monitor = LoopMonitor(
+            interval=app.config.get('NACOS_LOOP_MONITOR_INTERVAL', 0.5),
+            lag_threshold=app.config.get('NACOS_LOOP_LAG_THRESHOLD', 0.2),
+            stall_threshold=app.config.get('NACOS_STALL_THRESHOLD', 5.0),
+        )
+        con_nacos.monitor = monitor
+        app.ctx.nacos_monitor = monitor
+        app.add_task(monitor.run(), name='nacos_loop_monitor')
+        shm_name = getattr(app.shared_ctx, 'nacos_shm_name', None)
+        if shm_name is not None:
+            from config_helper.shared_cache import SharedRegistry, elect_leader
+
+            leader = elect_leader(app.shared_ctx.nacos_leader)
+            con_nacos.attach_shared(
+                SharedRegistry.attach(shm_name.value.decode()), leader, app.shared_ctx.nacos_interest
+            )
+            logger.info(f"nacos共享缓存：{shm_name.value.decode()}, leader:{leader}")
+            app.add_task(NacosPlugin.shared_cache_loop(app, con_nacos), name='nacos_shared_cache')
+            app.add_task(con_nacos.shared_config_loop(), name='nacos_shared_config')
+        app.ctx.nacos_client = con_nacos
+        app.ext.dependency(con_nacos)
+        discovery = DiscoveryClient(
+            con_nacos,
+            namespaceId=app.config.NACOS_NAMESPACE,
+            groupName=app.config.NACOS_GROUP,
+            http2=app.config.get('NACOS_DISCOVERY_HTTP2', False),
+            retries=app.config.get('NACOS_DISCOVERY_RETRIES', 1),
+        )
+        app.ctx.nacos_discovery = discovery
+        app.ext.dependency(discovery)
+
+    @staticmethod
+    async def create_shared_cache(app: Sanic):
+        """主进程创建多worker共享缓存及leader标识
+        Args:
+            app (Sanic): sanic app
+        """
+        import multiprocessing
+        from config_helper.shared_cache import SharedRegistry
+
+        registry = SharedRegistry.create(app.config.get('NACOS_SHARED_CACHE_SIZE', 4 * 1024 * 1024))
+        app.ctx.nacos_shared = registry
+        app.shared_ctx.nacos_shm_name = multiprocessing.Array('c', registry.name.encode())
+        app.shared_ctx.nacos_leader = multiprocessing.Value('i', 0)
+        # follower缓存未命中的键，由leader接管刷新
+        app.shared_ctx.nacos_interest = multiprocessing.Queue()
+
+    @staticmethod
+    async def close_shared_cache(app: Sanic):
+        """主进程退出时释放共享内存
+        Args:
+            app (Sanic): sanic app
+        """
+        registry = getattr(app.ctx, 'nacos_shared', None)
+        if registry is not None:
+            registry.close()
+
+    @staticmethod
+    async def shared_cache_loop(app: Sanic, nacos_client: NacosClient):
+        """leader接管follower提交的键并定期发布缓存，follower检测leader存活并在其退出后接替
+        Args:
+            app (Sanic): sanic app
+            nacos_client (NacosClient): nacos client
+        """
+        from config_helper.shared_cache import elect_leader
+
+        interval = app.config.get('NACOS_SHARED_CACHE_INTERVAL', 1)
+        while True:
+            nacos_client.set_leader(elect_leader(app.shared_ctx.nacos_leader))
+            await nacos_client.adopt_interest()
+            nacos_client.publish_shared()
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    async def create_load_table(app: Sanic):
+        """主进程创建多worker负载表，未启用共享缓存时同时创建leader标识，由leader汇总上报
+        Args:
+            app (Sanic): sanic app
+        """
+        import multiprocessing
+        from config_helper.load_reporter import WorkerLoads
+
+        app.shared_ctx.nacos_load = WorkerLoads.create(app.config.get('NACOS_LOAD_WORKER_SLOTS', 64))
+        if getattr(app.shared_ctx, 'nacos_leader', None) is None:
+            app.shared_ctx.nacos_leader = multiprocessing.Value('i', 0)
+
+    @staticmethod
+    def _release_inflight(ctx) -> None:
+        ctx.nacos_inflight -= 1
+
+    @staticmethod
+    async def track_request(request):
+        ctx = request.app.ctx
+        ctx.nacos_inflight = getattr(ctx, 'nacos_inflight', 0) + 1
+        # 客户端断开或处理被取消时response中间件不会执行，请求对象释放时兜底减一，只执行一次
+        request.ctx.nacos_release = weakref.finalize(request, NacosPlugin._release_inflight, ctx)
+
+    @staticmethod
+    async def track_response(request, response):
+        release = getattr(request.ctx, 'nacos_release', None)
+        if release is not None:
+            release()
+
+    @staticmethod
+    async def start_load_reporter(app: Sanic):
+        """根据负载定期上报实例权重及健康状态，多worker时由leader汇总各worker的负载后上报
+        Args:
+            app (Sanic): sanic app
+        """
+        from config_helper.load_reporter import LoadReporter, WorkerLoads
+        from config_helper.shared_cache import elect_leader
+
+        app.ctx.nacos_inflight = getattr(app.ctx, 'nacos_inflight', 0)
+        interval = app.config.get('NACOS_LOAD_REPORT_INTERVAL', 5)
+        table = getattr(app.shared_ctx, 'nacos_load', None)
+
+        def leader() -> bool:
+            # 与心跳、共享缓存使用同一个leader
+            return elect_leader(app.shared_ctx.nacos_leader)
+
+        reporter = LoadReporter(
+            app.ctx.nacos_client,
+            app.config.NACOS_SERVICENAME,
+            app.ctx.nacos_host.ip,
+            app.config.PORT,
+            inflight=lambda: app.ctx.nacos_inflight,
+            monitor=app.ctx.nacos_monitor,
+            namespaceId=app.config.NACOS_NAMESPACE,
+            groupName=app.config.NACOS_GROUP,
+            ephemeral=app.config.NACOS_EPHEMERAL,
+            interval=interval,
+            max_weight=app.config.get('NACOS_WEIGHT', 1.0),
+            inflight_capacity=app.config.get('NACOS_LOAD_INFLIGHT_CAPACITY', 100),
+            lag_limit=app.config.get('NACOS_LOAD_LAG_LIMIT', 0.2),
+            cpu_limit=app.config.get('NACOS_LOAD_CPU_LIMIT', 0.9),
+            workers=WorkerLoads(table, ttl=interval * 3) if table is not None else None,
+            leader=leader,
+        )
+        app.ctx.nacos_load_reporter = reporter
+        app.add_task(reporter.run(), name='nacos_load_reporter')
+
+    @staticmethod
+    async def start_config_reloader(app: Sanic):
+        """加载NACOS_HOT_RELOAD绑定的nacos配置并监听变更，热更新app.config
+        NACOS_HOT_RELOAD示例：[{"dataId": "redis", "key": "REDIS"}, {"dataId": "tuning.properties", "prefix": "TUNING_"}]
+        可选项：group（默认NACOS_GROUP）、key、prefix、type；变更回调通过app.ctx.nacos_reloader.on_change注册
+        Args:
+            app (Sanic): sanic app
+        """
+        from config_helper.hot_reload import ConfigReloader
+
+        reloader = ConfigReloader(
+            app.ctx.nacos_client,
+            app.config,
+            timeout=app.config.get('NACOS_HOT_RELOAD_TIMEOUT', 30000),
+        )
+        for binding in app.config.NACOS_HOT_RELOAD:
+            reloader.bind(
+                binding['dataId'],
+                binding.get('group', app.config.NACOS_GROUP),
+                app.config.NACOS_NAMESPACE,
+                key=binding.get('key'),
+                prefix=binding.get('prefix', ''),
+                type=binding.get('type'),
+            )
+        await reloader.load()
+        app.ctx.nacos_reloader = reloader
+        app.ext.dependency(reloader)
+        app.add_task(reloader.run(), name='nacos_config_reload')
+
+    @staticmethod
+    async def cancellation_nacos(app: Sanic):
+        """服务停止，在NACOS_SHUTDOWN_TIMEOUT内停止心跳及后台任务、注销nacos实例，
+        等待NACOS_DEREGISTER_GRACE秒让调用方刷新实例列表后再等待请求完成并关闭连接
+        Args:
+            app (Sanic): sanic app
+        """
+        nacos_client = app.ctx.nacos_client
+
+        async def deregister():
+            return await nacos_client.cancellation_instance(
+                app.config.NACOS_SERVICENAME,
+                app.ctx.nacos_host.ip,
+                app.config.PORT,
+                namespaceId=app.config.NACOS_NAMESPACE,
+                groupName=app.config.NACOS_GROUP,
+                ephemeral=app.config.NACOS_EPHEMERAL
+            )
+
+        coordinator = ShutdownCoordinator(
+            app,
+            nacos_client,
+            [app.config.NACOS_HEARTBEAT_TASK, *NacosPlugin.BACKGROUND_TASKS],
+            deregister=deregister,
+            timeout=app.config.get('NACOS_SHUTDOWN_TIMEOUT', 10),
+            closers=[app.ctx.nacos_discovery.close, NacosPlugin.close_qlog],
+            heartbeat=getattr(app.ctx, 'nacos_beat_thread', None),
+            grace=app.config.get('NACOS_DEREGISTER_GRACE', 3),
+        )
+        await coordinator.run()
+
+    @staticmethod
+    async def close_qlog():
+        """写出尚未落盘的qlog，仅在HTTP/3模块已加载时执行"""
+        qlog = sys.modules.get('http3_helper.qlog')
+        if qlog is not None:
+            await asyncio.get_running_loop().run_in_executor(None, qlog.close_quic_logger)
+
+    def included(self):
+        return self.app.config.NACOS
+
+
+Extend.register(NacosPlugin)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import pickle
+import struct
+
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
+
+from utils import logger
+
+# 头部：版本号(奇数表示写入中) + 数据长度
+HEADER = struct.Struct("QQ")
+
+
+class SharedRegistry:
+    """多worker共享的nacos缓存，leader写入共享内存，其余worker只读
+
+    使用seqlock保证一致性：写入前后各自增一次版本号，读取方版本号未变化时直接返回
+    上次解码的对象，变化时基于memoryview解码并校验版本号，不复制共享内存。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool = False) -> None:
+        self.shm = shm
+        self.owner = owner
+        self._version = 0
+        self._payload: Optional[dict] = None
+
+    @classmethod
+    def create(cls, size: int) -> "SharedRegistry":
+        shm = shared_memory.SharedMemory(create=True, size=HEADER.size + size)
+        HEADER.pack_into(shm.buf, 0, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedRegistry":
+        shm = shared_memory.SharedMemory(name=name)
+        # 由创建方负责unlink，避免worker退出时resource_tracker提前回收
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return cls(shm)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def capacity(self) -> int:
+        return self.shm.size - HEADER.size
+
+    @property
+    def version(self) -> int:
+        return HEADER.unpack_from(self.shm.buf, 0)[0]
+
+    def publish(self, payload: dict) -> bool:
+        """写入缓存，仅leader调用
+        Returns:
+            bool: 数据超出共享内存容量时返回False
+        """
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.capacity:
+            logger.info(f"nacos共享缓存容量不足：{len(data)} > {self.capacity}")
+            return False
+        buf = self.shm.buf
+        version = self.version
+        # 上一个leader在写入中途退出时版本号停在奇数，先补齐为偶数，否则之后的版本号都是奇数
+        version += version & 1
+        HEADER.pack_into(buf, 0, version + 1, 0)
+        buf[HEADER.size:HEADER.size + len(data)] = data
+        HEADER.pack_into(buf, 0, version + 2, len(data))
+        return True
+
+    def read(self) -> Optional[dict]:
+        """读取缓存，版本未变化时返回上次解码的对象"""
+        buf = self.shm.buf
+        version, length = HEADER.unpack_from(buf, 0)
+        if version == self._version or version % 2 or not length:
+            return self._payload
+        view = buf[HEADER.size:HEADER.size + length]
+        try:
+            payload = pickle.loads(view)
+        except Exception:
+            return self._payload
+        finally:
+            view.release()
+        if HEADER.unpack_from(buf, 0)[0] != version:
+            return self._payload
+        self._version, self._payload = version, payload
+        return payload
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def elect_leader(leader: "multiprocessing.sharedctypes.Synchronized") -> bool:
+    """竞选leader，当前leader进程不存在时由调用方接替
+    Args:
+        leader: 保存leader进程pid的共享Value
+    Returns:
+        bool: 当前进程是否为leader
+    """
+    pid = os.getpid()
+    with leader.get_lock():
+        if leader.value == pid:
+            return True
+        if leader.value:
+            try:
+                os.kill(leader.value, 0)
+                return False
+            except ProcessLookupError:
+                logger.info(f"nacos leader进程 {leader.value} 已退出，由 {pid} 接替")
+            except PermissionError:
+                return False
+        leader.value = pid
+        return True
@@ -0,0 +1,87 @@
+import asyncio
+
+from typing import TYPE_CHECKING, Awaitable, Callable, Iterable, Optional
+
+from utils import logger
+
+if TYPE_CHECKING:
+    from sanic import Sanic
+
+
+class ShutdownCoordinator:
+    """在截止时间内有序关闭nacos相关资源
+
+    顺序：停止心跳及后台任务 -> 注销实例 -> 等待grace秒，订阅方感知实例下线、不再分配新请求 -> 等待进行中的请求完成
+    -> 写入快照、输出指标 -> 关闭服务发现客户端及连接池。
+    每一步只使用剩余时间，超时后跳过并继续下一步，保证worker在限定时间内退出。
+    """
+
+    def __init__(
+        self,
+        app: "Sanic",
+        nacos_client,
+        task_names: Iterable[str],
+        deregister: Optional[Callable[[], Awaitable]] = None,
+        timeout: float = 10,
+        closers: Iterable[Callable[[], Awaitable]] = (),
+        heartbeat=None,
+        grace: float = 0,
+    ) -> None:
+        self.app = app
+        self.nacos_client = nacos_client
+        self.task_names = list(task_names)
+        self.deregister = deregister
+        self.timeout = timeout
+        self.closers = list(closers)
+        # ThreadedHeartbeat，stop()会join线程，在线程池中执行
+        self.heartbeat = heartbeat
+        # 注销后等待订阅方刷新实例列表的时间，期间仍正常处理请求
+        self.grace = grace
+        self._deadline = 0.0
+
+    def remaining(self) -> float:
+        return max(0.0, self._deadline - asyncio.get_running_loop().time())
+
+    async def _step(self, name: str, aw: Awaitable):
+        remaining = self.remaining()
+        if remaining <= 0:
+            logger.info(f"nacos关闭超时，跳过：{name}")
+            if asyncio.iscoroutine(aw):
+                aw.close()
+            return None
+        try:
+            return await asyncio.wait_for(aw, remaining)
+        except asyncio.TimeoutError:
+            logger.info(f"nacos关闭超时：{name}")
+        except Exception as e:
+            logger.info(f"nacos关闭异常：{name}, {e}")
+        return None
+
+    async def _cancel_task(self, name: str) -> None:
+        try:
+            await self.app.cancel_task(name)
+        except Exception:
+            return
+        logger.info(f"stop 【{name}】 task.")
+
+    async def run(self) -> None:
+        self._deadline = asyncio.get_running_loop().time() + self.timeout
+        nacos_client = self.nacos_client
+        if self.heartbeat is not None:
+            loop = asyncio.get_running_loop()
+            await self._step("stop heartbeat", loop.run_in_executor(None, self.heartbeat.stop))
+        for name in self.task_names:
+            await self._step(f"cancel {name}", self._cancel_task(name))
+        if self.deregister is not None:
+            res = await self._step("deregister", self.deregister())
+            logger.info(f"cancellation instance:{res[0] if res else res}")
+            if self.grace > 0:
+                # 至多占用剩余时间的一半，留给后续的等待请求完成及关闭连接
+                await self._step("grace", asyncio.sleep(min(self.grace, self.remaining() / 2)))
+        await self._step("drain", nacos_client.drain())
+        if nacos_client.snapshot:
+            await self._step("snapshot", nacos_client.save_snapshot(force=True))
+        logger.info(f"nacos metrics:{nacos_client.metrics()}")
+        for close in self.closers:
+            await self._step("close", close())
+        await self._step("close", nacos_client.close())
@@ -0,0 +1,40 @@
+import asyncio
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """并发相同请求合并：同一key同时只有一个请求在执行，其余调用共享其结果
+
+    请求以独立task运行，发起方被取消不会影响其他等待者。
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.stats: Dict[Hashable, Dict[str, int]] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = {"calls": 0, "coalesced": 0}
+        stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            stats["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def metrics(self) -> dict:
+        return {
+            "inflight": self.inflight,
+            "calls": sum(s["calls"] for s in self.stats.values()),
+            "coalesced": sum(s["coalesced"] for s in self.stats.values()),
+            "keys": {str(key): dict(s) for key, s in self.stats.items()},
+        }
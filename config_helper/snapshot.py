@@ -0,0 +1,68 @@
+import os
+import pickle
+import tempfile
+import time
+import zlib
+
+from typing import Optional
+
+from utils import logger
+
+SNAPSHOT_VERSION = 1
+
+
+class NacosSnapshot:
+    """nacos本地快照，进程重启时先从磁盘恢复配置及实例缓存
+
+    文件内容为 zlib 压缩后的 pickle 数据，写入时先写临时文件再 os.replace，
+    保证读取方任何时刻看到的都是完整快照。
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> Optional[dict]:
+        """读取快照
+        Returns:
+            Optional[dict]: 快照内容，文件不存在或损坏时返回None
+        """
+        try:
+            with open(self.path, "rb") as fp:
+                payload = pickle.loads(zlib.decompress(fp.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.info(f"读取nacos快照失败：{self.path}, {e}")
+            return None
+        if not isinstance(payload, dict) or payload.get("version") != SNAPSHOT_VERSION:
+            logger.info(f"nacos快照版本不匹配，忽略：{self.path}")
+            return None
+        return payload
+
+    def dump(self, configs: dict, instances: dict) -> None:
+        """原子写入快照
+        Args:
+            configs (dict): 配置缓存
+            instances (dict): 实例列表缓存
+        """
+        payload = {
+            "version": SNAPSHOT_VERSION,
+            "created": time.time(),
+            "configs": configs,
+            "instances": instances,
+        }
+        data = zlib.compress(pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".nacos-snapshot-")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,362 @@
+import asyncio
+import re
+import time
+import ujson as json
+
+from typing import TYPE_CHECKING, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+
+from config_helper.compression import check_encoding, compress, compress_stream
+from http3_helper import tracing
+from http3_helper.timing import RequestTiming
+from utils import logger
+from config import setting
+
+if TYPE_CHECKING:
+    import httpx
+    from config_helper.h3_transport import Http3Transport
+
+# httpcore trace事件 -> RequestTiming字段
+HTTPX_TRACE_MARKS = {
+    "send_request_headers.started": "stream_open",
+    "send_request_body.complete": "request_sent",
+    "receive_response_headers.complete": "first_header",
+    "receive_response_body.started": "first_body",
+    "response_closed.started": "end",
+}
+
+ALT_SVC_H3 = re.compile(r'(h3(?:-\d+)?)="([^"]*)"(?:\s*;\s*ma=(\d+))?')
+
+# 重发不会产生额外副作用的请求方法
+IDEMPOTENT_METHODS = frozenset(("GET", "HEAD", "PUT", "DELETE", "OPTIONS"))
+
+
+class TransportConnectError(ConnectionError):
+    """建立连接失败，请求尚未发出，可以安全地换用其他传输层重发"""
+
+
+class TransportResponse:
+    """传输层统一响应"""
+
+    __slots__ = ("status_code", "headers", "content", "elapsed", "http_version", "timing")
+
+    def __init__(
+        self,
+        status_code: int,
+        headers: Dict[str, str],
+        content: bytes,
+        elapsed: float,
+        http_version: str,
+        timing: Optional[RequestTiming] = None,
+    ) -> None:
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+        self.http_version = http_version
+        # 各阶段耗时，见RequestTiming
+        self.timing = timing
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+Body = Union[bytes, AsyncIterable[bytes]]
+
+
+def normalize_headers(headers: Optional[dict]) -> Dict[str, str]:
+    return {str(k).lower(): str(v) for k, v in headers.items()} if headers else {}
+
+
+def form_value(value) -> str:
+    # 与httpx的表单编码保持一致
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if value is None:
+        return ""
+    return str(value)
+
+
+def encode_form(data: dict) -> str:
+    return urlencode({k: form_value(v) for k, v in data.items()})
+
+
+class Transport:
+    """异步HTTP传输层接口，NacosClient通过它发送请求，与具体协议无关
+
+    params 编码进查询串，data 按表单编码，content 为原始请求体。
+    profile 为QUIC连接参数（见http3_helper.profiles），只有HTTP/3传输层使用，其他传输层忽略。
+    """
+
+    name = "base"
+
+    def __init__(self, request_encoding: Optional[str] = None, compress_threshold: int = 1024) -> None:
+        """
+        Args:
+            request_encoding (str, optional): 请求体压缩方式 gzip/zstd，需服务端或代理支持，默认不压缩
+            compress_threshold (int, optional): 请求体达到该字节数才压缩，流式请求体总是压缩
+        """
+        self.request_encoding = check_encoding(request_encoding)
+        self.compress_threshold = compress_threshold
+
+    def encode_body(self, data: Optional[dict], content: Optional[Body], headers: Dict[str, str]) -> Optional[Body]:
+        """表单编码并按需压缩请求体
+        Returns:
+            bytes或bytes异步迭代器
+        """
+        if data is not None:
+            content = encode_form(data).encode()
+            headers.setdefault("content-type", "application/x-www-form-urlencoded")
+        if not self.request_encoding or content is None:
+            return content
+        if isinstance(content, bytes):
+            if len(content) < self.compress_threshold:
+                return content
+            content = compress(content, self.request_encoding)
+        else:
+            content = compress_stream(content, self.request_encoding)
+        headers["content-encoding"] = self.request_encoding
+        return content
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        data: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        content: Optional[Body] = None,
+        timeout: float = 30,
+        profile: Optional[str] = None,
+    ) -> TransportResponse:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpxTransport(Transport):
+    """基于httpx连接池的HTTP/1.1、HTTP/2传输层，httpx在首次请求时导入"""
+
+    name = "httpx"
+
+    def __init__(
+        self,
+        base_url: str,
+        http2: bool = False,
+        limits: Optional["httpx.Limits"] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.base_url = base_url
+        self.http2 = http2
+        self.limits = limits
+        self._client: Optional["httpx.AsyncClient"] = None
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            limits = self.limits or httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            self._client = httpx.AsyncClient(base_url=self.base_url, http2=self.http2, limits=limits)
+        return self._client
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        data: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        content: Optional[Body] = None,
+        timeout: float = 30,
+        profile: Optional[str] = None,
+    ) -> TransportResponse:
+        timing = RequestTiming()
+
+        async def trace(name: str, info: dict) -> None:
+            # 异步客户端的httpcore要求trace回调为协程函数
+            mark = HTTPX_TRACE_MARKS.get(name.partition(".")[2])
+            if mark is not None:
+                timing.mark(mark)
+
+        headers = normalize_headers(headers)
+        if self.request_encoding or content is not None:
+            content, data = self.encode_body(data, content, headers), None
+        response = await self.client.request(
+            method,
+            url,
+            params=params,
+            data=data,
+            content=content,
+            headers=headers,
+            timeout=timeout,
+            extensions={"trace": trace},
+        )
+        timing.mark("end")
+        return TransportResponse(
+            response.status_code,
+            dict(response.headers),
+            response.content,
+            response.elapsed.total_seconds(),
+            response.http_version,
+            timing,
+        )
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+Handler = Callable[..., Union[TransportResponse, Tuple[int, Union[str, bytes, dict, list]], Awaitable]]
+
+
+class MemoryTransport(Transport):
+    """内存传输层，不发起网络请求，按 (method, path) 注册处理函数，供测试使用
+
+    处理函数接收 (method, url, params, data, headers, content)，可返回 TransportResponse
+    或 (status_code, body)，body 为 dict/list 时按json编码。
+    """
+
+    name = "memory"
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.handlers: Dict[Tuple[str, str], Handler] = {}
+        self.requests: List[dict] = []
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self.handlers[(method.upper(), path)] = handler
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        params: Optional[dict] = None,
+        data: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        content: Optional[Body] = None,
+        timeout: float = 30,
+        profile: Optional[str] = None,
+    ) -> TransportResponse:
+        start = time.perf_counter()
+        if content is not None and not isinstance(content, bytes):
+            content = b"".join([chunk async for chunk in content])
+        self.requests.append(
+            {"method": method, "url": url, "params": params, "data": data, "headers": headers, "content": content}
+        )
+        handler = self.handlers.get((method.upper(), urlsplit(url).path))
+        if handler is None:
+            return TransportResponse(404, {}, b"not found", 0.0, "memory")
+        ret = handler(method, url, params, data, headers, content)
+        if asyncio.iscoroutine(ret):
+            ret = await ret
+        if isinstance(ret, TransportResponse):
+            return ret
+        status_code, body = ret
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode()
+        return TransportResponse(status_code, {}, body, time.perf_counter() - start, "memory")
+
+
+class AutoTransport(Transport):
+    """先走httpx，服务端通过Alt-Svc声明支持h3后切换到HTTP/3，HTTP/3失败时回退httpx直到通告过期
+
+    HTTP/3失败后的回退只在请求未发出（连接失败）或可安全重发（幂等方法且请求体不是流）时进行，
+    否则抛出原异常，避免重复提交或发送不完整的流式请求体。
+    """
+
+    name = "auto"
+
+    def __init__(self, base_url: str, http2: bool = False, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.kwargs = kwargs
+        self.http = HttpxTransport(base_url, http2=http2, **kwargs)
+        self.host = urlsplit(base_url).hostname
+        self.h3: Optional["Http3Transport"] = None
+        self._h3_expires = 0.0
+        # HTTP/3失败后在该时间（原通告过期时间）之前不再协商
+        self._h3_retry_at = 0.0
+
+    def _negotiate(self, response: TransportResponse) -> None:
+        alt_svc = response.headers.get("alt-svc")
+        if not alt_svc or self.h3 is not None or time.monotonic() < self._h3_retry_at:
+            return
+        match = ALT_SVC_H3.search(alt_svc)
+        if not match:
+            return
+        from config_helper.h3_transport import Http3Transport
+
+        host, _, port = match.group(2).rpartition(":")
+        self.h3 = Http3Transport(host or self.host, int(port), **self.kwargs)
+        self._h3_expires = time.monotonic() + int(match.group(3) or 86400)
+        logger.info(f"Alt-Svc协商切换至HTTP/3：{self.h3.authority}")
+
+    async def request(self, method: str, url: str, **kwargs) -> TransportResponse:
+        h3 = self.h3
+        if h3 is not None and time.monotonic() >= self._h3_expires:
+            # 通告过期：关闭QUIC连接，之后按响应中的Alt-Svc重新协商
+            logger.info(f"Alt-Svc已过期，关闭HTTP/3连接：{h3.authority}")
+            self.h3 = None
+            await h3.close()
+            h3 = None
+        if h3 is not None:
+            try:
+                return await h3.request(method, url, **kwargs)
+            except Exception as e:
+                self.h3 = None
+                self._h3_retry_at = self._h3_expires
+                await h3.close()
+                content = kwargs.get("content")
+                replayable = method.upper() in IDEMPOTENT_METHODS and (content is None or isinstance(content, bytes))
+                if not isinstance(e, TransportConnectError) and not replayable:
+                    logger.info(f"HTTP/3请求失败，请求可能已发出，不回退httpx：{e}")
+                    raise
+                logger.info(f"HTTP/3请求失败，回退httpx：{e}")
+                span = tracing.current_span()
+                span.add_event("http3_fallback", {"error.type": type(e).__name__})
+                span.set_attribute("nacos.retries", 1)
+        response = await self.http.request(method, url, **kwargs)
+        self._negotiate(response)
+        return response
+
+    async def close(self) -> None:
+        if self.h3 is not None:
+            await self.h3.close()
+        await self.http.close()
+
+
+def create_transport(kind: Optional[str] = None, ssl: bool = False) -> Transport:
+    """按名称创建传输层，HTTP/3相关依赖仅在使用时导入
+    Args:
+        kind (str, optional): httpx/http3/auto/memory，默认ssl时使用http3，否则httpx
+        ssl (bool, optional): 是否使用https
+    """
+    kind = kind or ("http3" if ssl else "httpx")
+    base_url = f"{'https://' if ssl else 'http://'}{setting.NACOS_HOST}:{setting.NACOS_PORT}"
+    http2 = getattr(setting, "NACOS_HTTP2", False)
+    kwargs = {
+        "request_encoding": getattr(setting, "NACOS_REQUEST_ENCODING", None),
+        "compress_threshold": getattr(setting, "NACOS_COMPRESS_THRESHOLD", 1024),
+    }
+    if kind == "httpx":
+        return HttpxTransport(base_url, http2=http2, **kwargs)
+    if kind == "http3":
+        from config_helper.h3_transport import Http3Transport
+
+        return Http3Transport(setting.NACOS_HOST, int(setting.NACOS_PORT), **kwargs)
+    if kind == "auto":
+        return AutoTransport(base_url, http2=http2, **kwargs)
+    if kind == "memory":
+        return MemoryTransport(**kwargs)
+    raise ValueError(f"unknown transport: {kind}")
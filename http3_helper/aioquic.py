@@ -1,20 +1,14 @@
 import asyncio
-import os
-import pickle
-import ssl
-import time
-import wsproto
-import wsproto.events
 import aioquic
 import ujson as json
 
 from collections import deque
-from typing import Callable, Deque, Dict, List, Optional, Tuple, Union, cast
+from functools import lru_cache
+from typing import TYPE_CHECKING, AsyncIterable, Callable, Deque, Dict, List, Optional, Tuple, Union
 from urllib.parse import urlparse
-from aioquic.asyncio.client import connect
 from aioquic.asyncio.protocol import QuicConnectionProtocol
-from aioquic.h0.connection import H0_ALPN, H0Connection
-from aioquic.h3.connection import H3_ALPN, ErrorCode, H3Connection
+from aioquic.h0.connection import H0Connection
+from aioquic.h3.connection import H3Connection
 from aioquic.h3.events import (
     DataReceived,
     H3Event,
@@ -23,18 +17,92 @@ from aioquic.h3.events import (
 )
 from aioquic.quic.configuration import QuicConfiguration
 from aioquic.quic.events import QuicEvent
-from aioquic.quic.logger import QuicFileLogger
-from aioquic.tls import CipherSuite, SessionTicket
-from typing import Optional
-from sanic.log import logger
+from aioquic.tls import SessionTicket
+from utils import logger
+
+if TYPE_CHECKING:
+    import wsproto.events
 
 from config import setting
+from http3_helper.timing import RequestTiming, TimingAggregator
+from http3_helper.tracing import enabled as tracing_enabled, inject, start_span
+from http3_helper.udp import BatchedDatagramTransport
 
 # reference: https://github.com/aiortc/aioquic/blob/239f99b8a3d4f5bc88cb280df765f35722cefe57/examples/http3_client.py#L247
 
 HttpConnection = Union[H0Connection, H3Connection]
 
 USER_AGENT = "aioquic/" + aioquic.__version__
+USER_AGENT_HEADER = (b"user-agent", USER_AGENT.encode())
+
+
+@lru_cache(maxsize=256)
+def pseudo_headers(method: str, scheme: str, authority: str) -> Tuple[Tuple[bytes, bytes], ...]:
+    """
+    Encoded :method, :scheme and :authority, shared by every request to the
+    same origin.
+    """
+    return (
+        (b":method", method.encode()),
+        (b":scheme", scheme.encode()),
+        (b":authority", authority.encode()),
+    )
+
+
+@lru_cache(maxsize=1024)
+def encode_header(name: str, value: str) -> Tuple[bytes, bytes]:
+    return name.encode(), value.encode()
+
+
+# headers whose values change from request to request: they are encoded
+# directly so they neither miss nor evict the cached entries
+VOLATILE_HEADERS = frozenset(("content-length", "traceparent", "tracestate", "baggage"))
+
+
+@lru_cache(maxsize=512)
+def static_headers(
+    method: str, scheme: str, authority: str, headers: Tuple[Tuple[str, str], ...]
+) -> Tuple[Tuple[bytes, bytes], ...]:
+    """
+    Encoded :method, :scheme, :authority, user-agent and stable request
+    headers, shared by all requests to the same origin sending the same set.
+    """
+    return (
+        *pseudo_headers(method, scheme, authority),
+        USER_AGENT_HEADER,
+        *(encode_header(k, v) for k, v in headers),
+    )
+
+
+def header_block(
+    method: str,
+    scheme: str,
+    authority: str,
+    full_path: str,
+    headers: Tuple[Tuple[str, str], ...],
+) -> List[Tuple[bytes, bytes]]:
+    """
+    Build the encoded header list for a request. Everything but :path (which
+    carries the query) and volatile headers such as content-length or the
+    trace context comes from one cache keyed by origin and header set; those
+    are encoded per request. :path goes first since pseudo-headers only have
+    to precede the regular fields. Header names must be lowercase, as HTTP/3
+    requires.
+    """
+    block = [(b":path", full_path.encode())]
+    if not headers:
+        block += static_headers(method, scheme, authority, ())
+        return block
+    static = []
+    volatile = []
+    for name, value in headers:
+        if name in VOLATILE_HEADERS:
+            volatile.append((name.encode(), value.encode()))
+        else:
+            static.append((name, value))
+    block += static_headers(method, scheme, authority, tuple(static))
+    block += volatile
+    return block
 
 
 class URL:
@@ -65,6 +133,37 @@ class HttpRequest:
         self.url = url
 
 
+def request_attributes(request: HttpRequest) -> Dict[str, Union[str, int]]:
+    return {
+        "http.request.method": request.method,
+        "server.address": request.url.authority,
+        "url.path": request.url.full_path,
+        "network.protocol.version": "3",
+        "network.transport": "quic",
+    }
+
+
+def record_response(span, stream_id: int, sent: int, events: Deque[H3Event]) -> None:
+    """
+    Add stream id, status and body sizes of a finished request to `span`.
+    """
+    if not span.is_recording():
+        return
+    received = 0
+    for event in events:
+        if type(event) is DataReceived:
+            received += len(event.data)
+        elif type(event) is HeadersReceived:
+            for name, value in event.headers:
+                if name == b":status":
+                    span.set_attribute("http.response.status_code", int(value))
+    span.set_attributes({
+        "quic.stream_id": stream_id,
+        "http.request.body.size": sent,
+        "http.response.body.size": received,
+    })
+
+
 class WebSocket:
     def __init__(
         self, http: HttpConnection, stream_id: int, transmit: Callable[[], None]
@@ -74,15 +173,18 @@ class WebSocket:
         self.stream_id = stream_id
         self.subprotocol: Optional[str] = None
         self.transmit = transmit
+        # wsproto is only needed once a websocket is opened
+        import wsproto
+
         self.websocket = wsproto.Connection(wsproto.ConnectionType.CLIENT)
 
     async def close(self, code: int = 1000, reason: str = "") -> None:
         """
         Perform the closing handshake.
         """
-        data = self.websocket.send(
-            wsproto.events.CloseConnection(code=code, reason=reason)
-        )
+        from wsproto.events import CloseConnection
+
+        data = self.websocket.send(CloseConnection(code=code, reason=reason))
         self.http.send_data(stream_id=self.stream_id,
                             data=data, end_stream=True)
         self.transmit()
@@ -99,61 +201,152 @@ class WebSocket:
         """
         assert isinstance(message, str)
 
-        data = self.websocket.send(wsproto.events.TextMessage(data=message))
+        from wsproto.events import TextMessage
+
+        data = self.websocket.send(TextMessage(data=message))
         self.http.send_data(stream_id=self.stream_id,
                             data=data, end_stream=False)
         self.transmit()
 
     def http_event_received(self, event: H3Event) -> None:
-        if isinstance(event, HeadersReceived):
+        if type(event) is DataReceived:
+            self.websocket.receive_data(event.data)
+        elif type(event) is HeadersReceived:
             for header, value in event.headers:
                 if header == b"sec-websocket-protocol":
                     self.subprotocol = value.decode()
-        elif isinstance(event, DataReceived):
-            self.websocket.receive_data(event.data)
 
         for ws_event in self.websocket.events():
             self.websocket_event_received(ws_event)
 
-    def websocket_event_received(self, event: wsproto.events.Event) -> None:
-        if isinstance(event, wsproto.events.TextMessage):
+    def websocket_event_received(self, event: "wsproto.events.Event") -> None:
+        from wsproto.events import TextMessage
+
+        if isinstance(event, TextMessage):
             self.queue.put_nowait(event.data)
 
 
 class HttpClient(QuicConnectionProtocol):
+    # bytes a streamed request body may have queued (unsent or unacknowledged)
+    # in aioquic before the next chunk is read
+    max_stream_buffer = 1024 * 1024
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
         self.pushes: Dict[int, Deque[H3Event]] = {}
         self._http: Optional[HttpConnection] = None
-        self._request_events: Dict[int, Deque[H3Event]] = {}
-        self._request_waiter: Dict[int, asyncio.Future[Deque[H3Event]]] = {}
-        self._websockets: Dict[int, WebSocket] = {}
+        # stream id -> handler, shared by requests and websockets so that
+        # each frame costs a single lookup
+        self._stream_handlers: Dict[int, Callable[[H3Event], None]] = {}
+        self._event_handlers: Dict[type, Callable[[H3Event], None]] = {
+            DataReceived: self._stream_event_received,
+            HeadersReceived: self._stream_event_received,
+            PushPromiseReceived: self._push_promise_received,
+        }
 
         if self._quic.configuration.alpn_protocols[0].startswith("hq-"):
             self._http = H0Connection(self._quic)
         else:
             self._http = H3Connection(self._quic)
+        self._batched: Optional[BatchedDatagramTransport] = None
+        self._drain_waiters: List["asyncio.Future[None]"] = []
+
+    def use_batched_send(self, sock) -> None:
+        """
+        Coalesce the datagrams of each transmit() with UDP GSO on `sock`,
+        the socket underlying this protocol's transport.
+        """
+        self._batched = BatchedDatagramTransport(self._transport, sock)
+        self._transport = self._batched
 
-    async def get(self, url: str, headers: Optional[Dict] = None) -> Deque[H3Event]:
+    def transmit(self) -> None:
+        batched = self._batched
+        if batched is None:
+            super().transmit()
+        else:
+            batched.begin()
+            try:
+                super().transmit()
+            finally:
+                batched.flush()
+        # transmit() runs after every received datagram, i.e. after ACKs
+        # which may have freed stream send buffers
+        if self._drain_waiters:
+            waiters, self._drain_waiters = self._drain_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    def _stream_buffered(self, stream_id: int) -> int:
+        stream = self._quic._streams.get(stream_id)
+        if stream is None:
+            return 0
+        sender = stream.sender
+        return sender._buffer_stop - sender._buffer_start
+
+    async def _wait_writable(self, stream_id: int) -> None:
+        """
+        Wait until the stream's send buffer is below `max_stream_buffer`.
+        """
+        while self._stream_buffered(stream_id) > self.max_stream_buffer and not self.closed:
+            waiter = self._loop.create_future()
+            self._drain_waiters.append(waiter)
+            # the timeout covers a connection that dies without transmitting
+            await asyncio.wait([waiter], timeout=0.1)
+
+    async def get(
+        self,
+        url: str,
+        headers: Optional[Dict] = None,
+        timing: Optional[RequestTiming] = None,
+    ) -> Deque[H3Event]:
         """
         Perform a GET request.
         """
         return await self._request(
-            HttpRequest(method="GET", url=URL(url), headers=headers)
+            HttpRequest(method="GET", url=URL(url), headers=headers), timing
         )
 
     async def post(
-        self, url: str, data: bytes, headers: Optional[Dict] = None
+        self,
+        url: str,
+        data: bytes,
+        headers: Optional[Dict] = None,
+        timing: Optional[RequestTiming] = None,
     ) -> Deque[H3Event]:
         """
         Perform a POST request.
         """
         return await self._request(
             HttpRequest(method="POST", url=URL(url),
-                        content=data, headers=headers)
+                        content=data, headers=headers), timing
         )
 
+    async def request(
+        self,
+        method: str,
+        url: str,
+        content: bytes = b"",
+        headers: Optional[Dict] = None,
+        timing: Optional[RequestTiming] = None,
+    ) -> Deque[H3Event]:
+        """
+        Perform a request with an arbitrary method. If `timing` is given,
+        its phases are filled in as the stream progresses.
+        """
+        return await self._request(
+            HttpRequest(method=method, url=URL(url),
+                        content=content, headers=headers), timing
+        )
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the underlying QUIC connection has terminated.
+        """
+        return self._closed.is_set()
+
     async def websocket(
         self, url: str, subprotocols: Optional[List[str]] = None
     ) -> WebSocket:
@@ -166,7 +359,7 @@ class HttpClient(QuicConnectionProtocol):
             http=self._http, stream_id=stream_id, transmit=self.transmit
         )
 
-        self._websockets[stream_id] = websocket
+        self._stream_handlers[stream_id] = websocket.http_event_received
 
         headers = [
             (b":method", b"CONNECT"),
@@ -188,28 +381,45 @@ class HttpClient(QuicConnectionProtocol):
         return websocket
 
     def http_event_received(self, event: H3Event) -> None:
-        if isinstance(event, (HeadersReceived, DataReceived)):
-            stream_id = event.stream_id
-            if stream_id in self._request_events:
-                # http
-                self._request_events[event.stream_id].append(event)
-                if event.stream_ended:
-                    request_waiter = self._request_waiter.pop(stream_id)
-                    request_waiter.set_result(
-                        self._request_events.pop(stream_id))
+        handler = self._event_handlers.get(type(event))
+        if handler is not None:
+            handler(event)
+
+    def _stream_event_received(self, event: H3Event) -> None:
+        handler = self._stream_handlers.get(event.stream_id)
+        if handler is not None:
+            # http / websocket
+            handler(event)
+        elif event.push_id in self.pushes:
+            # push
+            self.pushes[event.push_id].append(event)
 
-            elif stream_id in self._websockets:
-                # websocket
-                websocket = self._websockets[stream_id]
-                websocket.http_event_received(event)
+    def _push_promise_received(self, event: PushPromiseReceived) -> None:
+        self.pushes[event.push_id] = deque()
+        self.pushes[event.push_id].append(event)
 
-            elif event.push_id in self.pushes:
-                # push
-                self.pushes[event.push_id].append(event)
+    def _register_request(
+        self, stream_id: int, timing: Optional[RequestTiming] = None
+    ) -> "asyncio.Future[Deque[H3Event]]":
+        events: Deque[H3Event] = deque()
+        waiter = self._loop.create_future()
 
-        elif isinstance(event, PushPromiseReceived):
-            self.pushes[event.push_id] = deque()
-            self.pushes[event.push_id].append(event)
+        def handler(event: H3Event) -> None:
+            events.append(event)
+            if timing is not None:
+                if type(event) is DataReceived:
+                    timing.mark("first_body")
+                else:
+                    timing.mark("first_header")
+                if event.stream_ended:
+                    timing.mark("end")
+            if event.stream_ended:
+                del self._stream_handlers[stream_id]
+                if not waiter.done():
+                    waiter.set_result(events)
+
+        self._stream_handlers[stream_id] = handler
+        return waiter
 
     def quic_event_received(self, event: QuicEvent) -> None:
         #  pass event to the HTTP layer
@@ -217,31 +427,87 @@ class HttpClient(QuicConnectionProtocol):
             for http_event in self._http.handle_event(event):
                 self.http_event_received(http_event)
 
-    async def _request(self, request: HttpRequest) -> Deque[H3Event]:
-        stream_id = self._quic.get_next_available_stream_id()
-        self._http.send_headers(
-            stream_id=stream_id,
-            headers=[
-                (b":method", request.method.encode()),
-                (b":scheme", request.url.scheme.encode()),
-                (b":authority", request.url.authority.encode()),
-                (b":path", request.url.full_path.encode()),
-                (b"user-agent", USER_AGENT.encode()),
-            ]
-            + [(k.encode(), v.encode()) for (k, v) in request.headers.items()],
-            end_stream=not request.content,
+    async def stream_request(
+        self,
+        method: str,
+        url: str,
+        chunks: AsyncIterable[bytes],
+        headers: Optional[Dict] = None,
+        timing: Optional[RequestTiming] = None,
+    ) -> Deque[H3Event]:
+        """
+        Perform a request whose body is sent chunk by chunk as it is produced.
+        """
+        request = HttpRequest(method=method, url=URL(url), headers=headers)
+        with start_span(f"HTTP {method}", request_attributes(request)) as span:
+            if tracing_enabled():
+                request.headers = inject(dict(request.headers))
+            stream_id = self._quic.get_next_available_stream_id()
+            self._http.send_headers(
+                stream_id=stream_id,
+                headers=self._request_headers(request),
+                end_stream=False,
+            )
+            if timing is not None:
+                timing.mark("stream_open")
+            waiter = self._register_request(stream_id, timing)
+            self.transmit()
+
+            sent = 0
+            async for chunk in chunks:
+                if chunk:
+                    sent += len(chunk)
+                    self._http.send_data(
+                        stream_id=stream_id, data=chunk, end_stream=False)
+                    self.transmit()
+                    # backpressure: aioquic would otherwise buffer the whole body
+                    await self._wait_writable(stream_id)
+            self._http.send_data(stream_id=stream_id, data=b"", end_stream=True)
+            self.transmit()
+            if timing is not None:
+                timing.mark("request_sent")
+
+            events = await asyncio.shield(waiter)
+            record_response(span, stream_id, sent, events)
+            return events
+
+    def _request_headers(self, request: HttpRequest) -> List[Tuple[bytes, bytes]]:
+        url = request.url
+        return header_block(
+            request.method,
+            url.scheme,
+            url.authority,
+            url.full_path,
+            tuple(request.headers.items()) if request.headers else (),
         )
-        if request.content:
-            self._http.send_data(
-                stream_id=stream_id, data=request.content, end_stream=True
+
+    async def _request(
+        self, request: HttpRequest, timing: Optional[RequestTiming] = None
+    ) -> Deque[H3Event]:
+        with start_span(f"HTTP {request.method}", request_attributes(request)) as span:
+            if tracing_enabled():
+                request.headers = inject(dict(request.headers))
+            stream_id = self._quic.get_next_available_stream_id()
+            self._http.send_headers(
+                stream_id=stream_id,
+                headers=self._request_headers(request),
+                end_stream=not request.content,
             )
+            if timing is not None:
+                timing.mark("stream_open")
+            if request.content:
+                self._http.send_data(
+                    stream_id=stream_id, data=request.content, end_stream=True
+                )
 
-        waiter = self._loop.create_future()
-        self._request_events[stream_id] = deque()
-        self._request_waiter[stream_id] = waiter
-        self.transmit()
+            waiter = self._register_request(stream_id, timing)
+            self.transmit()
+            if timing is not None:
+                timing.mark("request_sent")
 
-        return await asyncio.shield(waiter)
+            events = await asyncio.shield(waiter)
+            record_response(span, stream_id, len(request.content), events)
+            return events
 
 
 async def perform_http_request(
@@ -250,16 +516,24 @@ async def perform_http_request(
     method: str,
     data: Optional[dict] = None,
     parameter: Optional[dict] = None,
-    headers: Optional[dict] = None
+    headers: Optional[dict] = None,
+    timing: Optional[RequestTiming] = None,
+    aggregator: Optional[TimingAggregator] = None,
 ) -> Tuple[Deque[H3Event], float]:
+    """
+    Perform a request and log its size, throughput and timing breakdown.
+    Pass `timing` to read the per-phase breakdown afterwards and
+    `aggregator` to accumulate it across requests.
+    """
     # perform request
-    start = time.time()
+    if timing is None:
+        timing = RequestTiming()
     if method == 'get':
         parameter_str = '?' + \
             '&'.join([f'{k}={v}' for k, v in parameter.items()]
                      ) if parameter else ''
         url = url + parameter_str
-        http_events = await client.get(url, headers=headers)
+        http_events = await client.get(url, headers=headers, timing=timing)
     else:
         data_bytes = json.dumps(data).encode()
         func = getattr(client, method)
@@ -276,8 +550,12 @@ async def perform_http_request(
                 "content-length": str(len(data_bytes)),
                 "content-type": "application/json",
             },
+            timing=timing,
         )
-    elapsed = time.time() - start
+    timing.mark("end")
+    elapsed = timing.elapsed
+    if aggregator is not None:
+        aggregator.record(timing)
 
     # print speed
     octets = 0
@@ -285,8 +563,9 @@ async def perform_http_request(
         if isinstance(http_event, DataReceived):
             octets += len(http_event.data)
     logger.info(
-        "Response received for %s %s : %d bytes in %.1f s (%.3f Mbps)"
-        % (method, urlparse(url).path, octets, elapsed, octets * 8 / elapsed / 1000000)
+        "Response received for %s %s : %d bytes in %.3f s (%.3f Mbps) %r"
+        % (method, urlparse(url).path, octets, elapsed,
+           octets * 8 / elapsed / 1000000 if elapsed else 0.0, timing)
     )
     return http_events, elapsed
 
@@ -296,11 +575,15 @@ def save_session_ticket(ticket: SessionTicket) -> None:
     Callback which is invoked by the TLS engine when a new session ticket
     is received.
     """
+    import pickle
+
     logger.info("New session ticket received")
     with open(setting.SESSION_SAVE_FILE, "wb") as fp:
         pickle.dump(ticket, fp)
 
 
 def get_session_ticket(configuration: QuicConfiguration) -> None:
+    import pickle
+
     with open(setting.SESSION_SAVE_FILE, "rb") as fp:
         configuration.session_ticket = pickle.load(fp)
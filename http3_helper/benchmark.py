@@ -0,0 +1,537 @@
+"""
+Comparative HTTP/3 vs HTTP/1.1 vs HTTP/2 benchmark.
+
+Runs the same request mix (GET /bytes/<size>) over the aioquic HttpClient
+and over httpx (HTTP/1.1 and HTTP/2), varying the number of parallel
+streams, the response size and simulated loss/latency, and prints one
+table row per combination.
+
+By default a local test server is started (HTTP/3 with aioquic, HTTP/1.1
+and HTTP/2 over TLS, self-signed certificate). Impairment is applied by a
+local proxy in front of each server: the UDP proxy drops and delays
+datagrams, the TCP proxy delays data in both directions. Packet loss
+cannot be emulated for TCP from user space, so loss only applies to
+HTTP/3; use `tc netem` for kernel-level TCP loss.
+
+    python -m http3_helper.benchmark --streams 1,8,32 --sizes 1024,1048576 --loss 0,0.01 --delay 0,0.02
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import socket
+import ssl
+import tempfile
+import time
+
+from typing import Callable, Dict, List, Optional, Tuple, cast
+from urllib.parse import urlparse
+
+from aioquic.asyncio import serve
+from aioquic.asyncio.protocol import QuicConnectionProtocol
+from aioquic.h3.connection import H3_ALPN, H3Connection
+from aioquic.h3.events import DataReceived, HeadersReceived
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.events import QuicEvent
+
+from http3_helper.aioquic import HttpClient
+from http3_helper.histogram import LatencyHistogram
+from http3_helper.profiles import get_configuration
+from http3_helper.udp import connect
+
+Address = Tuple[str, int]
+
+
+def payload_size(path: str) -> int:
+    """
+    Response size requested by `/bytes/<size>`.
+    """
+    try:
+        return int(path.rstrip("/").rsplit("/", 1)[-1].split("?", 1)[0])
+    except ValueError:
+        return 0
+
+
+def self_signed_certificate(directory: str) -> Tuple[str, str]:
+    """
+    Write a throwaway certificate for "localhost" and return the
+    (certificate, private key) paths.
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    with open(certfile, "wb") as fp:
+        fp.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, "wb") as fp:
+        fp.write(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+    return certfile, keyfile
+
+
+class H3BenchServerProtocol(QuicConnectionProtocol):
+    """
+    Answers every HTTP/3 request for /bytes/<size> with <size> bytes.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._http = H3Connection(self._quic)
+        self._paths: Dict[int, str] = {}
+
+    def quic_event_received(self, event: QuicEvent) -> None:
+        for http_event in self._http.handle_event(event):
+            if type(http_event) is HeadersReceived:
+                path = dict(http_event.headers).get(b":path", b"/").decode()
+                self._paths[http_event.stream_id] = path
+            if isinstance(http_event, (HeadersReceived, DataReceived)) and http_event.stream_ended:
+                self._respond(http_event.stream_id, self._paths.pop(http_event.stream_id, "/"))
+
+    def _respond(self, stream_id: int, path: str) -> None:
+        body = b"x" * payload_size(path)
+        self._http.send_headers(
+            stream_id, [(b":status", b"200"), (b"content-length", str(len(body)).encode())]
+        )
+        self._http.send_data(stream_id, body, end_stream=True)
+        self.transmit()
+
+
+async def _serve_h1(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while True:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        lines = head.decode("latin-1").split("\r\n")
+        length = 0
+        for line in lines[1:]:
+            if line.lower().startswith("content-length:"):
+                length = int(line.split(":", 1)[1])
+        if length:
+            await reader.readexactly(length)
+        body = b"x" * payload_size(lines[0].split(" ")[1])
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: %d\r\n\r\n" % len(body) + body)
+        await writer.drain()
+
+
+async def _serve_h2(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    import h2.config
+    import h2.connection
+    import h2.events
+
+    conn = h2.connection.H2Connection(
+        config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+    )
+    conn.initiate_connection()
+    paths: Dict[int, str] = {}
+    outgoing: Dict[int, bytes] = {}
+
+    def flush() -> None:
+        for stream_id, body in list(outgoing.items()):
+            while body:
+                size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(body))
+                if size <= 0:
+                    break
+                conn.send_data(stream_id, body[:size])
+                body = body[size:]
+            if body:
+                outgoing[stream_id] = body
+            else:
+                conn.end_stream(stream_id)
+                del outgoing[stream_id]
+
+    while True:
+        writer.write(conn.data_to_send())
+        await writer.drain()
+        data = await reader.read(65536)
+        if not data:
+            return
+        for event in conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                paths[event.stream_id] = dict(event.headers).get(":path", "/")
+            elif isinstance(event, h2.events.DataReceived):
+                conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                body = b"x" * payload_size(paths.pop(event.stream_id, "/"))
+                conn.send_headers(event.stream_id, [(":status", "200"), ("content-length", str(len(body)))])
+                outgoing[event.stream_id] = body
+            elif isinstance(event, h2.events.StreamReset):
+                outgoing.pop(event.stream_id, None)
+        flush()
+
+
+async def _serve_tcp(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    ssl_object = writer.get_extra_info("ssl_object")
+    try:
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2":
+            await _serve_h2(reader, writer)
+        else:
+            await _serve_h1(reader, writer)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+class BenchServer:
+    """
+    Local HTTP/3 (UDP) and HTTP/1.1 + HTTP/2 (TCP) test server on the same
+    port number.
+    """
+
+    def __init__(self, certfile: str, keyfile: str, host: str = "127.0.0.1") -> None:
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.host = host
+        self.port = 0
+        self._quic = None
+        self._tcp: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> int:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(self.certfile, self.keyfile)
+        context.set_alpn_protocols(["h2", "http/1.1"])
+        self._tcp = await asyncio.start_server(_serve_tcp, self.host, 0, ssl=context)
+        self.port = self._tcp.sockets[0].getsockname()[1]
+
+        configuration = QuicConfiguration(is_client=False, alpn_protocols=H3_ALPN)
+        configuration.load_cert_chain(self.certfile, self.keyfile)
+        self._quic = await serve(
+            self.host, self.port, configuration=configuration, create_protocol=H3BenchServerProtocol
+        )
+        return self.port
+
+    def close(self) -> None:
+        if self._quic is not None:
+            self._quic.close()
+        if self._tcp is not None:
+            self._tcp.close()
+
+
+class UdpImpairmentProxy:
+    """
+    Forwards datagrams between clients and `upstream`, dropping each one
+    with probability `loss` and delaying it by `delay` (plus up to `jitter`,
+    which may reorder datagrams) in each direction.
+    """
+
+    def __init__(self, upstream: Address, loss: float = 0.0, delay: float = 0.0, jitter: float = 0.0) -> None:
+        self.upstream = upstream
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.forwarded = 0
+        self.dropped = 0
+        self._listener: Optional[socket.socket] = None
+        self._upstreams: Dict[Address, socket.socket] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def start(self, host: str = "127.0.0.1") -> int:
+        self._loop = asyncio.get_running_loop()
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._listener.setblocking(False)
+        self._listener.bind((host, 0))
+        self._loop.add_reader(self._listener.fileno(), self._from_client)
+        return self._listener.getsockname()[1]
+
+    def _forward(self, send: Callable[[bytes], None], data: bytes) -> None:
+        if self.loss and random.random() < self.loss:
+            self.dropped += 1
+            return
+        self.forwarded += 1
+        delay = self.delay + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            self._loop.call_later(delay, send, data)
+        else:
+            send(data)
+
+    @staticmethod
+    def _sender(sock: socket.socket, addr: Optional[Address] = None) -> Callable[[bytes], None]:
+        def send(data: bytes) -> None:
+            try:
+                if addr is None:
+                    sock.send(data)
+                else:
+                    sock.sendto(data, addr)
+            except OSError:
+                pass  # a full socket buffer is just another lost datagram
+
+        return send
+
+    def _from_client(self) -> None:
+        while True:
+            try:
+                data, addr = self._listener.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+            sock = self._upstreams.get(addr)
+            if sock is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setblocking(False)
+                sock.connect(self.upstream)
+                self._loop.add_reader(sock.fileno(), self._from_upstream, sock, addr)
+                self._upstreams[addr] = sock
+            self._forward(self._sender(sock), data)
+
+    def _from_upstream(self, sock: socket.socket, addr: Address) -> None:
+        while True:
+            try:
+                data = sock.recv(65535)
+            except (BlockingIOError, InterruptedError, ConnectionRefusedError):
+                return
+            self._forward(self._sender(self._listener, addr), data)
+
+    def close(self) -> None:
+        for sock in [self._listener, *self._upstreams.values()]:
+            if sock is not None:
+                self._loop.remove_reader(sock.fileno())
+                sock.close()
+        self._upstreams.clear()
+
+
+class TcpImpairmentProxy:
+    """
+    Forwards TCP connections to `upstream`, delaying data by `delay` in
+    each direction while keeping byte order.
+    """
+
+    def __init__(self, upstream: Address, delay: float = 0.0) -> None:
+        self.upstream = upstream
+        self.delay = delay
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, host: str = "127.0.0.1") -> int:
+        self._server = await asyncio.start_server(self._handle, host, 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def _pipe(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        queue: "asyncio.Queue[Tuple[float, bytes]]" = asyncio.Queue()
+
+        async def deliver() -> None:
+            while True:
+                due, data = await queue.get()
+                wait = due - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        task = asyncio.ensure_future(deliver())
+        try:
+            while True:
+                data = await reader.read(65536)
+                queue.put_nowait((loop.time() + self.delay, data))
+                if not data:
+                    break
+        except ConnectionError:
+            queue.put_nowait((loop.time(), b""))
+        await task
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(*self.upstream)
+        except OSError:
+            writer.close()
+            return
+        await asyncio.gather(
+            self._pipe(reader, upstream_writer), self._pipe(upstream_reader, writer), return_exceptions=True
+        )
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+
+
+class BenchResult:
+    def __init__(self, protocol: str, streams: int, size: int, loss: float, delay: float) -> None:
+        self.protocol = protocol
+        self.streams = streams
+        self.size = size
+        self.loss = loss
+        self.delay = delay
+        self.latency = LatencyHistogram()
+        self.completed = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.elapsed = 0.0
+
+    def row(self) -> List[str]:
+        elapsed = self.elapsed or 1.0
+        return [
+            self.protocol,
+            str(self.streams),
+            str(self.size),
+            "%g" % self.loss,
+            "%g" % (self.delay * 1000),
+            "%.0f" % (self.completed / elapsed),
+            "%.1f" % (self.bytes_received * 8 / elapsed / 1e6),
+            "%.2f" % self.latency.percentile(50),
+            "%.2f" % self.latency.percentile(99),
+            str(self.errors),
+        ]
+
+
+HEADER = ["protocol", "streams", "size", "loss", "delay_ms", "req/s", "Mbps", "p50_ms", "p99_ms", "errors"]
+
+
+async def _drive(result: BenchResult, requests: int, timeout: float, send: Callable) -> None:
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                received = await asyncio.wait_for(send(), timeout)
+            except Exception:
+                result.errors += 1
+                continue
+            result.latency.record(time.perf_counter() - start)
+            result.completed += 1
+            result.bytes_received += received
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(result.streams)))
+    result.elapsed = time.perf_counter() - start
+
+
+async def bench_h3(url: str, result: BenchResult, requests: int, timeout: float, profile: str = "default") -> None:
+    """
+    `requests` GETs multiplexed over one QUIC connection, `result.streams`
+    at a time.
+    """
+    parsed = urlparse(url)
+    configuration = get_configuration(profile)
+    configuration.verify_mode = ssl.CERT_NONE
+    async with connect(
+        parsed.hostname, parsed.port or 443, configuration=configuration, create_protocol=HttpClient
+    ) as protocol:
+        client = cast(HttpClient, protocol)
+
+        async def send() -> int:
+            events = await client.get(url)
+            return sum(len(event.data) for event in events if type(event) is DataReceived)
+
+        await _drive(result, requests, timeout, send)
+
+
+async def bench_httpx(url: str, result: BenchResult, requests: int, timeout: float, http2: bool) -> None:
+    """
+    `requests` GETs over httpx: one multiplexed connection for HTTP/2, one
+    connection per stream for HTTP/1.1.
+    """
+    import httpx
+
+    limits = httpx.Limits(max_connections=1 if http2 else result.streams)
+    async with httpx.AsyncClient(http2=http2, verify=False, limits=limits) as client:
+
+        async def send() -> int:
+            response = await client.get(url)
+            return len(response.content)
+
+        await _drive(result, requests, timeout, send)
+
+
+async def run_matrix(args: argparse.Namespace) -> List[BenchResult]:
+    server = None
+    if args.h3_url and args.tcp_url:
+        h3_upstream = (urlparse(args.h3_url).hostname, urlparse(args.h3_url).port or 443)
+        tcp_upstream = (urlparse(args.tcp_url).hostname, urlparse(args.tcp_url).port or 443)
+    else:
+        directory = tempfile.mkdtemp()
+        server = BenchServer(*self_signed_certificate(directory))
+        port = await server.start()
+        h3_upstream = tcp_upstream = ("127.0.0.1", port)
+
+    results = []
+    try:
+        for loss in args.loss:
+            for delay in args.delay:
+                udp_proxy = UdpImpairmentProxy(h3_upstream, loss=loss, delay=delay / 2, jitter=args.jitter)
+                tcp_proxy = TcpImpairmentProxy(tcp_upstream, delay=delay / 2)
+                udp_port, tcp_port = await udp_proxy.start(), await tcp_proxy.start()
+                try:
+                    for size in args.sizes:
+                        for streams in args.streams:
+                            h3_url = "https://127.0.0.1:%d/bytes/%d" % (udp_port, size)
+                            tcp_url = "https://127.0.0.1:%d/bytes/%d" % (tcp_port, size)
+                            for protocol in args.protocols:
+                                result = BenchResult(protocol, streams, size, loss, delay)
+                                if protocol == "h3":
+                                    await bench_h3(h3_url, result, args.requests, args.timeout, args.profile)
+                                else:
+                                    await bench_httpx(tcp_url, result, args.requests, args.timeout, protocol == "h2")
+                                print(" | ".join(result.row()), flush=True)
+                                results.append(result)
+                finally:
+                    udp_proxy.close()
+                    tcp_proxy.close()
+    finally:
+        if server is not None:
+            server.close()
+    return results
+
+
+def format_table(results: List[BenchResult]) -> str:
+    rows = [HEADER] + [result.row() for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(HEADER))]
+    lines = [" | ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows]
+    lines.insert(1, "-+-".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    def floats(value: str) -> List[float]:
+        return [float(item) for item in value.split(",")]
+
+    def ints(value: str) -> List[int]:
+        return [int(item) for item in value.split(",")]
+
+    parser = argparse.ArgumentParser(description="HTTP/3 vs HTTP/1.1 vs HTTP/2 benchmark")
+    parser.add_argument("--protocols", type=lambda v: v.split(","), default=["h3", "h1", "h2"])
+    parser.add_argument("--streams", type=ints, default=[1, 8, 32], help="parallel streams")
+    parser.add_argument("--sizes", type=ints, default=[1024, 1024 * 1024], help="response sizes in bytes")
+    parser.add_argument("--loss", type=floats, default=[0.0], help="UDP loss rates (0-1)")
+    parser.add_argument("--delay", type=floats, default=[0.0], help="round-trip delays in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random one-way UDP delay in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="requests per combination")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--profile", default="default", help="QUIC profile for HTTP/3")
+    parser.add_argument("--h3-url", help="external HTTP/3 server serving /bytes/<size>, instead of the built-in one")
+    parser.add_argument("--tcp-url", help="external HTTP/1.1+2 server serving /bytes/<size>, instead of the built-in one")
+    args = parser.parse_args()
+
+    print(" | ".join(HEADER))
+    results = asyncio.run(run_matrix(args))
+    print()
+    print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+# 2^SUB_BITS linear sub-buckets per power of two: about 1.6% worst-case
+# relative error, constant memory regardless of the value range
+SUB_BITS = 7
+SUB_COUNT = 1 << SUB_BITS
+HALF_COUNT = SUB_COUNT >> 1
+
+
+def bucket_index(value: int) -> int:
+    if value < SUB_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BITS
+    return shift * HALF_COUNT + (value >> shift)
+
+
+def bucket_bounds(index: int) -> Tuple[int, int]:
+    """
+    Lowest and highest value counted in bucket `index`.
+    """
+    if index < SUB_COUNT:
+        return index, index
+    shift = index // HALF_COUNT - 1
+    mantissa = index - shift * HALF_COUNT
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear latency histogram in microseconds.
+
+    Buckets are kept sparse in a dict, so histograms are cheap to pickle
+    across processes and are merged by adding counts.
+    """
+
+    def __init__(self) -> None:
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.min: Optional[int] = None
+        self.max = 0
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1e6))
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "LatencyHistogram") -> "LatencyHistogram":
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merged(cls, histograms: Iterable["LatencyHistogram"]) -> "LatencyHistogram":
+        result = cls()
+        for histogram in histograms:
+            result.merge(histogram)
+        return result
+
+    def percentile(self, p: float) -> float:
+        """
+        Value at percentile `p` (0-100) in milliseconds, reported as the
+        highest value of its bucket (never under-reports).
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(p / 100 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(bucket_bounds(index)[1], self.max) / 1000
+        return self.max / 1000
+
+    def summary(self, percentiles: Iterable[float] = (50, 90, 99, 99.9)) -> Dict[str, float]:
+        ret = {
+            "count": self.count,
+            "min_ms": (self.min or 0) / 1000,
+            "mean_ms": self.total / self.count / 1000 if self.count else 0.0,
+            "max_ms": self.max / 1000,
+        }
+        for p in percentiles:
+            ret["p%g_ms" % p] = self.percentile(p)
+        return ret
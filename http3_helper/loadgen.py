@@ -0,0 +1,248 @@
+"""
+Open-loop HTTP/3 load generator built on HttpClient.
+
+Requests are issued at a constant arrival rate regardless of how fast the
+server answers, and latency is measured from each request's *intended*
+send time, so a stalled server shows up in the tail instead of silently
+slowing the generator down (coordinated omission). The rate is split
+across worker processes, each multiplexing its share over a few QUIC
+connections; per-worker histograms are merged in the parent.
+
+    python -m http3_helper.loadgen https://127.0.0.1:4433/ --rate 2000 --duration 30 --workers 4
+"""
+import argparse
+import asyncio
+import ssl
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AsyncExitStack
+from typing import Dict, List, Optional, cast
+from urllib.parse import urlparse
+
+from aioquic.h3.events import DataReceived, HeadersReceived
+
+from http3_helper.aioquic import HttpClient
+from http3_helper.histogram import LatencyHistogram
+from http3_helper.profiles import get_configuration
+from http3_helper.udp import connect
+
+
+class LoadSpec:
+    """
+    What to send and how fast.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        rate: float,
+        duration: float,
+        method: str = "GET",
+        body: bytes = b"",
+        headers: Optional[Dict[str, str]] = None,
+        connections: int = 1,
+        workers: int = 1,
+        timeout: float = 10,
+        max_inflight: int = 10000,
+        profile: str = "default",
+        verify: bool = True,
+    ) -> None:
+        self.url = url
+        self.rate = rate
+        self.duration = duration
+        self.method = method.upper()
+        self.body = body
+        self.headers = headers or {}
+        self.connections = connections
+        self.workers = workers
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self.profile = profile
+        self.verify = verify
+
+    def share(self, workers: int) -> "LoadSpec":
+        """
+        The part of this spec run by one of `workers` processes.
+        """
+        spec = LoadSpec.__new__(LoadSpec)
+        spec.__dict__.update(self.__dict__)
+        spec.rate = self.rate / workers
+        spec.workers = 1
+        return spec
+
+
+class LoadResult:
+    """
+    Outcome of a load run; results of several workers are merged with `+`.
+    """
+
+    def __init__(self) -> None:
+        self.latency = LatencyHistogram()
+        self.sent = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.overloaded = 0
+        self.bytes_received = 0
+        self.statuses: Dict[int, int] = {}
+        self.elapsed = 0.0
+
+    def __add__(self, other: "LoadResult") -> "LoadResult":
+        result = LoadResult()
+        result.latency.merge(self.latency).merge(other.latency)
+        for name in ("sent", "completed", "errors", "timeouts", "overloaded", "bytes_received"):
+            setattr(result, name, getattr(self, name) + getattr(other, name))
+        for statuses in (self.statuses, other.statuses):
+            for status, count in statuses.items():
+                result.statuses[status] = result.statuses.get(status, 0) + count
+        result.elapsed = max(self.elapsed, other.elapsed)
+        return result
+
+    def summary(self) -> dict:
+        elapsed = self.elapsed or 1.0
+        return {
+            "sent": self.sent,
+            "completed": self.completed,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "overloaded": self.overloaded,
+            "throughput_rps": self.completed / elapsed,
+            "throughput_mbps": self.bytes_received * 8 / elapsed / 1e6,
+            "statuses": dict(sorted(self.statuses.items())),
+            "latency": self.latency.summary(),
+        }
+
+
+async def _connect(stack: AsyncExitStack, spec: LoadSpec) -> HttpClient:
+    url = urlparse(spec.url)
+    configuration = get_configuration(spec.profile)
+    if not spec.verify:
+        configuration.verify_mode = ssl.CERT_NONE
+    protocol = await stack.enter_async_context(
+        connect(
+            url.hostname,
+            url.port or 443,
+            configuration=configuration,
+            create_protocol=HttpClient,
+        )
+    )
+    return cast(HttpClient, protocol)
+
+
+async def _send(client: HttpClient, spec: LoadSpec, intended: float, result: LoadResult) -> None:
+    try:
+        events = await asyncio.wait_for(
+            client.request(spec.method, spec.url, spec.body, spec.headers), spec.timeout
+        )
+    except asyncio.TimeoutError:
+        result.timeouts += 1
+        result.latency.record(time.perf_counter() - intended)
+        return
+    except Exception:
+        result.errors += 1
+        return
+    result.latency.record(time.perf_counter() - intended)
+    result.completed += 1
+    for event in events:
+        if type(event) is HeadersReceived:
+            for name, value in event.headers:
+                if name == b":status":
+                    status = int(value)
+                    result.statuses[status] = result.statuses.get(status, 0) + 1
+        elif type(event) is DataReceived:
+            result.bytes_received += len(event.data)
+
+
+async def run_open_loop(spec: LoadSpec) -> LoadResult:
+    """
+    Drive `spec.rate` requests per second for `spec.duration` seconds from
+    the current process.
+    """
+    result = LoadResult()
+    async with AsyncExitStack() as stack:
+        clients: List[HttpClient] = [await _connect(stack, spec) for _ in range(max(1, spec.connections))]
+        interval = 1.0 / spec.rate
+        total = int(spec.rate * spec.duration)
+        pending = set()
+        start = time.perf_counter()
+        for i in range(total):
+            intended = start + i * interval
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                # behind schedule: still yield so in-flight requests make
+                # progress, otherwise the whole backlog is counted overloaded
+                await asyncio.sleep(0)
+            if len(pending) >= spec.max_inflight:
+                # the client itself is saturated; count it as overloaded
+                # (not sent) rather than letting the backlog grow without bound
+                result.overloaded += 1
+                continue
+            result.sent += 1
+            task = asyncio.ensure_future(_send(clients[i % len(clients)], spec, intended, result))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+        result.elapsed = time.perf_counter() - start
+    return result
+
+
+def _worker(spec: LoadSpec) -> LoadResult:
+    return asyncio.run(run_open_loop(spec))
+
+
+def run_load(spec: LoadSpec) -> LoadResult:
+    """
+    Run `spec`, splitting the arrival rate across `spec.workers` processes
+    and merging their results.
+    """
+    if spec.workers <= 1:
+        return _worker(spec)
+    share = spec.share(spec.workers)
+    with ProcessPoolExecutor(spec.workers) as pool:
+        results = list(pool.map(_worker, [share] * spec.workers))
+    result = results[0]
+    for other in results[1:]:
+        result = result + other
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Open-loop HTTP/3 load generator")
+    parser.add_argument("url")
+    parser.add_argument("--rate", type=float, default=100, help="requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--method", default="GET")
+    parser.add_argument("--body-size", type=int, default=0)
+    parser.add_argument("--connections", type=int, default=1, help="QUIC connections per worker")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--profile", default="default")
+    parser.add_argument("--insecure", action="store_true", help="skip certificate verification")
+    args = parser.parse_args()
+
+    spec = LoadSpec(
+        args.url,
+        args.rate,
+        args.duration,
+        method=args.method,
+        body=b"x" * args.body_size,
+        connections=args.connections,
+        workers=args.workers,
+        timeout=args.timeout,
+        profile=args.profile,
+        verify=not args.insecure,
+    )
+    summary = run_load(spec).summary()
+    latency = summary.pop("latency")
+    for key, value in summary.items():
+        print("%-16s %s" % (key, value))
+    for key, value in latency.items():
+        print("%-16s %s" % (key, value))
+
+
+if __name__ == "__main__":
+    main()
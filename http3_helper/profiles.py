@@ -0,0 +1,93 @@
+import copy
+import dataclasses
+
+from typing import Any, Dict
+
+from aioquic.h3.connection import H3_ALPN
+from aioquic.quic.configuration import QuicConfiguration
+
+from utils import logger
+from config import setting
+
+# QuicConfiguration fields per profile. Fields unknown to the installed
+# aioquic version are skipped. aioquic has no client-side setting for the
+# peer's stream limits, those are fixed by QuicConnection.
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "default": {},
+    # short control calls: small windows, give up on a dead path quickly
+    "low_latency": {
+        "idle_timeout": 15.0,
+        "max_data": 2 * 1024 * 1024,
+        "max_stream_data": 512 * 1024,
+        "max_datagram_size": 1200,
+    },
+    # large transfers: windows sized for high bandwidth-delay products
+    "bulk": {
+        "idle_timeout": 120.0,
+        "max_data": 64 * 1024 * 1024,
+        "max_stream_data": 16 * 1024 * 1024,
+        "max_datagram_size": 1350,
+        "congestion_control_algorithm": "cubic",
+    },
+    # lossy or high-jitter paths: minimum-size packets, patient idle timer
+    "lossy_network": {
+        "idle_timeout": 60.0,
+        "max_data": 8 * 1024 * 1024,
+        "max_stream_data": 2 * 1024 * 1024,
+        "max_datagram_size": 1200,
+        "congestion_control_algorithm": "reno",
+    },
+}
+
+_templates: Dict[str, QuicConfiguration] = {}
+
+
+def _congestion_control_available(name: str) -> bool:
+    try:
+        from aioquic.quic.congestion.base import create_congestion_control
+
+        create_congestion_control(name, max_datagram_size=1200)
+    except Exception:
+        return False
+    return True
+
+
+def register_profile(name: str, **options: Any) -> None:
+    """
+    Add or replace the profile `name` with the given QuicConfiguration
+    fields.
+    """
+    PROFILES[name] = options
+    _templates.pop(name, None)
+
+
+def _build(name: str) -> QuicConfiguration:
+    options = dict(PROFILES[name])
+    options.update((getattr(setting, "HTTP3_QUIC_PROFILES", None) or {}).get(name, {}))
+    configuration = QuicConfiguration(is_client=True, alpn_protocols=H3_ALPN)
+    fields = {field.name for field in dataclasses.fields(QuicConfiguration)}
+    for key, value in options.items():
+        if key not in fields:
+            logger.info("QUIC profile %s: %s is not supported by this aioquic version" % (name, key))
+        elif key == "congestion_control_algorithm" and not _congestion_control_available(value):
+            logger.info("QUIC profile %s: congestion control %s is not available" % (name, value))
+        else:
+            setattr(configuration, key, value)
+    return configuration
+
+
+def get_configuration(name: str = "default") -> QuicConfiguration:
+    """
+    Return a fresh client QuicConfiguration for the profile `name`.
+
+    Each profile is built once; callers get a shallow copy they may
+    customise (logger, session ticket, CA) without affecting other
+    connections.
+    """
+    template = _templates.get(name)
+    if template is None:
+        if name not in PROFILES and name not in (getattr(setting, "HTTP3_QUIC_PROFILES", None) or {}):
+            raise ValueError("unknown QUIC profile: %s" % name)
+        PROFILES.setdefault(name, {})
+        template = _templates[name] = _build(name)
+    return copy.copy(template)
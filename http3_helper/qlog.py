@@ -0,0 +1,225 @@
+import gzip
+import itertools
+import os
+import queue
+import shutil
+import threading
+import time
+import ujson as json
+
+from typing import Callable, Optional
+from aioquic.quic.logger import QuicLogger, QuicLoggerTrace
+
+from utils import logger
+from config import setting
+
+QLOG_VERSION = "0.3"
+
+
+class WindowedTrace(QuicLoggerTrace):
+    """
+    A trace whose events can be flushed while the connection is still open.
+    """
+
+    def drain(self) -> Optional[dict]:
+        """
+        Remove the events logged so far and return them as a qlog trace,
+        or None if there are none.
+        """
+        count = len(self._events)
+        if not count:
+            return None
+        # popleft is atomic, so events logged meanwhile by the event loop
+        # simply stay for the next window
+        events = [self._events.popleft() for _ in range(count)]
+        return {
+            "common_fields": {"ODCID": self._odcid.hex()},
+            "events": events,
+            "vantage_point": self._vantage_point,
+        }
+
+
+class QlogSink(QuicLogger):
+    """
+    A QUIC logger which never touches the disk from the event loop.
+
+    Only one in `sample_rate` connections is traced. Traces are written by a
+    background thread, one JSON document per line, to `<path>/<filename>`,
+    rotating the file once it exceeds `max_bytes` and keeping at most
+    `backup_count` rotated (optionally gzip-compressed) copies.
+
+    Pooled connections live as long as the worker, so the events of open
+    connections are also flushed every `flush_interval` seconds; a long
+    connection therefore appears as several lines sharing the same ODCID.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        sample_rate: int = 1,
+        max_bytes: int = 64 * 1024 * 1024,
+        backup_count: int = 5,
+        compress: bool = False,
+        queue_size: int = 1024,
+        filename: str = "client.qlog",
+        flush_interval: float = 10,
+    ) -> None:
+        if not os.path.isdir(path):
+            raise ValueError("QUIC log output directory '%s' does not exist" % path)
+        super().__init__()
+        self.path = os.path.join(path, filename)
+        self.sample_rate = max(1, int(sample_rate))
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._counter = itertools.count()
+        self._queue: "queue.Queue[Optional[QuicLoggerTrace]]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="qlog-writer", daemon=True)
+        self._thread.start()
+
+    def for_connection(self) -> Optional[QuicLogger]:
+        """
+        Return the logger to use for a new connection, or None if the
+        connection is not sampled.
+        """
+        if next(self._counter) % self.sample_rate:
+            return None
+        return self
+
+    def start_trace(self, is_client: bool, odcid: bytes) -> QuicLoggerTrace:
+        trace = WindowedTrace(is_client=is_client, odcid=odcid)
+        self._traces.append(trace)
+        return trace
+
+    def end_trace(self, trace: QuicLoggerTrace) -> None:
+        self._traces.remove(trace)
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5) -> None:
+        """
+        Flush pending traces and stop the writer thread.
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                trace = self._queue.get(
+                    timeout=max(0.0, deadline - time.monotonic()) if self.flush_interval > 0 else None
+                )
+            except queue.Empty:
+                trace = False
+            if trace is None:
+                # closing: also write what open connections logged so far
+                self._flush_open()
+                return
+            if trace is not False:
+                self._write_trace(trace)
+            if self.flush_interval > 0 and time.monotonic() >= deadline:
+                self._flush_open()
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush_open(self) -> None:
+        for trace in list(self._traces):
+            self._write_trace(trace)
+
+    def _write_trace(self, trace: QuicLoggerTrace) -> None:
+        try:
+            data = trace.drain() if isinstance(trace, WindowedTrace) else trace.to_dict()
+            if data is None:
+                return
+            line = json.dumps(
+                {
+                    "qlog_format": "JSON",
+                    "qlog_version": QLOG_VERSION,
+                    "traces": [data],
+                }
+            ).encode() + b"\n"
+            self._write(line)
+            self.written += 1
+        except Exception as e:
+            logger.info("Failed to write qlog trace: %s" % e)
+
+    def _write(self, line: bytes) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size and size + len(line) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as fp:
+            fp.write(line)
+
+    def _rotate(self) -> None:
+        suffix = ".gz" if self.compress else ""
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backup_count - 1, 0, -1):
+            src = "%s.%d%s" % (self.path, i, suffix)
+            if os.path.exists(src):
+                os.replace(src, "%s.%d%s" % (self.path, i + 1, suffix))
+        target = "%s.1%s" % (self.path, suffix)
+        if self.compress:
+            with open(self.path, "rb") as src_fp, gzip.open(target, "wb") as dst_fp:
+                shutil.copyfileobj(src_fp, dst_fp)
+            os.remove(self.path)
+        else:
+            os.replace(self.path, target)
+
+
+_qlog_factory: Optional[Callable[[], Optional[QuicLogger]]] = None
+_default_sink: Optional[QlogSink] = None
+
+
+def set_qlog_factory(factory: Optional[Callable[[], Optional[QuicLogger]]]) -> None:
+    """
+    Install a callable returning the QuicLogger (or None) for each new
+    connection, replacing the settings-based sink.
+    """
+    global _qlog_factory
+    _qlog_factory = factory
+
+
+def get_quic_logger() -> Optional[QuicLogger]:
+    """
+    Return the QuicLogger for a new connection. qlog is disabled unless
+    `HTTP3_QLOG_ENABLED` is set or a factory has been installed.
+    """
+    global _default_sink
+    if _qlog_factory is not None:
+        return _qlog_factory()
+    if not getattr(setting, "HTTP3_QLOG_ENABLED", False):
+        return None
+    if _default_sink is None:
+        _default_sink = QlogSink(
+            setting.HTTP3_CLIENT_LOG_DIR,
+            sample_rate=getattr(setting, "HTTP3_QLOG_SAMPLE_RATE", 1),
+            max_bytes=getattr(setting, "HTTP3_QLOG_MAX_BYTES", 64 * 1024 * 1024),
+            backup_count=getattr(setting, "HTTP3_QLOG_BACKUP_COUNT", 5),
+            compress=getattr(setting, "HTTP3_QLOG_COMPRESS", False),
+            flush_interval=getattr(setting, "HTTP3_QLOG_FLUSH_INTERVAL", 10),
+        )
+    return _default_sink.for_connection()
+
+
+def close_quic_logger(timeout: float = 5) -> None:
+    """
+    Flush and stop the settings-based sink, if one was created. Blocks up
+    to `timeout` seconds; call it from an executor inside an event loop.
+    """
+    global _default_sink
+    sink, _default_sink = _default_sink, None
+    if sink is not None:
+        sink.close(timeout)
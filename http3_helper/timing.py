@@ -0,0 +1,99 @@
+from time import perf_counter_ns
+from typing import Dict, Optional
+
+PHASES = ("queue", "send", "ttfh", "ttfb", "transfer", "total")
+
+
+class RequestTiming:
+    """
+    Per-request timestamps on perf_counter_ns.
+
+    - queue: request created -> stream opened (connection setup, locks)
+    - send: stream opened -> request fully written
+    - ttfh: request written -> first response header (network RTT plus
+      server processing)
+    - ttfb: request written -> first body byte
+    - transfer: first body byte -> end of stream
+    - total: request created -> end of stream
+    """
+
+    __slots__ = ("start", "stream_open", "request_sent", "first_header", "first_body", "end")
+
+    def __init__(self, start: Optional[int] = None) -> None:
+        self.start = start or perf_counter_ns()
+        self.stream_open = 0
+        self.request_sent = 0
+        self.first_header = 0
+        self.first_body = 0
+        self.end = 0
+
+    def mark(self, name: str) -> None:
+        """
+        Record `name` now unless it was already recorded.
+        """
+        if not getattr(self, name):
+            setattr(self, name, perf_counter_ns())
+
+    @property
+    def elapsed(self) -> float:
+        """
+        Total duration in seconds.
+        """
+        end = self.end or perf_counter_ns()
+        return (end - self.start) / 1e9
+
+    def durations(self) -> Dict[str, Optional[float]]:
+        """
+        Phase durations in milliseconds, None when a phase was not observed.
+        """
+
+        def span(a: int, b: int) -> Optional[float]:
+            return (b - a) / 1e6 if a and b else None
+
+        sent = self.request_sent or self.stream_open
+        return {
+            "queue": span(self.start, self.stream_open),
+            "send": span(self.stream_open, self.request_sent),
+            "ttfh": span(sent, self.first_header),
+            "ttfb": span(sent, self.first_body),
+            "transfer": span(self.first_body, self.end),
+            "total": span(self.start, self.end),
+        }
+
+    def __repr__(self) -> str:
+        return "RequestTiming(%s)" % ", ".join(
+            "%s=%.3fms" % (k, v) for k, v in self.durations().items() if v is not None
+        )
+
+
+class TimingAggregator:
+    """
+    Running count / mean / max per phase.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._sum = dict.fromkeys(PHASES, 0.0)
+        self._max = dict.fromkeys(PHASES, 0.0)
+        self._observed = dict.fromkeys(PHASES, 0)
+
+    def record(self, timing: RequestTiming) -> None:
+        self.count += 1
+        for phase, value in timing.durations().items():
+            if value is None:
+                continue
+            self._observed[phase] += 1
+            self._sum[phase] += value
+            if value > self._max[phase]:
+                self._max[phase] = value
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            phase: {
+                "count": self._observed[phase],
+                "mean_ms": self._sum[phase] / self._observed[phase],
+                "max_ms": self._max[phase],
+            }
+            for phase in PHASES
+            if self._observed[phase]
+        }
@@ -0,0 +1,98 @@
+"""
+Optional OpenTelemetry tracing.
+
+When `opentelemetry-api` is installed (and TRACING_ENABLED is not turned
+off in the settings) spans are created through the global tracer and the
+current trace context is injected into outgoing request headers; the
+exporter/SDK is whatever the application installed. Otherwise every helper
+here is a no-op, so callers never need to check.
+"""
+from contextlib import contextmanager
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Any, Dict, Iterator, Optional
+
+from config import setting
+
+TRACER_NAME = "nacos_helper"
+
+
+class NoopSpan:
+    """
+    Stand-in for an OpenTelemetry span when tracing is disabled.
+    """
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        pass
+
+    def record_exception(self, exception: BaseException) -> None:
+        pass
+
+    def is_recording(self) -> bool:
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+@lru_cache(maxsize=None)
+def enabled() -> bool:
+    return getattr(setting, "TRACING_ENABLED", True) and find_spec("opentelemetry") is not None
+
+
+@lru_cache(maxsize=None)
+def get_tracer():
+    """
+    The OpenTelemetry tracer, or None when tracing is disabled.
+    """
+    if not enabled():
+        return None
+    from opentelemetry import trace
+
+    return trace.get_tracer(TRACER_NAME)
+
+
+@contextmanager
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, client: bool = True) -> Iterator[Any]:
+    """
+    Run the block inside a new span made current; exceptions are recorded
+    on the span and re-raised.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        yield NOOP_SPAN
+        return
+    from opentelemetry.trace import SpanKind
+
+    kind = SpanKind.CLIENT if client else SpanKind.INTERNAL
+    with tracer.start_as_current_span(name, kind=kind, attributes=attributes) as span:
+        yield span
+
+
+def current_span() -> Any:
+    """
+    The active span, for adding attributes from nested code.
+    """
+    if get_tracer() is None:
+        return NOOP_SPAN
+    from opentelemetry import trace
+
+    return trace.get_current_span()
+
+
+def inject(headers: Dict[str, str]) -> Dict[str, str]:
+    """
+    Add the current trace context (traceparent, baggage, ...) to `headers`
+    in place, using the globally configured propagator.
+    """
+    if get_tracer() is not None:
+        from opentelemetry.propagate import inject as _inject
+
+        _inject(headers)
+    return headers
@@ -0,0 +1,336 @@
+import asyncio
+import errno
+import os
+import re
+import socket
+import struct
+import sys
+
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Callable, List, Optional, Set, Tuple, Union, cast
+from aioquic.asyncio.protocol import QuicConnectionProtocol, QuicStreamHandler
+from aioquic.quic.configuration import QuicConfiguration
+from aioquic.quic.connection import QuicConnection
+from aioquic.tls import SessionTicketHandler
+
+from utils import logger
+from config import setting
+
+PortRange = Union[str, Tuple[int, int]]
+
+# linux/udp.h, not exported by the socket module
+UDP_SEGMENT = getattr(socket, "UDP_SEGMENT", 103)
+# the kernel accepts at most 64 segments and 64KB per GSO send
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_BYTES = 65000
+
+
+def parse_port_range(value: PortRange) -> Tuple[int, int]:
+    """
+    Parse "40000-40999" or (40000, 40999) into an inclusive (start, end).
+    """
+    if isinstance(value, str):
+        start, _, end = value.partition("-")
+        value = (int(start), int(end or start))
+    start, end = int(value[0]), int(value[1])
+    if not 0 < start <= end <= 65535:
+        raise ValueError("invalid local port range: %d-%d" % (start, end))
+    return start, end
+
+
+def worker_index() -> Optional[int]:
+    """
+    Index of the current Sanic worker, taken from the `SANIC_WORKER_NAME`
+    environment variable ("Sanic-Server-<index>-<n>"), or None outside a
+    managed worker.
+    """
+    match = re.search(r"-(\d+)-\d+$", os.environ.get("SANIC_WORKER_NAME", ""))
+    return int(match.group(1)) if match else None
+
+
+class LocalPortPool:
+    """
+    A range of local UDP ports handed out one per QUIC connection.
+
+    A port is taken by binding to it, so a port held by another process (or
+    by a connection of this one) is skipped rather than shared. Binding
+    starts after the last port handed out, spreading reconnects over the
+    range instead of hammering its first port. With `reuse_port` bind()
+    no longer arbitrates between processes, so each worker should own its
+    slice of the range (see `for_worker`).
+    """
+
+    def __init__(self, start: int, end: int, reuse_port: bool = False) -> None:
+        self.start = start
+        self.end = end
+        self.reuse_port = reuse_port
+        self._used: Set[int] = set()
+        self._next = start
+
+    @classmethod
+    def for_worker(
+        cls,
+        start: int,
+        end: int,
+        index: Optional[int],
+        workers: int,
+        reuse_port: bool = False,
+    ) -> "LocalPortPool":
+        """
+        Return the slice of [start, end] owned by worker `index` out of
+        `workers`, so workers never contend for the same ports. Without a
+        known index the whole range is shared and bind() arbitrates.
+        """
+        size = end - start + 1
+        if index is None or workers <= 1 or size < workers:
+            return cls(start, end, reuse_port)
+        share = size // workers
+        first = start + (index % workers) * share
+        return cls(first, first + share - 1, reuse_port)
+
+    @property
+    def size(self) -> int:
+        return self.end - self.start + 1
+
+    @property
+    def available(self) -> int:
+        return self.size - len(self._used)
+
+    def bind(self, sock: socket.socket, host: str) -> int:
+        """
+        Bind `sock` to the first free port of the pool and return it.
+        Raises OSError(EADDRINUSE) once every port is taken.
+        """
+        for offset in range(self.size):
+            port = self.start + (self._next - self.start + offset) % self.size
+            if port in self._used:
+                continue
+            try:
+                sock.bind((host, port, 0, 0))
+            except OSError as e:
+                if e.errno in (errno.EADDRINUSE, errno.EACCES):
+                    continue
+                raise
+            self._used.add(port)
+            self._next = port + 1 if port < self.end else self.start
+            return port
+        raise OSError(errno.EADDRINUSE, "no free local port in %d-%d" % (self.start, self.end))
+
+    def release(self, port: int) -> None:
+        self._used.discard(port)
+
+
+_default_pool: Optional[LocalPortPool] = None
+
+
+def get_local_port_pool() -> Optional[LocalPortPool]:
+    """
+    Return this process' LocalPortPool built from `HTTP3_LOCAL_PORT_RANGE`
+    (split between `HTTP3_LOCAL_PORT_WORKERS` workers), or None to use
+    ephemeral ports.
+    """
+    global _default_pool
+    port_range = getattr(setting, "HTTP3_LOCAL_PORT_RANGE", None)
+    if not port_range:
+        return None
+    if _default_pool is None:
+        start, end = parse_port_range(port_range)
+        _default_pool = LocalPortPool.for_worker(
+            start,
+            end,
+            worker_index(),
+            getattr(setting, "HTTP3_LOCAL_PORT_WORKERS", 1),
+            reuse_port=getattr(setting, "HTTP3_REUSE_PORT", False),
+        )
+    return _default_pool
+
+
+def create_socket(
+    addr: tuple,
+    local_ports: Optional[LocalPortPool] = None,
+) -> Tuple[socket.socket, int]:
+    """
+    Create a dual-stack UDP socket for a connection to `addr` and bind it
+    to an ephemeral port, or to a port of `local_ports`.
+
+    With `local_ports.reuse_port` the socket gets SO_REUSEPORT and is
+    connected to `addr`: the kernel then demultiplexes on the full 4-tuple,
+    so a port still held by a closing socket can be reused at once for a
+    different peer without datagrams being delivered to the wrong socket.
+    """
+    sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        if local_ports is None:
+            sock.bind(("::", 0, 0, 0))
+        else:
+            if local_ports.reuse_port and hasattr(socket, "SO_REUSEPORT"):
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            local_ports.bind(sock, "::")
+            if local_ports.reuse_port:
+                sock.connect(addr)
+        return sock, sock.getsockname()[1]
+    except BaseException:
+        sock.close()
+        raise
+
+
+def gso_supported(sock: socket.socket) -> bool:
+    """
+    Whether the kernel supports UDP generic segmentation offload (Linux
+    4.18+) on `sock`.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        sock.getsockopt(socket.IPPROTO_UDP, UDP_SEGMENT)
+    except OSError:
+        return False
+    return True
+
+
+class BatchedDatagramTransport:
+    """
+    Wraps an asyncio datagram transport so that the datagrams queued between
+    `begin()` and `flush()` are coalesced: consecutive datagrams to the same
+    address go out in one `sendmsg` with a UDP_SEGMENT control message, and
+    the kernel splits them into packets. Only the last datagram of a batch
+    may be shorter than the segment size, as required by GSO.
+
+    The transport is used as is whenever it is already buffering (so
+    ordering is kept), when a send would block, and for good once the
+    kernel or NIC rejects GSO.
+    """
+
+    def __init__(self, transport: asyncio.DatagramTransport, sock: socket.socket) -> None:
+        self.transport = transport
+        self.sock = sock
+        self.enabled = True
+        self.batches = 0
+        self.datagrams = 0
+        self._pending: Optional[List[Tuple[bytes, tuple]]] = None
+
+    def __getattr__(self, name: str):
+        return getattr(self.transport, name)
+
+    def begin(self) -> None:
+        self._pending = []
+
+    def sendto(self, data: bytes, addr: Optional[tuple] = None) -> None:
+        if self._pending is None:
+            self.transport.sendto(data, addr)
+        else:
+            self._pending.append((data, addr))
+
+    def flush(self) -> None:
+        datagrams, self._pending = self._pending or [], None
+        start, count = 0, len(datagrams)
+        while start < count:
+            data, addr = datagrams[start]
+            size = total = len(data)
+            end = start + 1
+            while end < count and end - start < GSO_MAX_SEGMENTS:
+                next_data, next_addr = datagrams[end]
+                if next_addr != addr or len(next_data) > size or total + len(next_data) > GSO_MAX_BYTES:
+                    break
+                total += len(next_data)
+                end += 1
+                if len(next_data) < size:
+                    break
+            self._send(datagrams[start:end], size, addr)
+            start = end
+
+    def _send(self, batch: List[Tuple[bytes, tuple]], size: int, addr: tuple) -> None:
+        if len(batch) > 1 and self.enabled and not self.transport.get_write_buffer_size():
+            try:
+                self.sock.sendmsg(
+                    [b"".join(data for data, _ in batch)],
+                    [(socket.IPPROTO_UDP, UDP_SEGMENT, struct.pack("=H", size))],
+                    0,
+                    addr,
+                )
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError as e:
+                # EIO: e.g. no checksum offload on the egress device. Other
+                # errors are left to the transport, which reports them to
+                # the protocol.
+                if e.errno in (errno.EIO, errno.EINVAL, errno.EMSGSIZE, errno.ENOPROTOOPT):
+                    logger.info("UDP GSO disabled: %s" % e)
+                    self.enabled = False
+            else:
+                self.batches += 1
+                self.datagrams += len(batch)
+                return
+        for data, _ in batch:
+            self.transport.sendto(data, addr)
+
+
+@asynccontextmanager
+async def connect(
+    host: str,
+    port: int,
+    *,
+    configuration: Optional[QuicConfiguration] = None,
+    create_protocol: Callable = QuicConnectionProtocol,
+    session_ticket_handler: Optional[SessionTicketHandler] = None,
+    stream_handler: Optional[QuicStreamHandler] = None,
+    local_ports: Optional[LocalPortPool] = None,
+    gso: bool = False,
+    wait_connected: bool = True,
+) -> AsyncGenerator[QuicConnectionProtocol, None]:
+    """
+    Same as `aioquic.asyncio.client.connect`, except that the local port is
+    ephemeral or taken from `local_ports` and given back when the
+    connection is closed, so concurrent connections never share a port.
+
+    With `gso`, protocols providing `use_batched_send` (such as HttpClient)
+    coalesce outgoing packets with UDP GSO where the kernel supports it.
+    """
+    loop = asyncio.get_running_loop()
+
+    infos = await loop.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    addr = infos[0][4]
+    if len(addr) == 2:
+        addr = ("::ffff:" + addr[0], addr[1], 0, 0)
+
+    if configuration is None:
+        configuration = QuicConfiguration(is_client=True)
+    if configuration.server_name is None:
+        configuration.server_name = host
+    connection = QuicConnection(
+        configuration=configuration, session_ticket_handler=session_ticket_handler
+    )
+
+    sock, local_port = create_socket(addr, local_ports)
+    try:
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: create_protocol(connection, stream_handler=stream_handler),
+            sock=sock,
+        )
+    except BaseException:
+        sock.close()
+        if local_ports is not None:
+            local_ports.release(local_port)
+        raise
+    logger.info("QUIC connection to %s:%d from local port %d" % (host, port, local_port))
+    protocol = cast(QuicConnectionProtocol, protocol)
+    if gso and hasattr(protocol, "use_batched_send") and gso_supported(sock):
+        protocol.use_batched_send(sock)
+    try:
+        protocol.connect(addr)
+        if wait_connected:
+            await protocol.wait_connected()
+        yield protocol
+    finally:
+        # if wait_connected() was cancelled (connect timeout), aioquic still
+        # fails its shielded waiter when the connection terminates; retrieve
+        # that exception so it is not reported as never retrieved
+        waiter = getattr(protocol, "_connected_waiter", None)
+        if waiter is not None:
+            waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+        protocol.close()
+        await protocol.wait_closed()
+        transport.close()
+        if local_ports is not None:
+            local_ports.release(local_port)
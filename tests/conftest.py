@@ -0,0 +1,68 @@
+import sys
+import threading
+import types
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+try:
+    import config  # noqa: F401  由宿主应用提供
+except ImportError:
+    config = types.ModuleType("config")
+
+    class setting:
+        NACOS_SSL = False
+        NACOS_HOST = "127.0.0.1"
+        NACOS_PORT = 8848
+        TRACING_ENABLED = False
+
+    config.setting = setting
+    sys.modules["config"] = config
+
+
+class LocalServer:
+    """本地HTTP/1.1服务，按path返回预设响应并记录收到的请求"""
+
+    def __init__(self) -> None:
+        self.responses = {}
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self) -> None:
+                length = int(self.headers.get("content-length") or 0)
+                body = self.rfile.read(length) if length else b""
+                server.requests.append((self.command, self.path, dict(self.headers), body))
+                status, headers, content = server.responses.get(urlsplit(self.path).path, (404, {}, b"not found"))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("content-length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.httpd.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def route(self, path: str, status: int = 200, body: bytes = b"", headers: dict = None) -> None:
+        self.responses[path] = (status, headers or {}, body)
+
+
+@pytest.fixture
+def http_server():
+    server = LocalServer()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
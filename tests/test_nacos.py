@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from config_helper.nacos import NacosClient
+from config_helper.transport import MemoryTransport, TransportResponse
+
+CONFIG_URL = NacosClient.CONFIG_BASE_URL
+INSTANCE_URL = NacosClient.INSTANCE_BASE_URL
+
+
+@pytest.fixture
+def configs():
+    """dataId -> (响应头, 内容)，可在用例中修改以模拟配置变更"""
+    return {}
+
+
+@pytest.fixture
+def client(configs):
+    transport = MemoryTransport()
+
+    def get_config(method, url, params, *args):
+        if params["dataId"] not in configs:
+            return 404, "config data not exist"
+        headers, content = configs[params["dataId"]]
+        return TransportResponse(200, headers, content, 0, "memory")
+
+    transport.route("GET", CONFIG_URL, get_config)
+    return NacosClient(transport=transport)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_typed_config_redecodes_after_content_change(client, configs):
+    configs["app.json"] = ({}, b'{"a": 1}')
+
+    async def main():
+        first = await client.get_typed_config("app.json", "G")
+        same = await client.get_typed_config("app.json", "G")
+        configs["app.json"] = ({}, b'{"a": 2}')
+        changed = await client.get_typed_config("app.json", "G")
+        return first, same, changed
+
+    first, same, changed = run(main())
+    assert first is same
+    assert dict(first.value) == {"a": 1}
+    assert dict(changed.value) == {"a": 2} and changed.md5 != first.md5
+
+
+def test_typed_config_keys_cache_by_type_and_schema(client, configs):
+    pytest.importorskip("yaml")
+    configs["app"] = ({"config-type": "yaml"}, b"a: 1\n")
+    seen = []
+
+    def schema(value):
+        seen.append(value)
+
+    async def main():
+        plain = await client.get_typed_config("app", "G")
+        validated = await client.get_typed_config("app", "G", schema=schema)
+        again = await client.get_typed_config("app", "G", schema=schema)
+        text = await client.get_typed_config("app", "G", type="text")
+        return plain, validated, again, text
+
+    plain, validated, again, text = run(main())
+    assert plain.type == "yaml" and dict(plain.value) == {"a": 1}
+    # 不同schema分别校验，同一schema同一版本只校验一次
+    assert validated is not plain and validated is again and len(seen) == 1
+    assert text.value == "a: 1\n"
+
+
+def test_typed_config_invalidate(client, configs):
+    configs["app.properties"] = ({}, b"a=1\n")
+
+    async def main():
+        first = await client.get_typed_config("app.properties", "G")
+        client.invalidate_typed_config("app.properties", "G")
+        second = await client.get_typed_config("app.properties", "G")
+        return first, second
+
+    first, second = run(main())
+    assert dict(second.value) == {"a": "1"} and second is not first
+
+
+def test_typed_config_missing_returns_none(client):
+    assert run(client.get_typed_config("missing.json", "G")) is None
+
+
+def test_get_config_falls_back_to_cache_only_for_server_errors(client, configs):
+    configs["app.json"] = ({}, b'{"a": 1}')
+
+    async def main():
+        ok = await client.get_config("app.json", "G")
+        client.transport.route("GET", CONFIG_URL, lambda *args: (500, "busy"))
+        fallback = await client.get_config("app.json", "G")
+        client.transport.route("GET", CONFIG_URL, lambda *args: (403, "forbidden"))
+        denied = await client.get_config("app.json", "G")
+        return ok, fallback, denied
+
+    ok, fallback, denied = run(main())
+    assert ok[0] == {"a": 1} and fallback == ({"a": 1}, -1)
+    assert denied[0] == "forbidden"
+    assert client.cached_config("app.json", "G") == {"a": 1}
+
+
+def test_batch_register_instance_reports_failures_and_limits_concurrency(client):
+    active = []
+    peak = []
+
+    async def register(method, url, params, data, *args):
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.pop()
+        return 200, "ok" if data["port"] != 8002 else "error"
+
+    client.transport.route("POST", INSTANCE_URL, register)
+    instances = [{"ip": "10.0.0.1", "port": 8000 + i, "serviceName": "svc"} for i in range(6)]
+    result = run(client.batch_register_instance(instances, concurrency=2))
+    assert len(result.succeeded) == 5 and not result.ok
+    assert [item["port"] for item, _ in result.failed] == [8002]
+    assert max(peak) == 2
+
+
+def test_batch_cancellation_instance_records_exceptions(client):
+    def cancel(method, url, params, *args):
+        if params["port"] == 8001:
+            raise ConnectionError("reset")
+        return 200, "ok"
+
+    client.transport.route("DELETE", INSTANCE_URL, cancel)
+    instances = [{"serviceName": "svc", "ip": "10.0.0.1", "port": port} for port in (8000, 8001)]
+    result = run(client.batch_cancellation_instance(instances))
+    # call_api把传输层异常转换为失败结果
+    assert [item["port"] for item, _ in result.succeeded] == [8000]
+    assert [item["port"] for item, _ in result.failed] == [8001]
@@ -0,0 +1,171 @@
+import asyncio
+import time
+
+import pytest
+
+from config_helper.nacos import NacosClient
+from config_helper.transport import (
+    AutoTransport,
+    HttpxTransport,
+    MemoryTransport,
+    Transport,
+    TransportConnectError,
+    TransportResponse,
+    create_transport,
+)
+
+
+def test_httpx_transport_request(http_server):
+    http_server.route("/ping", body=b'{"ok": true}', headers={"content-type": "application/json"})
+
+    async def main():
+        transport = HttpxTransport(http_server.url)
+        try:
+            return await transport.request("GET", "/ping", params={"a": "1"}, timeout=5)
+        finally:
+            await transport.close()
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert response.http_version == "HTTP/1.1"
+    # httpcore的trace回调记录了各阶段时间
+    assert response.timing.stream_open and response.timing.first_header and response.timing.end
+    assert http_server.requests[0][:2] == ("GET", "/ping?a=1")
+
+
+def test_nacos_client_over_httpx(http_server):
+    http_server.route("/nacos/v1/cs/configs", body=b'{"a": 1}')
+
+    async def main():
+        client = NacosClient(transport=HttpxTransport(http_server.url))
+        try:
+            return await client.get_config("a", "G")
+        finally:
+            await client.close()
+
+    assert asyncio.run(main())[0] == {"a": 1}
+
+
+def test_httpx_transport_ignores_quic_profile(http_server):
+    http_server.route("/ping", body=b"pong")
+
+    async def main():
+        transport = HttpxTransport(http_server.url)
+        try:
+            return await transport.request("GET", "/ping", profile="low_latency", timeout=5)
+        finally:
+            await transport.close()
+
+    assert asyncio.run(main()).content == b"pong"
+
+
+class FailingTransport(Transport):
+    """代替Http3Transport，每次请求抛出指定异常"""
+
+    name = "failing"
+
+    def __init__(self, exc: Exception) -> None:
+        super().__init__()
+        self.exc = exc
+        self.authority = "127.0.0.1:9443"
+        self.calls = 0
+        self.closed = False
+
+    async def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise self.exc
+
+    async def close(self):
+        self.closed = True
+
+
+def alt_svc_transport(ma: int = 60):
+    """AutoTransport，其httpx部分替换为返回h3 Alt-Svc的MemoryTransport"""
+    memory = MemoryTransport()
+    for method in ("GET", "POST"):
+        memory.route(method, "/p", lambda *args: TransportResponse(
+            200, {"alt-svc": f'h3=":9443"; ma={ma}'}, b"http", 0, "HTTP/1.1"
+        ))
+    transport = AutoTransport("http://127.0.0.1:8848")
+    transport.http = memory
+    return transport, memory
+
+
+def test_create_transport_by_name():
+    assert isinstance(create_transport("httpx"), HttpxTransport)
+    assert isinstance(create_transport("auto"), AutoTransport)
+    assert isinstance(create_transport("memory"), MemoryTransport)
+    assert create_transport(ssl=False).name == "httpx"
+    with pytest.raises(ValueError):
+        create_transport("ftp")
+
+
+def test_auto_transport_negotiates_http3_from_alt_svc():
+    async def main():
+        transport, memory = alt_svc_transport()
+        response = await transport.request("GET", "/p")
+        h3 = transport.h3
+        await transport.close()
+        return response, h3
+
+    response, h3 = asyncio.run(main())
+    assert response.content == b"http"
+    assert h3 is not None and h3.authority == "127.0.0.1:9443"
+
+
+def test_auto_transport_backs_off_after_http3_failure():
+    async def main():
+        transport, memory = alt_svc_transport()
+        failing = FailingTransport(TransportConnectError("unreachable"))
+        transport.h3, transport._h3_expires = failing, time.monotonic() + 60
+        responses = [await transport.request("GET", "/p") for _ in range(4)]
+        return transport, failing, memory, responses
+
+    transport, failing, memory, responses = asyncio.run(main())
+    assert [r.content for r in responses] == [b"http"] * 4
+    # 失败后在通告过期前不再协商HTTP/3
+    assert failing.calls == 1 and failing.closed
+    assert transport.h3 is None
+    assert len(memory.requests) == 4
+
+
+def test_auto_transport_renegotiates_after_alt_svc_expiry():
+    async def main():
+        transport, memory = alt_svc_transport()
+        expired = FailingTransport(TransportConnectError("unused"))
+        transport.h3, transport._h3_expires = expired, time.monotonic() - 1
+        await transport.request("GET", "/p")
+        h3 = transport.h3
+        await transport.close()
+        return expired, h3
+
+    expired, h3 = asyncio.run(main())
+    assert expired.closed and expired.calls == 0
+    assert h3 is not None and h3 is not expired
+
+
+@pytest.mark.parametrize("method, exc, content, fallback", [
+    ("POST", TransportConnectError("unreachable"), b"x", True),
+    ("POST", asyncio.TimeoutError(), b"x", False),
+    ("GET", asyncio.TimeoutError(), None, True),
+    ("PUT", ConnectionError("reset"), "stream", False),
+])
+def test_auto_transport_only_replays_safe_requests(method, exc, content, fallback):
+    async def stream():
+        yield b"dataId=a&content="
+        yield b"..."
+
+    async def main():
+        transport, memory = alt_svc_transport()
+        memory.route("PUT", "/p", lambda *args: (200, "ok"))
+        transport.h3, transport._h3_expires = FailingTransport(exc), time.monotonic() + 60
+        body = stream() if content == "stream" else content
+        return await transport.request(method, "/p", content=body), memory
+
+    if fallback:
+        response, memory = asyncio.run(main())
+        assert response.status_code == 200 and memory.requests[-1]["method"] == method
+    else:
+        with pytest.raises(type(exc)):
+            asyncio.run(main())
@@ -1,4 +1,21 @@
+import ipaddress
+import logging
+import os
 import socket
+import struct
+
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非Linux/Unix平台
+    fcntl = None
+
+# 与sanic.log.logger为同一logger，直接获取以免导入sanic
+logger = logging.getLogger('sanic.root')
+
+SIOCGIFADDR = 0x8915
+IF_INET6_FILE = '/proc/net/if_inet6'
 
 
 def get_local_ip():
@@ -11,3 +28,111 @@ def get_local_ip():
     finally:
         st.close()
     return ip
+
+
+def _route_ip(family: int, probe: str) -> Optional[str]:
+    st = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        st.connect((probe, 1))
+        return st.getsockname()[0]
+    except Exception:
+        return None
+    finally:
+        st.close()
+
+
+def _interface_ips(interface: str, ipv6: bool) -> List[str]:
+    if ipv6:
+        ips = []
+        try:
+            with open(IF_INET6_FILE) as fp:
+                for line in fp:
+                    fields = line.split()
+                    if len(fields) == 6 and fields[5] == interface:
+                        ips.append(str(ipaddress.IPv6Address(bytes.fromhex(fields[0]))))
+        except OSError:
+            pass
+        return ips
+    if fcntl is None:
+        return []
+    st = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        packed = fcntl.ioctl(st.fileno(), SIOCGIFADDR, struct.pack('256s', interface[:15].encode()))
+        return [socket.inet_ntoa(packed[20:24])]
+    except OSError:
+        return []
+    finally:
+        st.close()
+
+
+class HostIdentity:
+    """本机注册地址，解析一次后缓存，refresh()时重新解析
+
+    解析顺序：显式指定ip > 环境变量（容器场景，如POD_IP）> 指定网卡 > 路由探测及主机名解析，
+    指定cidr时只在候选地址中选择属于该网段的地址。
+    """
+
+    def __init__(
+        self,
+        ip: Optional[str] = None,
+        interface: Optional[str] = None,
+        cidr: Optional[str] = None,
+        ipv6: bool = False,
+        env_vars: Iterable[str] = ('NACOS_IP', 'POD_IP', 'HOST_IP'),
+    ) -> None:
+        self.explicit_ip = ip
+        self.interface = interface
+        self.network = ipaddress.ip_network(cidr, strict=False) if cidr else None
+        self.ipv6 = ipv6 or bool(self.network and self.network.version == 6)
+        self.env_vars = tuple(env_vars)
+        self._ip: Optional[str] = None
+
+    @property
+    def ip(self) -> str:
+        if self._ip is None:
+            self._ip = self._resolve()
+        return self._ip
+
+    def refresh(self) -> str:
+        """丢弃缓存并重新解析"""
+        self._ip = None
+        return self.ip
+
+    def candidates(self) -> Iterator[str]:
+        """按优先级逐个给出候选地址，前面的地址可用时不再进行后面的路由探测及主机名解析"""
+        seen = set()
+        for ip in self._candidates():
+            if ip and ip not in seen:
+                seen.add(ip)
+                yield ip
+
+    def _candidates(self) -> Iterator[Optional[str]]:
+        yield self.explicit_ip
+        yield from (os.environ.get(name) for name in self.env_vars)
+        if self.interface:
+            yield from _interface_ips(self.interface, self.ipv6)
+        if self.ipv6:
+            yield _route_ip(socket.AF_INET6, 'fd00::1')
+        yield _route_ip(socket.AF_INET, '10.255.255.255')
+        family = socket.AF_INET6 if self.ipv6 else socket.AF_INET
+        try:
+            # 阻塞的DNS解析，放在最后
+            infos = socket.getaddrinfo(socket.gethostname(), None, family, socket.SOCK_DGRAM)
+        except OSError:
+            return
+        yield from (info[4][0] for info in infos)
+
+    def _resolve(self) -> str:
+        fallback = None
+        for ip in self.candidates():
+            try:
+                address = ipaddress.ip_address(ip.split('%')[0])
+            except ValueError:
+                continue
+            if self.network is not None and address not in self.network:
+                continue
+            if address.is_loopback:
+                fallback = fallback or ip
+                continue
+            return ip
+        return fallback or ('::1' if self.ipv6 else '127.0.0.1')